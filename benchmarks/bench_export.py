@@ -0,0 +1,286 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Export benchmarks on synthetic armatures and actions.
+#Needs blender with blender_niftools_plugin and armaToHKX installed, run from the repository root:
+#   blender --background --python benchmarks/bench_export.py -- [--quick] [--report bench_report.json]
+#                                                                [--baseline benchmarks/baseline.json] [--update-baseline]
+#Every stage of the skeleton and animation export is timed on its own (best of --repeat runs) and written
+#to a json report. The regression check is opt-in, no baseline is committed since timings depend on the machine:
+#--update-baseline stores the run as the baseline (benchmarks/baseline.json unless --baseline is given), and a
+#later run with --baseline fails when stages got slower than the baseline by more than --tolerance.
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+
+import bpy
+import mathutils
+import numpy as np
+
+from io_scene_niftools.utils import math
+from io_scene_armaToHKX.core.armaToHKXcore import build_bone_hierarchy, get_skeleton_data, write_skeleton_xml, BindSpaceTransform
+from io_scene_armaToHKX.core.armaToHKXsampling import sample_bone_keys
+from io_scene_armaToHKX.core.armaToHKXdump import AnimationDumpWriter
+
+BONE_COUNTS = (10, 100, 1000, 5000)
+FRAME_COUNTS = (100, 1000, 5000, 20000)
+#bones animated in the frame count sweep, frames in the bone count sweep
+SWEEP_BONES = 50
+SWEEP_FRAMES = 100
+QUICK_BONE_COUNTS = (10, 100)
+QUICK_FRAME_COUNTS = (100, 1000)
+#bones per parent in the synthetic hierarchy
+BRANCHING = 3
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+#slower than baseline by this fraction and by at least MIN_REGRESSION seconds is a regression
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION = 0.005
+
+
+def clear_scene():
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+    for action in list(bpy.data.actions):
+        bpy.data.actions.remove(action)
+    for armature_data in list(bpy.data.armatures):
+        bpy.data.armatures.remove(armature_data)
+
+
+def make_armature(n_bones):
+    #Tree of n_bones bones, BRANCHING children per bone, every bone offset and rolled a little
+    clear_scene()
+    arm_data = bpy.data.armatures.new("bench_armature")
+    arm_obj = bpy.data.objects.new("bench_armature", arm_data)
+    bpy.context.scene.collection.objects.link(arm_obj)
+    bpy.context.view_layer.objects.active = arm_obj
+    arm_obj.select_set(True)
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = arm_data.edit_bones
+    for i in range(n_bones):
+        edit_bone = edit_bones.new("Bone{i:05d}".format(i=i))
+        if i == 0:
+            edit_bone.head = (0.0, 0.0, 0.0)
+        else:
+            parent = edit_bones[(i - 1) // BRANCHING]
+            edit_bone.parent = parent
+            edit_bone.head = parent.tail
+        edit_bone.tail = edit_bone.head + mathutils.Vector((0.1 * ((i % 3) - 1), 0.05, 0.2))
+        edit_bone.roll = 0.01 * i
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return arm_obj
+
+
+def make_action(arm_obj, n_frames, n_bones=None):
+    #Action with a key on every frame for rotation, location and scale of the first n_bones bones
+    action = bpy.data.actions.new("bench_action")
+    frames = np.arange(n_frames, dtype=np.float32)
+    t = frames / max(1, n_frames - 1) * 2.0 * np.pi
+    bones = arm_obj.pose.bones[:n_bones] if n_bones else arm_obj.pose.bones
+    for bone_idx, pose_bone in enumerate(bones):
+        pose_bone.rotation_mode = "QUATERNION"
+        angle = 0.5 * np.sin(t + bone_idx)
+        channels = {
+            "rotation_quaternion": (np.cos(angle), np.sin(angle), np.zeros(n_frames), np.zeros(n_frames)),
+            "location": (0.1 * np.sin(t), 0.1 * np.cos(t), np.zeros(n_frames)),
+            "scale": (np.ones(n_frames),) * 3,
+        }
+        for prop, values in channels.items():
+            data_path = 'pose.bones["{name}"].{prop}'.format(name=pose_bone.name, prop=prop)
+            for index, channel in enumerate(values):
+                fcu = action.fcurves.new(data_path, index=index, action_group=pose_bone.name)
+                fcu.keyframe_points.add(n_frames)
+                fcu.keyframe_points.foreach_set("co", np.column_stack((frames, channel)).astype(np.float32).ravel())
+    action.frame_range = (0, n_frames - 1)
+    if arm_obj.animation_data is None:
+        arm_obj.animation_data_create()
+    arm_obj.animation_data.action = action
+    return action
+
+
+def best_of(repeat, func):
+    #Best wall time over repeat runs and the result of the last run
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_skeleton(n_bones, repeat, tmp_dir):
+    arm_obj = make_armature(n_bones)
+    math.set_bone_orientation(arm_obj.data.niftools.axis_forward, arm_obj.data.niftools.axis_up)
+    stages = {}
+
+    stages["hierarchy"], hierarchy = best_of(repeat, lambda: build_bone_hierarchy(arm_obj.data.bones, True))
+    stages["bind_matrices"], _ = best_of(repeat, lambda: [math.get_object_bind(bone) for bone, _ in hierarchy])
+    #the exporter's own collection, hierarchy and bind matrices included
+    stages["skeleton_data"], (bone_parent_index, pose) = best_of(repeat, lambda: get_skeleton_data(True, arm_obj))
+
+    def emit():
+        f = io.StringIO()
+        write_skeleton_xml(f, "bench_skeleton.hkx", bone_parent_index, pose)
+        return f.getvalue()
+    stages["xml_emission"], xml_text = best_of(repeat, emit)
+    stages["xml_io"], _ = best_of(repeat, lambda: write_text(os.path.join(tmp_dir, "bench_skeleton.xml"), xml_text))
+    return {"case": "skeleton", "bones": n_bones, "frames": 0, "stages": stages, "output_bytes": len(xml_text)}
+
+
+def bench_animation(n_bones, n_frames, repeat, tmp_dir):
+    arm_obj = make_armature(n_bones)
+    action = make_action(arm_obj, n_frames)
+    math.set_bone_orientation(arm_obj.data.niftools.axis_forward, arm_obj.data.niftools.axis_up)
+    bones = [bone for bone, _ in build_bone_hierarchy(arm_obj.data.bones, True)]
+    fps = bpy.context.scene.render.fps
+    stages = {}
+
+    def bind_data():
+        return [math.decompose_srt(math.get_object_bind(bone)) for bone in bones]
+    stages["bind_matrices"], binds = best_of(repeat, bind_data)
+
+    stages["key_sampling"], bone_keys = best_of(repeat, lambda: [sample_bone_keys(bone.name, action.groups[bone.name].channels) for bone in bones])
+
+    def transform_math():
+        transformed = []
+        for bone, (bind_scale, bind_rot, bind_trans), keys in zip(bones, binds, bone_keys):
+            transform = BindSpaceTransform(bone, bind_rot, bind_trans)
+            transformed.append((keys.quaternion_frames / fps, transform.translations(keys.location), transform.quaternions(keys.quaternion), keys.scale[:, 0]))
+        return transformed
+    stages["transform_math"], transformed = best_of(repeat, transform_math)
+
+    def emit():
+        with AnimationDumpWriter.in_memory() as dump:
+            dump.write_header((n_frames - 1) / fps)
+            for bone, (times, translations, quaternions, scales) in zip(bones, transformed):
+                dump.write_bone(bone.name, times, translations, quaternions, scales)
+            return dump.getvalue()
+    stages["dump_emission"], dump_text = best_of(repeat, emit)
+    stages["dump_io"], _ = best_of(repeat, lambda: write_text(os.path.join(tmp_dir, "bench_dump.txt"), dump_text))
+    return {"case": "animation", "bones": n_bones, "frames": n_frames, "stages": stages, "output_bytes": len(dump_text)}
+
+
+def write_text(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def case_key(result):
+    return "{case} bones={bones} frames={frames}".format(**result)
+
+
+def compare(results, baseline, tolerance):
+    #Stages slower than the baseline, as (case, stage, baseline seconds, seconds)
+    baseline_cases = {case_key(result): result["stages"] for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base_stages = baseline_cases.get(case_key(result))
+        if base_stages is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            base = base_stages.get(stage)
+            if base is not None and seconds > base * (1.0 + tolerance) and seconds - base > MIN_REGRESSION:
+                regressions.append((case_key(result), stage, base, seconds))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the armaToHKX export stages")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best is reported")
+    parser.add_argument("--report", default="bench_report.json", help="json report to write")
+    parser.add_argument("--baseline", default=None, help="json report to compare against, no regression check without it")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline, at --baseline or "+DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown against the baseline, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    bone_counts = QUICK_BONE_COUNTS if args.quick else BONE_COUNTS
+    frame_counts = QUICK_FRAME_COUNTS if args.quick else FRAME_COUNTS
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_bones in bone_counts:
+            results.append(bench_skeleton(n_bones, args.repeat, tmp_dir))
+            results.append(bench_animation(n_bones, SWEEP_FRAMES, args.repeat, tmp_dir))
+        for n_frames in frame_counts:
+            if n_frames != SWEEP_FRAMES:
+                results.append(bench_animation(SWEEP_BONES, n_frames, args.repeat, tmp_dir))
+        clear_scene()
+
+    for result in results:
+        print("{key:40s} ".format(key=case_key(result)) + "  ".join("{stage} {t:.4f}s".format(stage=stage, t=t) for stage, t in result["stages"].items()))
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Report written to "+args.report)
+
+    if args.update_baseline:
+        baseline = args.baseline or DEFAULT_BASELINE
+        with open(baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Baseline updated: "+baseline)
+        return 0
+    if args.baseline is None:
+        print("No regression check, pass --baseline to compare against a stored run.")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("ERROR no baseline at "+args.baseline+", run with --update-baseline to create one.")
+        return 1
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for key, stage, base, seconds in regressions:
+        print("REGRESSION {key}: {stage} {base:.4f}s -> {t:.4f}s ({ratio:.2f}x)".format(key=key, stage=stage, base=base, t=seconds, ratio=seconds/base))
+    print("{n} regressions against {baseline}".format(n=len(regressions), baseline=args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
@@ -53,7 +53,8 @@ from bpy.props import (StringProperty,
                        PointerProperty,
                        BoolProperty,
                        EnumProperty,
-                       FloatProperty
+                       FloatProperty,
+                       IntProperty
                        )
 from bpy.types import (Panel,
                        Operator,
@@ -61,17 +62,23 @@ from bpy.types import (Panel,
                        PropertyGroup,
                        )
 from bpy_extras.io_utils import ExportHelper, ImportHelper
-from io_scene_armaToHKX.core.armaToHKXcore import TransformAnimation, export_animation, export_skeleton, export_character, export_project
+from io_scene_armaToHKX.core.armaToHKXcore import TransformAnimation, export_animation, export_skeleton, export_character, export_project, export_character_hkx, export_project_hkx, import_skeleton_hkx, get_skeleton_data, write_skeleton_hkx, sample_animation_tracks, marker_annotations, write_animation_hkx, stream_animation_clip, write_streamed_animation_hkx, DEFAULT_STREAM_WINDOW
 from io_scene_armaToHKX.core.armaToHKXUtils import sample_constraints, reintroduce_constraints, get_armature, get_anim_markers, set_anim_markers
+from io_scene_armaToHKX.core.armaToHKXconverter import DEFAULT_TIMEOUT, DEFAULT_MAX_WORKERS, ConversionJob, ConversionResult, BackgroundExport, run_job, run_chain, hkxcmd_convert_cmd, convertkf_cmd, report_results
+from io_scene_armaToHKX.core.armaToHKXcache import ExportCache, DEFAULT_CACHE_SIZE
+from io_scene_armaToHKX.core.armaToHKXbatch import collect_clips, export_clips
+from io_scene_armaToHKX.core.armaToHKXprofile import ExportProfile, load_history, trend_report
+from io_scene_armaToHKX.core.armaToHKXbake import bake_action, sample_action
+from io_scene_armaToHKX.core.armaToHKXreduce import KeyReduction, reduce_action, DEFAULT_TRANSLATION_TOLERANCE, DEFAULT_ROTATION_TOLERANCE
+from io_scene_armaToHKX.core.armaToHKXspline import SplineSettings, MAX_FRAMES_PER_BLOCK
+from io_scene_armaToHKX.core.armaToHKXqueue import ExportQueue
+from io_scene_armaToHKX.core.armaToHKXclip import CLIP_EXTENSION
+from io_scene_armaToHKX.core.armaToHKXmulti import collect_armatures, export_armatures
+from io_scene_armaToHKX.core.armaToHKXreader import PackfileReader, read_skeletons, verify_skeleton, verify_animation, report_verification
 from io_scene_niftools.utils.singleton import NifOp
 import os
-import subprocess
-import time
 import shutil
-
-#Global var sampled constraints, lasting for duration of session
-#To be used to restore constrain influences post exporting.
-sampled_constraints={}
+import time
 
 class armaToHKXProperties(bpy.types.PropertyGroup):
     path : StringProperty(
@@ -102,11 +109,309 @@ class armaToHKXProperties(bpy.types.PropertyGroup):
         maxlen=1024,
         subtype='DIR_PATH')
 
+    converter_timeout : FloatProperty(
+        name="Converter timeout",
+        description="Seconds a single hkxcmd/convertKF run may take before it is killed",
+        default=DEFAULT_TIMEOUT,
+        min=1.0,
+        soft_max=600.0)
+
+    max_workers : IntProperty(
+        name="Parallel conversions",
+        description="Number of hkxcmd/convertKF processes allowed to run at the same time",
+        default=DEFAULT_MAX_WORKERS,
+        min=1,
+        soft_max=16)
+
+    background_export : BoolProperty(
+        name="Export in background",
+        description="Run the converters and hkx file writes on worker threads while blender stays usable, ESC cancels the export",
+        default=True)
+
+    native_writer : BoolProperty(
+        name="Write hkx directly",
+        description="Write skeleton, character, project and animation .hkx files without hkxcmd, convertKF and the niftools kf export",
+        default=False)
+
+    stream_animation : BoolProperty(
+        name="Stream long animations",
+        description="Sample the animation a window of frames at a time into a clip file in the workdir, memory use then does not grow with the length of the animation",
+        default=False)
+
+    stream_window : IntProperty(
+        name="Frames per window",
+        description="Frames sampled and transformed at a time when streaming",
+        default=DEFAULT_STREAM_WINDOW,
+        min=1,
+        soft_max=4096)
+
+    compress_animation : BoolProperty(
+        name="Spline compress animations",
+        description="Write animations as hkaSplineCompressedAnimation instead of uncompressed, much smaller files at a bounded error",
+        default=True)
+
+    spline_block_size : IntProperty(
+        name="Frames per block",
+        description="Frames per spline block, larger blocks compress better but decompress slower in game",
+        default=MAX_FRAMES_PER_BLOCK,
+        min=2,
+        max=MAX_FRAMES_PER_BLOCK)
+
+    spline_degree : IntProperty(
+        name="Spline degree",
+        description="Degree of the B-splines fitted to every track",
+        default=3,
+        min=1,
+        max=3)
+
+    spline_translation_tolerance : FloatProperty(
+        name="Translation tolerance",
+        description="Largest allowed location error of the decoded animation, in havok units",
+        default=0.01,
+        min=0.00001,
+        precision=5)
+
+    spline_rotation_tolerance : FloatProperty(
+        name="Rotation tolerance",
+        description="Largest allowed rotation error of the decoded animation",
+        default=0.001,
+        min=0.00001,
+        precision=4,
+        subtype='ANGLE')
+
+    spline_scale_tolerance : FloatProperty(
+        name="Scale tolerance",
+        description="Largest allowed scale error of the decoded animation",
+        default=0.001,
+        min=0.00001,
+        precision=5)
+
+    spline_position_bits : EnumProperty(
+        name="Position bits",
+        description="Quantization of translation and scale control points",
+        items=(("16", "16 bit", "Control points quantized to 16 bits"),
+               ("8", "8 bit", "Control points quantized to 8 bits, smaller but coarser")),
+        default="16")
+
+    spline_rotation_quantization : EnumProperty(
+        name="Rotation quantization",
+        description="Storage of the rotation control points",
+        items=(("THREECOMP48", "48 bit", "Smallest three components, 6 bytes per rotation"),
+               ("UNCOMPRESSED", "128 bit", "Full float quaternions, 16 bytes per rotation")),
+        default="THREECOMP48")
+
+    verify_outputs : BoolProperty(
+        name="Verify written hkx",
+        description="Read every written skeleton and animation .hkx back and warn about anything that differs from what was exported",
+        default=True)
+
+    use_cache : BoolProperty(
+        name="Cache conversions",
+        description="Reuse converted .hkx files from the workdir cache when the exported xml, target and hkxcmd are unchanged",
+        default=True)
+
+    cache_size : IntProperty(
+        name="Cache size (MB)",
+        description="Size limit of the conversion cache, least recently used files are removed first",
+        default=DEFAULT_CACHE_SIZE,
+        min=1)
+
+    profile_exports : BoolProperty(
+        name="Record export history",
+        description="Append the stage timings of every export to armaToHKX_history.jsonl in the workdir",
+        default=True)
+
+    trace_memory : BoolProperty(
+        name="Trace memory",
+        description="Also record the peak python memory of every stage with tracemalloc, slows the export down",
+        default=False)
+
     bakeprop : BoolProperty(
         name="BakeSelected",
         description="When baking, only bake selected bones",
         default=False)
 
+    reduce_keys : BoolProperty(
+        name="Reduce keys",
+        description="Remove baked keys that linear interpolation reproduces within the tolerances before the kf export",
+        default=False)
+
+    reduce_translation_tolerance : FloatProperty(
+        name="Translation tolerance",
+        description="Largest allowed location error of a removed key",
+        default=DEFAULT_TRANSLATION_TOLERANCE,
+        min=0.0000001,
+        precision=5)
+
+    reduce_rotation_tolerance : FloatProperty(
+        name="Rotation tolerance",
+        description="Largest allowed rotation error of a removed key",
+        default=DEFAULT_ROTATION_TOLERANCE,
+        min=0.0000001,
+        precision=4,
+        subtype='ANGLE')
+
+    auto_bake : BoolProperty(
+        name="Only bake constrained bones",
+        description="When baking, only bake bones with constraints, IK chains or drivers and copy the keys of all other bones as they are",
+        default=False)
+
+    non_destructive : BoolProperty(
+        name="Non-destructive export",
+        description="Exports bake the visual pose into a temporary action that is removed after the export. The rig, its active action and its constraint influences are left untouched",
+        default=True)
+
+
+def get_export_cache(props):
+    #ExportCache in the workdir, None if caching is off
+    if not props.use_cache or not os.path.isdir(props.workdir):
+        return None
+    return ExportCache(props.workdir, props.cache_size * 1024 * 1024)
+
+
+def cache_key(cache, src_path, skyrim_version, converter_path):
+    if cache is None:
+        return None
+    return ExportCache.conversion_key(src_path, skyrim_version, converter_path)
+
+
+def get_key_reduction(props):
+    #KeyReduction with the panel tolerances, None if key reduction is off
+    if not props.reduce_keys:
+        return None
+    return KeyReduction(props.reduce_translation_tolerance, props.reduce_rotation_tolerance)
+
+
+def get_spline_settings(props):
+    #SplineSettings with the panel values, None if animations are written uncompressed
+    if not props.compress_animation:
+        return None
+    bits = int(props.spline_position_bits)
+    return SplineSettings(props.spline_block_size, props.spline_degree,
+        props.spline_translation_tolerance, props.spline_rotation_tolerance, props.spline_scale_tolerance,
+        bits, bits, props.spline_rotation_quantization)
+
+
+def verify_skeleton_files(operator, filepaths, hkx_name, skeleton_data):
+    #Reads the written skeleton .hkx files back and warns about differences from the exported skeleton
+    bone_parent_index, reference_pose = skeleton_data
+    for filepath in filepaths:
+        report_verification(operator, filepath, verify_skeleton(filepath, hkx_name.replace(".hkx",""), bone_parent_index, reference_pose))
+
+
+def skeleton_bone_count(operator, skeleton_path):
+    #Number of bones of the skeleton .hkx the animation is made for, None if it can not be read
+    try:
+        with PackfileReader(skeleton_path) as reader:
+            return len(read_skeletons(reader)[0].bone_names)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        operator.report({"WARNING"}, "Could not read the bones of "+skeleton_path+": "+str(e))
+        return None
+
+
+def start_profile(context, operation):
+    #ExportProfile of one export, saved to the workdir history if that is turned on
+    props = context.scene.armaToHKX
+    history_dir = props.workdir if props.profile_exports and os.path.isdir(props.workdir) else None
+    return ExportProfile(operation, history_dir, props.trace_memory)
+
+
+#Seconds between two progress checks of a background export
+BACKGROUND_POLL_INTERVAL = 0.1
+
+
+class BackgroundExportOperator:
+    """
+    Mixin of the export operators. export(context, profile) does the blender side of the export on the
+    main thread, queues the converter runs and hkx writes on a BackgroundExport and returns
+    start_background(context, task). A modal timer then polls the workers with a progress bar while
+    blender stays usable, ESC cancels, and apply_results(context, results) finishes the export on the
+    main thread. Headless, or with background export turned off, the workers are waited on instead.
+    """
+
+    operation = None
+
+    def execute(self, context):
+        self.profile = start_profile(context, self.operation).begin()
+        try:
+            status = self.export(context, self.profile)
+        except Exception as e:
+            self.profile.end(type(e), e)
+            raise
+        if "RUNNING_MODAL" in status:
+            return status
+        return self.end_export(status)
+
+    def end_export(self, status, exc=None):
+        self.profile.finish(status)
+        self.profile.end(type(exc) if exc is not None else None, exc)
+        return status
+
+    def start_background(self, context, task):
+        self.task = task
+        if bpy.app.background or context.window is None or not context.scene.armaToHKX.background_export:
+            task.wait()
+            return self.finish_background(context)
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(BACKGROUND_POLL_INTERVAL, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS' and not self.task.cancelled:
+            print("Cancelling export")
+            self.report({"WARNING"}, "Cancelling export, stopping the converters")
+            self.task.cancel()
+            return {"RUNNING_MODAL"}
+        if event.type != 'TIMER' or not self.task.done:
+            if event.type == 'TIMER':
+                context.window_manager.progress_update(int(100 * self.task.progress))
+                context.workspace.status_text_set("armaToHKX: {steps} ({p:.0%}), ESC to cancel".format(steps=", ".join(self.task.running()) or "waiting", p=self.task.progress))
+            return {"PASS_THROUGH"}
+
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        try:
+            status = self.finish_background(context)
+        except Exception as e:
+            self.end_export({"CANCELLED"}, e)
+            raise
+        return self.end_export(status)
+
+    def finish_background(self, context):
+        #Main thread: collect the worker results, report them and let the operator apply them
+        self.task.shutdown()
+        results = self.task.results()
+        conversions = []
+        for result in results:
+            if isinstance(result.value, ConversionResult):
+                conversions.append(result.value)
+            elif isinstance(result.value, list):
+                conversions.extend(result.value)
+            elif result.error is None:
+                self.profile.add_stage(result.label, result.elapsed)
+        self.profile.add_results(conversions)
+        if self.task.cancelled:
+            self.report({"WARNING"}, "Export cancelled.")
+            return {"CANCELLED"}
+        failed = [result for result in results if result.error is not None]
+        for result in failed:
+            self.report({"ERROR"}, "{label} failed: {error}".format(label=result.label, error=result.error))
+        if conversions and not report_results(self, conversions):
+            return {"CANCELLED"}
+        if failed:
+            return {"CANCELLED"}
+        status = self.apply_results(context, results)
+        if "FINISHED" in status:
+            print("DONE")
+        return status
+
+    def apply_results(self, context, results):
+        return {"FINISHED"}
+
 
 class OBJECT_PT_armaToHKXPanel(Panel):
     bl_idname = "OBJECT_PT_armaToHKXPanel"
@@ -125,11 +430,42 @@ class OBJECT_PT_armaToHKXPanel(Panel):
         col.prop(scn.armaToHKX, "hkxcmd", text="")
         col.prop(scn.armaToHKX, "convertKF", text="")
         col.prop(scn.armaToHKX, "workdir", text="")
+        col.prop(scn.armaToHKX, "converter_timeout")
+        col.prop(scn.armaToHKX, "max_workers")
+        col.prop(scn.armaToHKX, "background_export")
+        col.prop(scn.armaToHKX, "native_writer")
+        if scn.armaToHKX.native_writer:
+            col.prop(scn.armaToHKX, "stream_animation")
+            if scn.armaToHKX.stream_animation:
+                col.prop(scn.armaToHKX, "stream_window")
+            col.prop(scn.armaToHKX, "compress_animation")
+            if scn.armaToHKX.compress_animation:
+                col.prop(scn.armaToHKX, "spline_block_size")
+                col.prop(scn.armaToHKX, "spline_degree")
+                col.prop(scn.armaToHKX, "spline_translation_tolerance")
+                col.prop(scn.armaToHKX, "spline_rotation_tolerance")
+                col.prop(scn.armaToHKX, "spline_scale_tolerance")
+                col.prop(scn.armaToHKX, "spline_position_bits")
+                col.prop(scn.armaToHKX, "spline_rotation_quantization")
+        col.prop(scn.armaToHKX, "verify_outputs")
+        col.prop(scn.armaToHKX, "use_cache")
+        if scn.armaToHKX.use_cache:
+            col.prop(scn.armaToHKX, "cache_size")
+        col.prop(scn.armaToHKX, "reduce_keys")
+        if scn.armaToHKX.reduce_keys:
+            col.prop(scn.armaToHKX, "reduce_translation_tolerance")
+            col.prop(scn.armaToHKX, "reduce_rotation_tolerance")
+        col.prop(scn.armaToHKX, "profile_exports")
+        if scn.armaToHKX.profile_exports:
+            col.prop(scn.armaToHKX, "trace_memory")
+            col.operator("armatohkx.export_history", text="show export history")
         layout.row()
         layout.row()
         layout.row()
         layout.operator("armatohkx.sample_and_bake", icon="MESH_CUBE", text="sample and bake action")
         layout.prop(scn.armaToHKX, "bakeprop", text="only bake selected bones")
+        layout.prop(scn.armaToHKX, "auto_bake", text="only bake constrained/driven bones")
+        layout.prop(scn.armaToHKX, "non_destructive")
         layout.row()
         layout.row()
         layout.operator("armatohkx.constraintops", icon="MESH_CUBE", text="restore constraints post-export")
@@ -141,17 +477,16 @@ class ARMATOHKX_OT_sample_and_bake(Operator):
 
     def execute(self, context):
         scene = context.scene
-        global sampled_constraints
         arm_obj = get_armature(context)
         if arm_obj is None:
             return {"CANCELLED"}
         print("Sampling armature constraints before export")
-        sampled_constraints=sample_constraints(arm_obj)
+        sample_constraints(arm_obj)
         print("Baking action...")
         #Collect starting and ending frame first
         start=context.scene.frame_start
         end=context.scene.frame_end
-        bpy.ops.nla.bake(frame_start=start, frame_end=end, step=1, only_selected=scene.armaToHKX.bakeprop, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, clean_curves=False, bake_types={'POSE'})
+        bake_action(context, arm_obj, start, end, scene.armaToHKX.auto_bake, scene.armaToHKX.bakeprop)
         #Set influence of constraints to zero
         print("Setting bone constraint influences to zero (use 'restore constraints' in the armatoHKX panel to restore)")
         for pbone in arm_obj.pose.bones:
@@ -168,20 +503,32 @@ class ARMATOHKX_OT_constraintsOPs(Operator):
 
     def execute(self, context):
         scene = context.scene
-        global sampled_constraints
-        if not isinstance(sampled_constraints,dict):
-            self.report({"ERROR"},"sampled constraint dict has the wrong dtype")
-            return{"CANCELLED"}
-        else:
-            if len(sampled_constraints)<1:
-                self.report({"ERROR"},"No stored constraint influences to restore (have you exported anything yet?)")
-                return{"CANCELLED"}
         arma_obj = get_armature(context)
-        if arma_obj is not None:
-            reintroduce_constraints(arma_obj,sampled_constraints)
+        if arma_obj is None:
+            return {"CANCELLED"}
+        if reintroduce_constraints(arma_obj) is None:
+            self.report({"ERROR"},"No stored constraint influences to restore on "+arma_obj.name+" (have you exported anything yet?)")
+            return{"CANCELLED"}
         return {"FINISHED"}
 
-class ExportProjectToHKX(Operator, ExportHelper):
+
+class ARMATOHKX_OT_exportHistory(Operator):
+    """Print stage timings of the latest exports compared to the runs before them"""
+    bl_idname = "armatohkx.export_history"
+    bl_label = "export history"
+
+    def execute(self, context):
+        runs = load_history(context.scene.armaToHKX.workdir)
+        if not runs:
+            self.report({"ERROR"},"No export history in the workdir yet.")
+            return {"CANCELLED"}
+        lines = trend_report(runs)
+        print("\n".join(lines))
+        for line in lines:
+            self.report({"INFO"}, line)
+        return {"FINISHED"}
+
+class ExportProjectToHKX(BackgroundExportOperator, Operator, ExportHelper):
     """Export project hkx file, as well as folder structure and character.hkx"""
     bl_idname = "export_project.file_names"  # important since its how bpy.ops.import_test.some_data is constructed
     bl_label = "Export project.hkx"
@@ -232,7 +579,9 @@ class ExportProjectToHKX(Operator, ExportHelper):
         default=True,
     )
     
-    def execute(self, context):
+    operation = "project"
+
+    def export(self, context, profile):
         #The execute self.filepath is the project.hkx file, we should create the folders
         # Animations/ Behaviors/ Characters/ and CharacterAssets/ where it is if they don't exist and add the other files to them
         scene = context.scene
@@ -277,99 +626,73 @@ class ExportProjectToHKX(Operator, ExportHelper):
             reportStr="Non-folder file named 'Characters' present in export folder, not allowed!"
             self.report({"ERROR"},reportStr)
 
-        print("Exporting project, skeleton and character to tmp .xml file")
-        #export skeleton
-        skeleton_xml = os.path.join(context.scene.armaToHKX.workdir,"skeleton.xml")
-        export_skeleton(skeleton_xml, self.skeleton_name)
-
-        #Export Character
-        character_xml = os.path.join(context.scene.armaToHKX.workdir,"character.xml")
-        export_character(character_xml, self.character_name, self.skeleton_name, self.behavior_name)
-
-        #Export project
-        project_xml = os.path.join(context.scene.armaToHKX.workdir,"project.xml")
-        export_project(project_xml, self.character_name)
-
-        print("Converting skeleton to hkx")
-        if self.skyrim_version=="LE":
-            #convert to LE hkx
-            skeleton_out_path = base_export_folder+"\\CharacterAssets\\"+self.skeleton_name
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:WIN32 " +"\""+ skeleton_xml + "\" \"" + skeleton_out_path+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        elif self.skyrim_version=="SSE":
-            skeleton_out_path = base_export_folder+"\\CharacterAssets\\"+self.skeleton_name
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:AMD64 " +"\""+ skeleton_xml + "\" \"" + skeleton_out_path+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-            if self.also_export_LE_skeleton:
-                #Also exporting a LE skeleton to use for making animations
+        props = context.scene.armaToHKX
+        skeleton_out_path = os.path.join(base_export_folder, "CharacterAssets", self.skeleton_name)
+        character_out_path = os.path.join(base_export_folder, "Characters", self.character_name)
+
+        task = BackgroundExport(props.max_workers)
+        self.skeleton_files = [skeleton_out_path]
+        if self.skyrim_version=="SSE" and self.also_export_LE_skeleton:
+            self.skeleton_files.append(skeleton_out_path.replace(".hkx","_LE.hkx"))
+
+        if props.native_writer:
+            print("Writing project, skeleton and character hkx files")
+            with profile.stage("skeleton data"):
+                self.skeleton_data = get_skeleton_data()
+            if self.skeleton_data is None:
+                self.report({"ERROR"},"No armature found in scene, cancelling.")
+                return {"CANCELLED"}
+            task.submit("write skeleton hkx", write_skeleton_hkx, skeleton_out_path, self.skeleton_name, self.skeleton_data, self.skyrim_version)
+            if len(self.skeleton_files) > 1:
                 print("SSE selected but also exporting a LE skeleton hkx to use for animation")
-                cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:WIN32 " +"\""+ skeleton_xml + "\" \"" + skeleton_out_path.replace(".hkx","_LE.hkx")+"\""
-                print(cmd)
-                proc = subprocess.Popen(cmd)
-                time.sleep(1.0)
-                subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-                time.sleep(1.0)
-        else:
-            raise
-
-        print("Converting character to hkx")
-        #Convert character
-        if self.skyrim_version=="LE":
-            #convert to LE hkx
-            character_out_path = base_export_folder+"\\Characters\\"+self.character_name
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:WIN32 " +"\""+ character_xml + "\" \"" + character_out_path+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        elif self.skyrim_version=="SSE":
-            #convert to SSE hkx
-            character_out_path = base_export_folder+"\\Characters\\"+self.character_name
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:AMD64 " +"\""+ character_xml + "\" \"" + character_out_path+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        else:
-            raise
+                task.submit("write LE skeleton hkx", write_skeleton_hkx, self.skeleton_files[1], self.skeleton_name, self.skeleton_data, "LE")
+            task.submit("write character hkx", export_character_hkx, character_out_path, self.character_name, self.skeleton_name, self.behavior_name, self.skyrim_version)
+            task.submit("write project hkx", export_project_hkx, self.filepath, self.character_name, self.skyrim_version)
+            return self.start_background(context, task)
 
-        print("Converting project to hkx")
-        #Convert project
-        if self.skyrim_version=="LE":
-            #convert to LE hkx
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:WIN32 " +"\""+ project_xml + "\" \"" + self.filepath+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        elif self.skyrim_version=="SSE":
-            #convert to SSE hkx
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:AMD64 " +"\""+ project_xml + "\" \"" + self.filepath+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        else:
-            raise
-
-        print("DONE")
+        print("Exporting project, skeleton and character to tmp .xml file")
+        with profile.stage("xml generation"):
+            #export skeleton
+            skeleton_xml = os.path.join(context.scene.armaToHKX.workdir,"skeleton.xml")
+            self.skeleton_data = export_skeleton(skeleton_xml, self.skeleton_name)
+
+            #Export Character
+            character_xml = os.path.join(context.scene.armaToHKX.workdir,"character.xml")
+            export_character(character_xml, self.character_name, self.skeleton_name, self.behavior_name)
+
+            #Export project
+            project_xml = os.path.join(context.scene.armaToHKX.workdir,"project.xml")
+            export_project(project_xml, self.character_name)
+
+        jobs = []
+
+        #None of the conversions depend on each other, queue them all and run them on the pool
+        cache = get_export_cache(props)
+        jobs.append(ConversionJob("skeleton ("+self.skyrim_version+")", hkxcmd_convert_cmd(props.hkxcmd, skeleton_xml, skeleton_out_path, self.skyrim_version), skeleton_out_path, cache_key(cache, skeleton_xml, self.skyrim_version, props.hkxcmd)))
+        if len(self.skeleton_files) > 1:
+            #Also exporting a LE skeleton to use for making animations
+            print("SSE selected but also exporting a LE skeleton hkx to use for animation")
+            skeleton_LE_out_path = self.skeleton_files[1]
+            jobs.append(ConversionJob("skeleton (LE)", hkxcmd_convert_cmd(props.hkxcmd, skeleton_xml, skeleton_LE_out_path, "LE"), skeleton_LE_out_path, cache_key(cache, skeleton_xml, "LE", props.hkxcmd)))
+
+        jobs.append(ConversionJob("character ("+self.skyrim_version+")", hkxcmd_convert_cmd(props.hkxcmd, character_xml, character_out_path, self.skyrim_version), character_out_path, cache_key(cache, character_xml, self.skyrim_version, props.hkxcmd)))
+
+        jobs.append(ConversionJob("project ("+self.skyrim_version+")", hkxcmd_convert_cmd(props.hkxcmd, project_xml, self.filepath, self.skyrim_version), self.filepath, cache_key(cache, project_xml, self.skyrim_version, props.hkxcmd)))
+
+        print("Converting skeleton, character and project to hkx")
+        for job in jobs:
+            task.submit(job.label, run_job, job, props.converter_timeout, cache, task.cancel_event)
+        return self.start_background(context, task)
+
+    def apply_results(self, context, results):
+        if context.scene.armaToHKX.verify_outputs and self.skeleton_data is not None:
+            with self.profile.stage("verification"):
+                verify_skeleton_files(self, self.skeleton_files, self.skeleton_name, self.skeleton_data)
         return {"FINISHED"}
 
 
 
-class ExportArmaToHKX(Operator, ExportHelper):
+class ExportArmaToHKX(BackgroundExportOperator, Operator, ExportHelper):
     """Export animation to LE and SSE hkx using the niftools plugin, convertKF and hkxcmd"""
     bl_idname = "animation.animation_to_hkx"  
     bl_label = "Export animation to .hkx"
@@ -397,29 +720,63 @@ class ExportArmaToHKX(Operator, ExportHelper):
         soft_max = 1.0, 
         step = 0.1)
 
-    def execute(self, context):
+    operation = "animation"
+
+    def export(self, context, profile):
         # Init helper systems
         transform_anim = TransformAnimation()
         scene = context.scene
-        if context.scene.armaToHKX.path == "" or context.scene.armaToHKX.path[-4:]!=".hkx":
-            reportStr="No, or invalid skeleton.hkx file selected. Select in 3D view from the armaToHKX tool panel. Canceling."
-            self.report({"ERROR"},reportStr)
-            return {"CANCELLED"}
+        with profile.stage("validation"):
+            if context.scene.armaToHKX.path == "" or context.scene.armaToHKX.path[-4:]!=".hkx":
+                reportStr="No, or invalid skeleton.hkx file selected. Select in 3D view from the armaToHKX tool panel. Canceling."
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
 
-        if not os.path.exists(context.scene.armaToHKX.hkxcmd):
-            reportStr="hkxcmd.exe path invalid. Cancelling."
-            self.report({"ERROR"},reportStr)
-            return {"CANCELLED"}
+            if not context.scene.armaToHKX.native_writer and not os.path.exists(context.scene.armaToHKX.hkxcmd):
+                reportStr="hkxcmd.exe path invalid. Cancelling."
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
 
-        if not os.path.exists(context.scene.armaToHKX.convertKF):
-            reportStr="convertKF.exe path invalid. Cancelling."
-            self.report({"ERROR"},reportStr)
-            return {"CANCELLED"}
+            if not context.scene.armaToHKX.native_writer and not os.path.exists(context.scene.armaToHKX.convertKF):
+                reportStr="convertKF.exe path invalid. Cancelling."
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
 
-        if not os.path.exists(context.scene.armaToHKX.workdir) or not os.path.isdir(context.scene.armaToHKX.workdir):
-            reportStr="Workdir INVALID, either doesn't exists or is not a directory. Cancelling"
-            self.report({"ERROR"},reportStr)
-            return {"CANCELLED"}
+            if not os.path.exists(context.scene.armaToHKX.workdir) or not os.path.isdir(context.scene.armaToHKX.workdir):
+                reportStr="Workdir INVALID, either doesn't exists or is not a directory. Cancelling"
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
+
+        if context.scene.armaToHKX.native_writer:
+            #The visual pose is sampled frame by frame, constraints included, so nothing is baked
+            arm_obj = get_armature(context)
+            if arm_obj is None:
+                return {"CANCELLED"}
+            skeleton_name = os.path.basename(context.scene.armaToHKX.path).replace(".hkx","")
+            if skeleton_name.endswith("_LE"):
+                skeleton_name = skeleton_name[:-3]
+            self.LE_out_path = self.filepath.replace(".hkx", "_LE.hkx")
+            props = context.scene.armaToHKX
+            with profile.stage("pose sampling"):
+                if props.stream_animation:
+                    clip_file_path = os.path.join(props.workdir, skeleton_name+"_animation"+CLIP_EXTENSION)
+                    self.tracks = stream_animation_clip(context, clip_file_path, window=props.stream_window)
+                else:
+                    self.tracks = sample_animation_tracks(context)
+            if self.tracks is None:
+                self.report({"ERROR"},"No armature found in scene, cancelling.")
+                return {"CANCELLED"}
+            annotations = marker_annotations(context, self.tracks, get_anim_markers(arm_obj))
+            print("Writing LE and SSE animation hkx files")
+            task = BackgroundExport()
+            hkx_files = [(self.LE_out_path, "LE"), (self.filepath, "SSE")]
+            if props.stream_animation:
+                task.submit("write animation hkx", write_streamed_animation_hkx, hkx_files, skeleton_name, self.tracks, annotations,
+                    get_spline_settings(props), props.stream_window)
+            else:
+                task.submit("write animation hkx", write_animation_hkx, hkx_files, skeleton_name, self.tracks, annotations,
+                    get_spline_settings(props))
+            return self.start_background(context, task)
 
         # shutil.copyfile( os.path.abspath(os.path.join(os.path.dirname(__file__), 'tmp/empty.kf')),  context.scene.armaToHKX.workdir+"empty.kf")
 
@@ -454,64 +811,340 @@ class ExportArmaToHKX(Operator, ExportHelper):
         # bake data dropdown should be "Pose"
         # The operator is bpy.ops.nla.bake
         # docs at https://docs.blender.org/api/current/bpy.ops.nla.html
-        global sampled_constraints
-        
-        if self.bake:
+        temporary_action = None
+        if self.bake and context.scene.armaToHKX.non_destructive:
+            arm_obj = get_armature(context)
+            if arm_obj is None:
+                return {"CANCELLED"}
+            with profile.stage("bake"):
+                print("Sampling visual pose into a temporary action...")
+                anim_markers = get_anim_markers(arm_obj)
+                anim_data = arm_obj.animation_data_create()
+                user_action = anim_data.action
+                temporary_action = sample_action(context, arm_obj, context.scene.frame_start, context.scene.frame_end, context.scene.armaToHKX.auto_bake)
+                anim_data.action = temporary_action
+                if anim_markers:
+                    set_anim_markers(arm_obj, anim_markers)
+        elif self.bake:
+            arm_obj = get_armature(context)
+            if arm_obj is None:
+                return {"CANCELLED"}
+            with profile.stage("constraint sampling"):
+                print("Sampling armature constraints before export")
+                sample_constraints(arm_obj)
+                print("collecting markers from action")
+                anim_markers = get_anim_markers(arm_obj)
+            with profile.stage("bake"):
+                print("Baking action...")
+                #Collect starting and ending frame first
+                start=context.scene.frame_start
+                end=context.scene.frame_end            
+                bake_action(context, arm_obj, start, end, context.scene.armaToHKX.auto_bake)
+                #Set influence of constraints to zero
+                print("Setting bone constraint influences to zero (use 'restore constraints' in the armatoHKX panel to restore)")
+                for pbone in arm_obj.pose.bones:
+                    if pbone.constraints:
+                        for constraint in pbone.constraints:
+                            constraint.influence=0.0
+                if anim_markers:
+                    print("Transfering markers from previous action")
+                    set_anim_markers(arm_obj, anim_markers)
+        reduction = get_key_reduction(context.scene.armaToHKX)
+        if reduction is not None:
             arm_obj = get_armature(context)
             if arm_obj is None:
                 return {"CANCELLED"}
-            print("Sampling armature constraints before export")
-            sampled_constraints=sample_constraints(arm_obj)
-            print("collecting markers from action")
-            anim_markers = get_anim_markers(arm_obj)
-            print("Baking action...")
-            #Collect starting and ending frame first
-            start=context.scene.frame_start
-            end=context.scene.frame_end            
-            bpy.ops.nla.bake(frame_start=start, frame_end=end, step=1, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, clean_curves=False, bake_types={'POSE'})
-            #Set influence of constraints to zero
-            print("Setting bone constraint influences to zero (use 'restore constraints' in the armatoHKX panel to restore)")
-            for pbone in arm_obj.pose.bones:
-                if pbone.constraints:
-                    for constraint in pbone.constraints:
-                        constraint.influence=0.0
-            if anim_markers:
-                print("Transfering markers from previous action")
-                set_anim_markers(arm_obj, anim_markers)
+            anim_data = arm_obj.animation_data
+            if anim_data is not None and anim_data.action is not None:
+                with profile.stage("key reduction"):
+                    if not self.bake:
+                        #never reduce the user's own keys, the copy is removed again after the kf export
+                        user_action = anim_data.action
+                        temporary_action = user_action.copy()
+                        anim_data.action = temporary_action
+                    reduce_action(anim_data.action, reduction)
+                reportStr=reduction.summary()
+                print(reportStr)
+                self.report({"INFO"},reportStr)
+
         print("Exporting kf through io_scene_niftools")
         if bpy.context.scene.niftools_scene.scale_correction != self.scale_correction:
             reportStr="WARNING: niftools scale correction not equal to "+str(self.scale_correction)+", overriding."
             bpy.context.scene.niftools_scene.scale_correction = self.scale_correction
         empty_new_kf_path = os.path.abspath(os.path.join(context.scene.armaToHKX.workdir, 'empty_new.kf'))
-        bpy.ops.export_scene.kf(filepath=empty_new_kf_path)
-
-        #convert to LE hkx
-        print("Converting kf -> LE hkx")
-        cmd = "\""+context.scene.armaToHKX.convertKF +"\" \""+ context.scene.armaToHKX.path + "\" \"" + empty_new_kf_path + "\" \"" + self.filepath.replace(".hkx", "_LE.hkx")+"\"" #outpath.replace("tmp_out.xml","out\\"+hkx_name.replace(".hkx","_LE.hkx"))
-        print(cmd)
-        proc = subprocess.Popen(cmd)
-        time.sleep(2)
-        #subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-        #time.sleep(1.0)
-        #convert to SSE hkx
-        print("Converting LE hkx -> SSE hkx")
-        cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:AMD64 " +"\""+ self.filepath.replace(".hkx", "_LE.hkx") + "\" \"" + self.filepath+"\""
-        print(cmd)
-        proc = subprocess.Popen(cmd)
-        time.sleep(2)
-        #subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-        #time.sleep(1.0)
+        try:
+            with profile.stage("niftools kf export"):
+                bpy.ops.export_scene.kf(filepath=empty_new_kf_path)
+        finally:
+            #the baked or reduced action only lives for the kf export
+            if temporary_action is not None:
+                anim_data.action = user_action
+                bpy.data.actions.remove(temporary_action)
+
+        props = context.scene.armaToHKX
+        print("Converting kf -> LE hkx -> SSE hkx")
+        self.tracks = None
+        self.LE_out_path = self.filepath.replace(".hkx", "_LE.hkx")
+        #convertKF output is the input of the SSE conversion, run them as a chain
+        task = BackgroundExport()
+        task.submit("convertKF and hkxcmd", run_chain, [
+            ConversionJob("kf -> LE hkx", convertkf_cmd(props.convertKF, props.path, empty_new_kf_path, self.LE_out_path), self.LE_out_path),
+            ConversionJob("LE hkx -> SSE hkx", hkxcmd_convert_cmd(props.hkxcmd, self.LE_out_path, self.filepath, "SSE"), self.filepath),
+        ], props.converter_timeout, None, task.cancel_event)
+        return self.start_background(context, task)
+
+    def apply_results(self, context, results):
+        props = context.scene.armaToHKX
+        if self.tracks is not None and results[0].value is not None:
+            self.report({"INFO"}, results[0].value.summary())
+        if props.verify_outputs:
+            with self.profile.stage("verification"):
+                if self.tracks is not None:
+                    expected = {"num_tracks": len(self.tracks.bones), "duration": self.tracks.duration}
+                else:
+                    #convertKF binds the kf tracks to the bones of the skeleton in the panel
+                    expected = {"num_bones": skeleton_bone_count(self, props.path)}
+                for hkx_file in (self.LE_out_path, self.filepath):
+                    report_verification(self, hkx_file, verify_animation(hkx_file, **expected))
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        wm = context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+class ExportBatchArmaToHKX(Operator):
+    """Export many actions or NLA strips to LE and SSE hkx in one run"""
+    bl_idname = "animation.batch_animation_to_hkx"
+    bl_label = "Export animations to folder"
+
+    directory: StringProperty(
+        name="Output folder",
+        subtype='DIR_PATH',
+    )
+
+    source: EnumProperty(
+    name="Clips",
+    description="What to export",
+    items=(
+        ('NLA', "NLA strips", "Export every NLA strip of the armature"),
+        ('ACTIONS', "Actions", "Export every action keying bones of the armature"),
+    ),
+    default='NLA'
+    )
+
+    bake: BoolProperty(
+        name="Bake actions",
+        description="Bakes every clip before export, required if using constraints such as IK",
+        default=True,
+    )
 
+    resume: BoolProperty(
+        name="Resume",
+        description="Skip the clips, and steps of clips, an earlier interrupted or failed export to this folder already finished. Off exports everything again",
+        default=True,
+    )
+
+    scale_correction : FloatProperty(
+        name="scale correction",
+        description="Scale correction used by niftools export_kf operator - model will be scaled by 1/<this number> i.e. 0.1 will result in animation getting upscaled to an armature 10 times as big.",
+        default = 1.0,
+        soft_min = 0.1,
+        soft_max = 1.0,
+        step = 0.1)
+
+    def execute(self, context):
+        props = context.scene.armaToHKX
+        if props.path == "" or props.path[-4:]!=".hkx":
+            reportStr="No, or invalid skeleton.hkx file selected. Select in 3D view from the armaToHKX tool panel. Canceling."
+            self.report({"ERROR"},reportStr)
+            return {"CANCELLED"}
+
+        for exe_path, exe_name in ((props.hkxcmd, "hkxcmd.exe"), (props.convertKF, "convertKF.exe")):
+            if not os.path.exists(exe_path):
+                reportStr=exe_name+" path invalid. Cancelling."
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
+
+        if not os.path.isdir(props.workdir):
+            reportStr="Workdir INVALID, either doesn't exists or is not a directory. Cancelling"
+            self.report({"ERROR"},reportStr)
+            return {"CANCELLED"}
+
+        if not os.path.isdir(self.directory):
+            reportStr="Output folder INVALID, either doesn't exists or is not a directory. Cancelling"
+            self.report({"ERROR"},reportStr)
+            return {"CANCELLED"}
+
+        arm_obj = get_armature(context)
+        if arm_obj is None:
+            return {"CANCELLED"}
+
+        clips = collect_clips(arm_obj, self.source)
+        if not clips:
+            self.report({"ERROR"},"No clips found to export. Cancelling.")
+            return {"CANCELLED"}
+
+        if context.scene.niftools_scene.scale_correction != self.scale_correction:
+            print("WARNING: niftools scale correction not equal to "+str(self.scale_correction)+", overriding.")
+            context.scene.niftools_scene.scale_correction = self.scale_correction
+
+        reduction = get_key_reduction(props)
+        #a stored batch made with other settings is started over
+        settings = {"skeleton": os.path.abspath(props.path), "bake": self.bake, "scale_correction": self.scale_correction,
+            "auto_bake": props.auto_bake, "non_destructive": props.non_destructive,
+            "convertKF": os.path.abspath(props.convertKF), "hkxcmd": os.path.abspath(props.hkxcmd),
+            "reduction": None if reduction is None else [reduction.translation_tolerance, reduction.rotation_tolerance]}
+        queue = ExportQueue(props.workdir, os.path.abspath(self.directory), settings)
+        if not self.resume:
+            queue.reset()
+        manifest = export_clips(context, arm_obj, clips, self.directory, self.bake, props.max_workers, props.converter_timeout, reduction, queue)
+        if reduction is not None:
+            print(reduction.summary())
+        n_resumed = sum(len(entry["resumed"]) for entry in manifest["clips"])
+        if n_resumed:
+            self.report({"INFO"}, "Resumed: skipped "+str(n_resumed)+" export steps finished by an earlier run")
+        failed = [entry["clip"] for entry in manifest["clips"] if not entry["ok"]]
+        for entry in manifest["clips"]:
+            for error in entry["errors"]:
+                self.report({"ERROR"}, error)
+        reportStr="Exported {n} of {total} clips in {t:.1f}s".format(n=len(clips)-len(failed), total=len(clips), t=manifest["elapsed"])
+        print(reportStr)
+        if failed:
+            self.report({"ERROR"}, reportStr+", failed: "+", ".join(failed))
+            return {"CANCELLED"}
+        self.report({"INFO"}, reportStr)
         print("DONE")
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+class ExportArmaturesToHKX(Operator):
+    """Export project, character, skeleton and animations of every armature in the scene or a collection, each to its own folder"""
+    bl_idname = "animation.armatures_to_hkx"
+    bl_label = "Export all armatures to folder"
 
+    directory: StringProperty(
+        name="Output folder",
+        subtype='DIR_PATH',
+    )
+
+    collection: StringProperty(
+        name="Collection",
+        description="Only export the armatures in this collection, all armatures of the scene if empty",
+        default="",
+    )
+
+    skyrim_version: EnumProperty(
+    name="Skyrim version",
+    description="Choose between LE or SSE",
+    items=(
+        ('LE', "LE", "Export LE hkx files"),
+        ('SSE', "SSE", "Export SSE hkx files"),
+    ),
+    default='SSE'
+    )
+
+    source: EnumProperty(
+    name="Clips",
+    description="What to export",
+    items=(
+        ('NLA', "NLA strips", "Export every NLA strip of each armature"),
+        ('ACTIONS', "Actions", "Export every action keying bones of each armature"),
+    ),
+    default='NLA'
+    )
+
+    bake: BoolProperty(
+        name="Bake actions",
+        description="Bakes every clip before export, required if using constraints such as IK",
+        default=True,
+    )
+
+    scale_correction : FloatProperty(
+        name="scale correction",
+        description="Scale correction used by niftools export_kf operator - model will be scaled by 1/<this number> i.e. 0.1 will result in animation getting upscaled to an armature 10 times as big.",
+        default = 1.0,
+        soft_min = 0.1,
+        soft_max = 1.0,
+        step = 0.1)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop_search(self, "collection", bpy.data, "collections")
+        layout.prop(self, "skyrim_version")
+        layout.prop(self, "source")
+        layout.prop(self, "bake")
+        layout.prop(self, "scale_correction")
+
+    def execute(self, context):
+        props = context.scene.armaToHKX
+        #the clips always go through convertKF and hkxcmd, also with the native writer
+        for exe_path, exe_name in ((props.hkxcmd, "hkxcmd.exe"), (props.convertKF, "convertKF.exe")):
+            if not os.path.exists(exe_path):
+                reportStr=exe_name+" path invalid. Cancelling."
+                self.report({"ERROR"},reportStr)
+                return {"CANCELLED"}
+
+        if not os.path.isdir(props.workdir):
+            reportStr="Workdir INVALID, either doesn't exists or is not a directory. Cancelling"
+            self.report({"ERROR"},reportStr)
+            return {"CANCELLED"}
+
+        if not os.path.isdir(self.directory):
+            reportStr="Output folder INVALID, either doesn't exists or is not a directory. Cancelling"
+            self.report({"ERROR"},reportStr)
+            return {"CANCELLED"}
+
+        collection = None
+        if self.collection:
+            collection = bpy.data.collections.get(self.collection)
+            if collection is None:
+                self.report({"ERROR"},"No collection named "+self.collection+". Cancelling.")
+                return {"CANCELLED"}
+        armatures = collect_armatures(context.scene, collection)
+        if not armatures:
+            self.report({"ERROR"},"No armatures found to export. Cancelling.")
+            return {"CANCELLED"}
+
+        if context.scene.niftools_scene.scale_correction != self.scale_correction:
+            print("WARNING: niftools scale correction not equal to "+str(self.scale_correction)+", overriding.")
+            context.scene.niftools_scene.scale_correction = self.scale_correction
+
+        start = time.perf_counter()
+        reduction = get_key_reduction(props)
+        exports = export_armatures(context, armatures, self.directory, self.skyrim_version, self.source, self.bake,
+            props.max_workers, props.converter_timeout, reduction, get_export_cache(props))
+        failed = []
+        n_clips = 0
+        for export in exports:
+            errors = export.errors + [error for entry in export.entries for error in entry["errors"]]
+            for error in errors:
+                self.report({"ERROR"}, export.arm_obj.name+": "+error)
+            if errors:
+                failed.append(export.arm_obj.name)
+            n_clips += len(export.entries)
+            if props.verify_outputs and export.skeleton_data is not None and not export.errors:
+                skeleton_files = [export.skeleton_path] if export.LE_skeleton_path == export.skeleton_path else [export.skeleton_path, export.LE_skeleton_path]
+                verify_skeleton_files(self, skeleton_files, os.path.basename(export.skeleton_path), export.skeleton_data)
+        reportStr="Exported {n} of {total} armatures ({clips} clips) in {t:.1f}s".format(n=len(exports)-len(failed), total=len(exports), clips=n_clips, t=time.perf_counter()-start)
+        print(reportStr)
+        if failed:
+            self.report({"ERROR"}, reportStr+", with errors: "+", ".join(failed))
+            return {"CANCELLED"}
+        self.report({"INFO"}, reportStr)
+        print("DONE")
         return {"FINISHED"}
 
     def invoke(self, context, event):
-        wm = context.window_manager.fileselect_add(self)
+        context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
 
-class armaToHKX(bpy.types.Operator, ExportHelper):
+class armaToHKX(BackgroundExportOperator, bpy.types.Operator, ExportHelper):
     """Exporting armature to hkx using hkxcmd"""     
     bl_idname = "object.armature_to_hkx"        
     bl_label = "Export Armature to .hkx"         
@@ -541,7 +1174,9 @@ class armaToHKX(bpy.types.Operator, ExportHelper):
         default=True,
     )
 
-    def execute(self, context):       
+    operation = "skeleton"
+
+    def export(self, context, profile):
 
         scene = context.scene
         # Init helper systems
@@ -555,7 +1190,22 @@ class armaToHKX(bpy.types.Operator, ExportHelper):
             self.report({"ERROR"},reportStr)
             return {"CANCELLED"}
 
-        if not os.path.exists(context.scene.armaToHKX.hkxcmd):
+        props = context.scene.armaToHKX
+        #Skeleton_name
+        self.skeleton_basename = os.path.basename(self.filepath)
+
+        if props.native_writer:
+            print("skeleton export")
+            with profile.stage("skeleton data"):
+                self.skeleton_data = get_skeleton_data(self.skip_IK)
+            if self.skeleton_data is None:
+                self.report({"ERROR"},"No armature found in scene, cancelling.")
+                return {"CANCELLED"}
+            task = BackgroundExport()
+            task.submit("write skeleton hkx", write_skeleton_hkx, self.filepath, self.skeleton_basename, self.skeleton_data, self.skyrim_version)
+            return self.start_background(context, task)
+
+        if not os.path.exists(props.hkxcmd):
             reportStr="hkxcmd.exe path invalid. Cancelling."
             self.report({"ERROR"},reportStr)
             return {"CANCELLED"}
@@ -563,45 +1213,78 @@ class armaToHKX(bpy.types.Operator, ExportHelper):
         #tmp .xml file
         tmp_xml = os.path.join(context.scene.armaToHKX.workdir,"skeleton.xml")
 
-        #Skeleton_name
-        skeleton_basename = os.path.basename(self.filepath)
-
         print("skeleton export")
-        export_skeleton(tmp_xml, skeleton_basename, self.skip_IK)
-
-        if self.skyrim_version == "LE":
-            #convert to LE hkx
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:WIN32 " +"\""+ tmp_xml + "\" \"" + self.filepath+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        elif self.skyrim_version == "SSE":
-            #convert to SSE hkx
-            cmd = "\""+context.scene.armaToHKX.hkxcmd + "\" convert -v:AMD64 " +"\""+ tmp_xml + "\" \"" + self.filepath+"\""
-            print(cmd)
-            proc = subprocess.Popen(cmd)
-            time.sleep(1.0)
-            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
-            time.sleep(1.0)
-        else:
-            raise
-
-        print("DONE")
+        with profile.stage("xml generation"):
+            self.skeleton_data = export_skeleton(tmp_xml, self.skeleton_basename, self.skip_IK)
+
+        cache = get_export_cache(props)
+        job = ConversionJob("skeleton ("+self.skyrim_version+")", hkxcmd_convert_cmd(props.hkxcmd, tmp_xml, self.filepath, self.skyrim_version), self.filepath, cache_key(cache, tmp_xml, self.skyrim_version, props.hkxcmd))
+        task = BackgroundExport()
+        task.submit(job.label, run_job, job, props.converter_timeout, cache, task.cancel_event)
+        return self.start_background(context, task)
+
+    def apply_results(self, context, results):
+        if context.scene.armaToHKX.verify_outputs and self.skeleton_data is not None:
+            with self.profile.stage("verification"):
+                verify_skeleton_files(self, [self.filepath], self.skeleton_basename, self.skeleton_data)
         return {'FINISHED'}            # Lets Blender know the operator finished successfully.
 
     def invoke(self, context, event):
         wm = context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
+class ImportSkeletonHKX(Operator, ImportHelper):
+    """Create an armature from a binary skeleton .hkx (LE or SSE), no hkxcmd needed"""
+    bl_idname = "import_scene.armatohkx_skeleton"
+    bl_label = "Import skeleton .hkx"
+
+    filename_ext = ".hkx"
+
+    filter_glob: StringProperty(
+        default="*.hkx",
+        options={'HIDDEN'},
+        maxlen=255,
+    )
+
+    import_all: BoolProperty(
+        name="All skeletons",
+        description="Also import the other skeletons of the file, such as the ragdoll skeleton, as separate armatures",
+        default=False,
+    )
+
+    use_as_skeleton: BoolProperty(
+        name="Use for animation export",
+        description="Set this file as the skeleton .hkx convertKF exports animations against",
+        default=False,
+    )
+
+    def execute(self, context):
+        start = time.perf_counter()
+        try:
+            armatures = import_skeleton_hkx(context, self.filepath, self.import_all)
+        except (OSError, ValueError, KeyError) as e:
+            self.report({"ERROR"}, "Could not import "+os.path.basename(self.filepath)+": "+str(e))
+            return {"CANCELLED"}
+        for arm_obj in armatures:
+            reportStr="Imported {name} with {n} bones in {t:.2f}s".format(name=arm_obj.name, n=len(arm_obj.data.bones), t=time.perf_counter() - start)
+            print(reportStr)
+            self.report({"INFO"}, reportStr)
+        if self.use_as_skeleton:
+            context.scene.armaToHKX.path = self.filepath
+        return {"FINISHED"}
+
+
 classes = (
     armaToHKXProperties,
     armaToHKX,
+    ImportSkeletonHKX,
     OBJECT_PT_armaToHKXPanel,
     ExportArmaToHKX,
+    ExportBatchArmaToHKX,
+    ExportArmaturesToHKX,
     ExportProjectToHKX,
     ARMATOHKX_OT_constraintsOPs,
+    ARMATOHKX_OT_exportHistory,
     ARMATOHKX_OT_sample_and_bake,
 )
 
@@ -612,25 +1295,40 @@ def armaToHKX_menu_skeleton_export(self,context):
 def armaToHKX_menu_export(self, context):
     self.layout.operator(ExportArmaToHKX.bl_idname, text="animation with armaToHKX (.hkx)")
 
+def armaToHKX_menu_batch_export(self, context):
+    self.layout.operator(ExportBatchArmaToHKX.bl_idname, text="animations to folder with armaToHKX (.hkx)")
+
+def armaToHKX_menu_armatures_export(self, context):
+    self.layout.operator(ExportArmaturesToHKX.bl_idname, text="all armatures to folders with armaToHKX (.hkx)")
+
 def armaToHKX_menu_project_export(self, context):
     self.layout.operator(ExportProjectToHKX.bl_idname, text="project with armaToHKX (.hkx)")
 
+def armaToHKX_menu_skeleton_import(self, context):
+    self.layout.operator(ImportSkeletonHKX.bl_idname, text="skeleton with armaToHKX (.hkx)")
+
 
 def register():
     for cls in reversed(classes):
         bpy.utils.register_class(cls)
     bpy.types.Scene.armaToHKX = PointerProperty(type=armaToHKXProperties)
     bpy.types.TOPBAR_MT_file_export.append(armaToHKX_menu_export)
+    bpy.types.TOPBAR_MT_file_export.append(armaToHKX_menu_batch_export)
+    bpy.types.TOPBAR_MT_file_export.append(armaToHKX_menu_armatures_export)
     bpy.types.TOPBAR_MT_file_export.append(armaToHKX_menu_skeleton_export)
     bpy.types.TOPBAR_MT_file_export.append(armaToHKX_menu_project_export)
+    bpy.types.TOPBAR_MT_file_import.append(armaToHKX_menu_skeleton_import)
 
 def unregister():
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.armaToHKX
     bpy.types.TOPBAR_MT_file_export.remove(armaToHKX_menu_export)
+    bpy.types.TOPBAR_MT_file_export.remove(armaToHKX_menu_batch_export)
+    bpy.types.TOPBAR_MT_file_export.remove(armaToHKX_menu_armatures_export)
     bpy.types.TOPBAR_MT_file_export.remove(armaToHKX_menu_skeleton_export)
     bpy.types.TOPBAR_MT_file_export.remove(armaToHKX_menu_project_export)
+    bpy.types.TOPBAR_MT_file_import.remove(armaToHKX_menu_skeleton_import)
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
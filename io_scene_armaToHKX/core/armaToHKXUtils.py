@@ -42,26 +42,38 @@
 
 import bpy
 
+#Custom property of the armature object holding the sampled influences, {bone: {constraint: influence}}
+SAMPLED_INFLUENCES_PROP = "armaToHKX_sampled_influences"
+
 def sample_constraints(armature_obj):
+	#Stores the constraint influences on the armature itself. Influences sampled before and not restored
+	#yet are kept, they are the user's own and the current ones may be zeroed by an export.
+	if SAMPLED_INFLUENCES_PROP in armature_obj:
+		print("Keeping constraint influences sampled by an earlier export, they were not restored yet.")
+		return armature_obj[SAMPLED_INFLUENCES_PROP].to_dict()
 	constraints_dict = {}
 	for pb in armature_obj.pose.bones:
 		if pb.constraints:
-			for constraint in pb.constraints:
-				if pb.name in constraints_dict.keys():
-					constraints_dict[pb.name].append([constraint, constraint.influence])
-				else:
-					constraints_dict[pb.name]=[[constraint, constraint.influence]]
+			constraints_dict[pb.name] = {constraint.name: constraint.influence for constraint in pb.constraints}
+	armature_obj[SAMPLED_INFLUENCES_PROP] = constraints_dict
 	return constraints_dict
 
 
-def reintroduce_constraints(armature_obj, constraints_dict):
+def reintroduce_constraints(armature_obj):
+	#Restores the influences stored by sample_constraints, returns how many, None if nothing was stored
+	if SAMPLED_INFLUENCES_PROP not in armature_obj:
+		return None
+	constraints_dict = armature_obj[SAMPLED_INFLUENCES_PROP].to_dict()
 	n=0
 	for pb in armature_obj.pose.bones:
 		if pb.name in constraints_dict.keys():
-			for constraint_influence_tuple in constraints_dict[pb.name]:
-				constraint_influence_tuple[0].influence = constraint_influence_tuple[1]
-				n+=1
+			for constraint in pb.constraints:
+				if constraint.name in constraints_dict[pb.name]:
+					constraint.influence = constraints_dict[pb.name][constraint.name]
+					n+=1
+	del armature_obj[SAMPLED_INFLUENCES_PROP]
 	print("Restored "+str(n)+" sampled constraint influences.")
+	return n
 
 
 def get_armature(context):
@@ -0,0 +1,229 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Baking of the pose for export. The selective bake only bakes the bones whose visual transform can
+#differ from their keyed f-curves (constraints, IK chains, drivers), the f-curves of all other bones
+#are copied into the baked action as they are.
+#sample_action bakes without bpy.ops.nla.bake, from the evaluated pose, into an action nothing uses yet,
+#so neither the rig nor its constraints are touched.
+
+import bpy
+import mathutils
+import numpy as np
+
+from io_scene_armaToHKX.core.armaToHKXsampling import sample_visual_pose
+
+#constraints that move a chain of parents of the constrained bone as well
+CHAIN_CONSTRAINTS = ("IK", "SPLINE_IK")
+
+
+def _bone_name(data_path):
+    #'pose.bones["name"].location' -> 'name', None for anything else
+    if not data_path.startswith('pose.bones["'):
+        return None
+    return data_path[len('pose.bones["'):].split('"]', 1)[0]
+
+
+def bones_to_bake(arm_obj):
+    """
+    Names of the pose bones whose visual transform is not just their keyed f-curves:
+    bones with an active constraint, the parents an IK/spline IK constraint moves (chain_count, 0 is up to the root)
+    and bones with drivers on their transforms or constraints.
+    """
+    names = set()
+    for pose_bone in arm_obj.pose.bones:
+        for constraint in pose_bone.constraints:
+            if getattr(constraint, "mute", False):
+                continue
+            names.add(pose_bone.name)
+            if constraint.type in CHAIN_CONSTRAINTS:
+                chain_count = constraint.chain_count
+                parent = pose_bone.parent
+                depth = 1
+                while parent is not None and (chain_count == 0 or depth < chain_count):
+                    names.add(parent.name)
+                    parent = parent.parent
+                    depth += 1
+    if arm_obj.animation_data is not None:
+        for driver in arm_obj.animation_data.drivers:
+            name = _bone_name(driver.data_path)
+            if name is not None and name in arm_obj.pose.bones:
+                names.add(name)
+    return names
+
+
+def copy_fcurve(fcu, action):
+    #Copies keys, handles and interpolation of fcu into a new f-curve of action
+    group = fcu.group.name if fcu.group is not None else ""
+    new_fcu = action.fcurves.new(fcu.data_path, index=fcu.array_index, action_group=group)
+    n_keys = len(fcu.keyframe_points)
+    new_fcu.keyframe_points.add(n_keys)
+    buffer = np.empty(n_keys * 2, dtype=np.float32)
+    for attr in ("co", "handle_left", "handle_right"):
+        fcu.keyframe_points.foreach_get(attr, buffer)
+        new_fcu.keyframe_points.foreach_set(attr, buffer)
+    for src, dst in zip(fcu.keyframe_points, new_fcu.keyframe_points):
+        dst.interpolation = src.interpolation
+        dst.handle_left_type = src.handle_left_type
+        dst.handle_right_type = src.handle_right_type
+    new_fcu.extrapolation = fcu.extrapolation
+    new_fcu.update()
+    return new_fcu
+
+
+def bake_action(context, arm_obj, frame_start, frame_end, selective=False, only_selected=False):
+    """
+    Visual keying bake of the pose into a new action, which is assigned to arm_obj and returned.
+    With selective only the bones from bones_to_bake are baked and the other bones' f-curves are
+    copied from the current action, otherwise all bones (or the selected ones with only_selected) are baked.
+    """
+    if not selective:
+        bpy.ops.nla.bake(frame_start=frame_start, frame_end=frame_end, step=1, only_selected=only_selected, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, clean_curves=False, bake_types={'POSE'})
+        return arm_obj.animation_data.action
+
+    anim_data = arm_obj.animation_data_create()
+    orig_action = anim_data.action
+    names = bones_to_bake(arm_obj)
+    print("Baking {n} of {total} bones (constrained or driven)".format(n=len(names), total=len(arm_obj.pose.bones)))
+
+    if names:
+        #only_selected bakes the selected bones, restore the user's selection afterwards
+        selection = {bone.name: bone.select for bone in arm_obj.data.bones}
+        try:
+            for bone in arm_obj.data.bones:
+                bone.select = bone.name in names
+            bpy.ops.nla.bake(frame_start=frame_start, frame_end=frame_end, step=1, only_selected=True, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, clean_curves=False, bake_types={'POSE'})
+        finally:
+            for bone in arm_obj.data.bones:
+                bone.select = selection[bone.name]
+        baked_action = anim_data.action
+    else:
+        baked_action = bpy.data.actions.new((orig_action.name if orig_action else "Action")+"_baked")
+        anim_data.action = baked_action
+
+    if orig_action is not None and orig_action != baked_action:
+        n_copied = 0
+        for fcu in orig_action.fcurves:
+            name = _bone_name(fcu.data_path)
+            if name is not None and name not in names and name in arm_obj.pose.bones:
+                copy_fcurve(fcu, baked_action)
+                n_copied += 1
+        print("Copied {n} f-curves of unbaked bones".format(n=n_copied))
+    return baked_action
+
+
+def _rotation_channels(pose_bone, rotations, quaternions):
+    #data path and (n, k) values of a bone's rotation in its rotation mode
+    mode = pose_bone.rotation_mode
+    if mode == "QUATERNION":
+        return "rotation_quaternion", quaternions
+    if mode == "AXIS_ANGLE":
+        values = np.empty((len(rotations), 4))
+        for i, rotation in enumerate(rotations):
+            axis, angle = rotation.to_axis_angle()
+            values[i] = (angle, axis[0], axis[1], axis[2])
+        return "rotation_axis_angle", values
+    values = np.empty((len(rotations), 3))
+    previous = None
+    for i, rotation in enumerate(rotations):
+        #compatible to the previous frame, no jumps between equivalent eulers
+        euler = rotation.to_euler(mode) if previous is None else rotation.to_euler(mode, previous)
+        values[i] = euler
+        previous = euler
+    return "rotation_euler", values
+
+
+def sample_action(context, arm_obj, frame_start, frame_end, selective=False, only_selected=False, name=None):
+    """
+    Bake free version of bake_action: the visual pose is sampled from the depsgraph and keyed into a
+    new action, one linear key per frame, which is returned but not assigned. Bones are chosen like bake_action,
+    with selective the f-curves of the other bones are copied. Constraint influences, the selection and
+    the active action are left as they are.
+    """
+    anim_data = arm_obj.animation_data
+    orig_action = anim_data.action if anim_data is not None else None
+    if selective:
+        names = bones_to_bake(arm_obj)
+        print("Sampling {n} of {total} bones (constrained or driven)".format(n=len(names), total=len(arm_obj.pose.bones)))
+    elif only_selected:
+        names = {bone.name for bone in arm_obj.data.bones if bone.select}
+    else:
+        names = {bone.name for bone in arm_obj.data.bones}
+
+    if name is None:
+        name = (orig_action.name if orig_action is not None else "Action")+"_sampled"
+    action = bpy.data.actions.new(name)
+    if names:
+        samples = sample_visual_pose(context, arm_obj, frame_start, frame_end)
+        n_frames = len(samples.frames)
+        coords = np.empty((n_frames, 2), dtype=np.float32)
+        coords[:, 0] = samples.frames
+        #enum value of LINEAR, so the f-curves match the sampled pose between frames too
+        interpolation = np.ones(n_frames, dtype=np.int32)
+        for pose_bone in arm_obj.pose.bones:
+            if pose_bone.name not in names:
+                continue
+            locations = np.empty((n_frames, 3))
+            quaternions = np.empty((n_frames, 4))
+            scales = np.empty((n_frames, 3))
+            rotations = []
+            for i, matrix in enumerate(samples.bone_matrices(pose_bone.name)):
+                location, rotation, scale = mathutils.Matrix(matrix.tolist()).decompose()
+                if i > 0:
+                    rotation.make_compatible(rotations[-1])
+                locations[i], quaternions[i], scales[i] = location, rotation, scale
+                rotations.append(rotation)
+            rotation_path, rotation_values = _rotation_channels(pose_bone, rotations, quaternions)
+            prefix = 'pose.bones["{name}"].'.format(name=bpy.utils.escape_identifier(pose_bone.name))
+            for data_path, values in (("location", locations), (rotation_path, rotation_values), ("scale", scales)):
+                for index in range(values.shape[1]):
+                    fcu = action.fcurves.new(prefix+data_path, index=index, action_group=pose_bone.name)
+                    fcu.keyframe_points.add(n_frames)
+                    coords[:, 1] = values[:, index]
+                    fcu.keyframe_points.foreach_set("co", coords.ravel())
+                    fcu.keyframe_points.foreach_set("interpolation", interpolation)
+                    fcu.update()
+
+    if selective and orig_action is not None:
+        n_copied = 0
+        for fcu in orig_action.fcurves:
+            bone_name = _bone_name(fcu.data_path)
+            if bone_name is not None and bone_name not in names and bone_name in arm_obj.pose.bones:
+                copy_fcurve(fcu, action)
+                n_copied += 1
+        print("Copied {n} f-curves of unsampled bones".format(n=n_copied))
+    return action
@@ -0,0 +1,272 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Batch export of many actions/NLA strips of one armature in a single run.
+#Baking and the niftools KF export have to run on blender's main thread, the
+#convertKF -> hkxcmd conversions of a clip are handed to a ConversionPool so
+#clip N is converted while clip N+1 is being baked and exported.
+#With an ExportQueue every unit's state is persisted, units finished by an earlier run are skipped.
+
+import os
+import json
+import time
+import hashlib
+import bpy
+import numpy as np
+
+from io_scene_armaToHKX.core.armaToHKXUtils import get_anim_markers, set_anim_markers
+from io_scene_armaToHKX.core.armaToHKXconverter import ConversionJob, ConversionPool, run_job, convertkf_cmd, hkxcmd_convert_cmd
+from io_scene_armaToHKX.core.armaToHKXbake import bake_action, sample_action
+from io_scene_armaToHKX.core.armaToHKXreduce import reduce_action
+from io_scene_armaToHKX.core.armaToHKXqueue import UNITS
+
+MANIFEST_NAME = "armaToHKX_manifest.json"
+
+
+class Clip:
+    """An action and the frame range of it to export."""
+
+    def __init__(self, name, action, frame_start, frame_end):
+        self.name = name
+        self.action = action
+        self.frame_start = int(round(frame_start))
+        self.frame_end = int(round(frame_end))
+
+    @property
+    def file_name(self):
+        return bpy.path.clean_name(self.name)
+
+
+def collect_clips(arm_obj, source):
+    #source 'NLA': every strip of the armature's NLA tracks, 'ACTIONS': every action keying one of its bones
+    clips = []
+    if source == 'NLA':
+        if arm_obj.animation_data:
+            for track in arm_obj.animation_data.nla_tracks:
+                for strip in track.strips:
+                    if strip.action:
+                        clips.append(Clip(strip.name, strip.action, strip.action_frame_start, strip.action_frame_end))
+    elif source == 'ACTIONS':
+        bone_names = set(arm_obj.data.bones.keys())
+        for action in bpy.data.actions:
+            if any(group.name in bone_names for group in action.groups):
+                clips.append(Clip(action.name, action, *action.frame_range))
+    return clips
+
+
+def clip_fingerprint(clip):
+    #Hash of the clip's frame range and every key and handle of its action
+    digest = hashlib.sha256()
+    digest.update("{name}\0{start}\0{end}".format(name=clip.action.name, start=clip.frame_start, end=clip.frame_end).encode("utf-8"))
+    for fcurve in clip.action.fcurves:
+        digest.update("\0{path}\0{index}".format(path=fcurve.data_path, index=fcurve.array_index).encode("utf-8"))
+        n_keys = len(fcurve.keyframe_points)
+        for attribute in ("co", "handle_left", "handle_right"):
+            values = np.empty(n_keys * 2, dtype=np.float32)
+            fcurve.keyframe_points.foreach_get(attribute, values)
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def _convert_clip(clip_name, units, timeout, queue, after=None):
+    #Worker thread: run the (unit, ConversionJob) chain of a clip, recording every unit in the queue
+    #after is the future of the conversion writing the skeleton the clip is converted with
+    if after is not None:
+        dependency = after.result()
+        if not dependency.ok:
+            return [dependency]
+    results = []
+    for unit, job in units:
+        if queue is not None:
+            queue.start(clip_name, unit)
+        result = run_job(job, timeout)
+        if queue is not None:
+            queue.finish(clip_name, unit, job.output_path, None if result.ok else result.summary())
+        results.append(result)
+        if not result.ok:
+            break
+    return results
+
+
+def _bake_clip(context, arm_obj, clip):
+    #Bake clip into a new action, returns the baked action
+    arm_obj.animation_data.action = clip.action
+    anim_markers = get_anim_markers(arm_obj)
+    if context.scene.armaToHKX.non_destructive:
+        baked_action = sample_action(context, arm_obj, clip.frame_start, clip.frame_end, context.scene.armaToHKX.auto_bake)
+        arm_obj.animation_data.action = baked_action
+    else:
+        baked_action = bake_action(context, arm_obj, clip.frame_start, clip.frame_end, context.scene.armaToHKX.auto_bake)
+    if anim_markers:
+        set_anim_markers(arm_obj, anim_markers)
+    return baked_action
+
+
+def submit_clips(context, arm_obj, clips, out_dir, pool, bake=True, timeout=60.0, reduction=None, queue=None, skeleton_path=None, after=None, kf_dir=None):
+    """
+    Main thread part of export_clips: bakes and KF-exports every clip and submits its conversions to pool.
+    skeleton_path is the LE skeleton the clips are converted with (default the panel's), after the future
+    of the conversion writing it. The kf files go to kf_dir (default the workdir). Returns the manifest entries and the (entry, future, n_jobs) to wait_clips on.
+    """
+    props = context.scene.armaToHKX
+    scene = context.scene
+    skeleton_path = props.path if skeleton_path is None else skeleton_path
+    kf_dir = props.workdir if kf_dir is None else kf_dir
+    anim_data = arm_obj.animation_data_create()
+
+    #Store everything the batch touches, restored when done
+    orig_action = anim_data.action
+    orig_use_nla = anim_data.use_nla
+    orig_frame_range = (scene.frame_start, scene.frame_end)
+
+    entries = []
+    pending = []
+    #Strips are exported one at a time, the rest of the stack must not be evaluated on top
+    anim_data.use_nla = False
+    try:
+        for clip in clips:
+            entry = {"clip": clip.name, "action": clip.action.name, "frame_start": clip.frame_start, "frame_end": clip.frame_end, "outputs": [], "errors": [], "resumed": []}
+            entries.append(entry)
+            kf_path = os.path.abspath(os.path.join(kf_dir, clip.file_name+".kf"))
+            LE_out_path = os.path.join(out_dir, clip.file_name+"_LE.hkx")
+            SSE_out_path = os.path.join(out_dir, clip.file_name+".hkx")
+            if queue is not None:
+                queue.clip(clip.name, clip_fingerprint(clip))
+                entry["resumed"] = [unit for unit in UNITS if queue.is_done(clip.name, unit)]
+                if "LE hkx" in entry["resumed"] and "SSE hkx" in entry["resumed"]:
+                    print("Skipping clip "+clip.name+", exported by an earlier run")
+                    entry["outputs"] = [LE_out_path, SSE_out_path]
+                    entry["ok"] = True
+                    continue
+
+            clip_start = time.perf_counter()
+            if "kf" in entry["resumed"]:
+                #the kf of an earlier run is still there, baking is only needed to make it
+                print("Resuming clip "+clip.name+" from its kf")
+                entry["resumed"] = [unit for unit in entry["resumed"] if unit != "bake"] + (["bake"] if bake else [])
+            else:
+                print("Exporting clip "+clip.name)
+                entry["resumed"] = []
+                scene.frame_start = clip.frame_start
+                scene.frame_end = clip.frame_end
+                #baked action, or the copy of the clip's action that is reduced when not baking
+                temporary_action = None
+                unit = "bake" if bake else "kf"
+                try:
+                    if bake:
+                        if queue is not None:
+                            queue.start(clip.name, "bake")
+                        temporary_action = _bake_clip(context, arm_obj, clip)
+                    elif reduction is not None:
+                        #never reduce the user's own keys
+                        temporary_action = clip.action.copy()
+                        anim_data.action = temporary_action
+                    else:
+                        anim_data.action = clip.action
+                    if reduction is not None:
+                        keys_before, keys_after = reduction.keys_before, reduction.keys_after
+                        reduce_action(temporary_action, reduction)
+                        entry["keys"] = [reduction.keys_before - keys_before, reduction.keys_after - keys_after]
+                    if bake and queue is not None:
+                        queue.finish(clip.name, "bake")
+                    unit = "kf"
+                    if queue is not None:
+                        queue.start(clip.name, "kf")
+                    bpy.ops.export_scene.kf(filepath=kf_path)
+                    if queue is not None:
+                        queue.finish(clip.name, "kf", kf_path)
+                except Exception as e:
+                    entry["errors"].append("export failed: "+str(e))
+                    entry["ok"] = False
+                    if queue is not None:
+                        queue.finish(clip.name, unit, error=str(e))
+                    continue
+                finally:
+                    if temporary_action is not None:
+                        anim_data.action = None
+                        bpy.data.actions.remove(temporary_action)
+            entry["export_time"] = time.perf_counter() - clip_start
+
+            units = [
+                ("LE hkx", ConversionJob(clip.name+" kf -> LE hkx", convertkf_cmd(props.convertKF, skeleton_path, kf_path, LE_out_path), LE_out_path)),
+                ("SSE hkx", ConversionJob(clip.name+" LE hkx -> SSE hkx", hkxcmd_convert_cmd(props.hkxcmd, LE_out_path, SSE_out_path, "SSE"), SSE_out_path)),
+            ]
+            if "LE hkx" in entry["resumed"]:
+                entry["outputs"].append(LE_out_path)
+                units = units[1:]
+            pending.append((entry, pool.submit_call(_convert_clip, clip.name, units, timeout, queue, after), len(units)))
+    finally:
+        anim_data.action = orig_action
+        anim_data.use_nla = orig_use_nla
+        scene.frame_start, scene.frame_end = orig_frame_range
+    return entries, pending
+
+
+def wait_clips(pending):
+    #Fills in the manifest entries of submit_clips once their conversions are done
+    for entry, future, n_jobs in pending:
+        results = future.result()
+        entry["outputs"] += [result.output_path for result in results if result.ok]
+        entry["errors"] += [result.summary() for result in results if not result.ok]
+        entry["convert_time"] = sum(result.elapsed for result in results)
+        entry["ok"] = len(results) == n_jobs and not entry["errors"]
+
+
+def write_manifest(out_dir, arm_obj, skeleton_path, entries, elapsed):
+    manifest = {
+        "armature": arm_obj.name,
+        "skeleton": skeleton_path,
+        "elapsed": elapsed,
+        "clips": entries,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def export_clips(context, arm_obj, clips, out_dir, bake=True, max_workers=1, timeout=60.0, reduction=None, queue=None):
+    """
+    Bake and KF-export every clip on the main thread and pipeline the convertKF -> hkxcmd
+    conversions on a worker pool. Writes a per-clip manifest to out_dir and returns it.
+    With a KeyReduction the baked actions are reduced before the KF export. With an ExportQueue
+    the units a previous run finished, with unchanged outputs, are skipped and listed as "resumed".
+    """
+    batch_start = time.perf_counter()
+    with ConversionPool(timeout, max_workers) as pool:
+        entries, pending = submit_clips(context, arm_obj, clips, out_dir, pool, bake, timeout, reduction, queue)
+        wait_clips(pending)
+    return write_manifest(out_dir, arm_obj, context.scene.armaToHKX.path, entries, time.perf_counter() - batch_start)
@@ -0,0 +1,120 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Content-addressed cache of converter outputs, kept in <workdir>/cache.
+#A conversion is keyed by a hash of its input file (which holds the rest pose, bone list,
+#skip_IK result and names), the target version and the converter binary.
+
+import os
+import shutil
+import hashlib
+import threading
+
+CACHE_DIRNAME = "cache"
+CACHE_EXT = ".hkx"
+#Default size limit of the cache in megabytes
+DEFAULT_CACHE_SIZE = 256
+
+
+class ExportCache:
+    """Stores produced .hkx files by key and evicts the least recently used ones over max_bytes."""
+
+    def __init__(self, workdir, max_bytes=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.directory = os.path.join(workdir, CACHE_DIRNAME)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def conversion_key(src_path, skyrim_version, converter_path):
+        digest = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(("\0"+skyrim_version+"\0").encode("utf-8"))
+        #a different or updated converter binary must not hit old outputs
+        converter_path = os.path.abspath(converter_path)
+        try:
+            st = os.stat(converter_path)
+            converter_id = "{path}\0{size}\0{mtime}".format(path=converter_path, size=st.st_size, mtime=st.st_mtime_ns)
+        except OSError:
+            converter_id = converter_path
+        digest.update(converter_id.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXT)
+
+    def fetch(self, key, dst_path):
+        #Copies the cached output for key to dst_path, returns False on a miss
+        cached_path = self._path(key)
+        with self.lock:
+            if not os.path.isfile(cached_path):
+                return False
+            shutil.copyfile(cached_path, dst_path)
+            #mark as recently used
+            os.utime(cached_path)
+        return True
+
+    def store(self, key, src_path):
+        cached_path = self._path(key)
+        tmp_path = cached_path + ".tmp" + str(threading.get_ident())
+        shutil.copyfile(src_path, tmp_path)
+        with self.lock:
+            os.replace(tmp_path, cached_path)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(CACHE_EXT):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    os.remove(entry.path)
@@ -0,0 +1,253 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Binary intermediate format of sampled animation clips, the replacement of the text dump.
+#Layout, little endian:
+#   header      magic, version, bone count, duration (s), flags, offset of the bone table
+#   bone table  per bone: name offset and length (into the names), key count, header key count, data offset
+#   names       utf-8 bone names
+#   bone data   per bone, 16 byte aligned: float32 times (n), translations (n, 3), quaternions w x y z (n, 4), scales (n)
+#A streamed ClipWriter puts the bone data first and the table at the end, allocate_clip puts the table
+#first. ClipReader memory maps the file and hands out the arrays as views, nothing is parsed or copied.
+
+import io
+import struct
+import numpy as np
+
+from io_scene_armaToHKX.core.armaToHKXdump import AnimationDumpWriter
+
+CLIP_MAGIC = b"AHKXCLIP"
+CLIP_VERSION = 1
+CLIP_EXTENSION = ".ahkxclip"
+
+CLIP_HEADER = struct.Struct("<8sIIfIQ")
+BONE_ENTRY = np.dtype([("name_offset", "<u4"), ("name_length", "<u4"), ("n_keys", "<u4"), ("key_count", "<u4"), ("data_offset", "<u8")])
+#float32 values per key: time, translation, quaternion, scale
+KEY_WIDTHS = (1, 3, 4, 1)
+FLOATS_PER_KEY = sum(KEY_WIDTHS)
+ALIGNMENT = 16
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def bone_data_size(n_keys):
+    return n_keys * FLOATS_PER_KEY * 4
+
+
+def _table_bytes(bones, table_offset):
+    #bone table and names of (name, n_keys, key_count, data_offset), returned as one block
+    names = [name.encode("utf-8") for name, n_keys, key_count, data_offset in bones]
+    table = np.zeros(len(bones), dtype=BONE_ENTRY)
+    name_offset = table_offset + table.nbytes
+    for i, ((name, n_keys, key_count, data_offset), encoded) in enumerate(zip(bones, names)):
+        table[i] = (name_offset, len(encoded), n_keys, key_count, data_offset)
+        name_offset += len(encoded)
+    return table.tobytes() + b"".join(names)
+
+
+class ClipWriter:
+    """
+    Streams a clip to a file path or to a binary file-like object such as io.BytesIO, with the
+    write_header/write_bone interface of AnimationDumpWriter so either can be handed to the exporters.
+    close() writes the bone table and the header, exactly once.
+    """
+
+    def __init__(self, target):
+        if isinstance(target, (str, bytes)) or hasattr(target, "__fspath__"):
+            self.file = open(target, "w+b")
+            self.owns_file = True
+        else:
+            self.file = target
+            self.owns_file = False
+        self.start = self.file.tell()
+        self.file.write(bytes(CLIP_HEADER.size))
+        self.bones = []
+        self.duration = 0.0
+        self.closed = False
+
+    @classmethod
+    def in_memory(cls):
+        return cls(io.BytesIO())
+
+    def _pad(self):
+        position = self.file.tell() - self.start
+        self.file.write(bytes(_aligned(position) - position))
+
+    def write_header(self, duration):
+        self.duration = duration
+
+    def write_bone(self, name, times, translations, quaternions, scales, key_count=None):
+        """
+        times (n,), translations (n, 3), quaternions (n, 4) w x y z and scales (n,).
+        key_count is the key count the text dump writes in the bone header, defaults to n.
+        """
+        n = min(len(times), len(translations), len(quaternions), len(scales))
+        self._pad()
+        data_offset = self.file.tell() - self.start
+        for values in (times, translations, quaternions, scales):
+            self.file.write(np.ascontiguousarray(values[:n], dtype="<f4").tobytes())
+        self.bones.append((str(name), n, n if key_count is None else key_count, data_offset))
+
+    def getvalue(self):
+        #Clip bytes of an in-memory writer, closes it
+        self.close()
+        return self.file.getvalue()
+
+    def close(self):
+        if self.closed:
+            return
+        self._pad()
+        table_offset = self.file.tell() - self.start
+        self.file.write(_table_bytes(self.bones, table_offset))
+        end = self.file.tell()
+        self.file.seek(self.start)
+        self.file.write(CLIP_HEADER.pack(CLIP_MAGIC, CLIP_VERSION, len(self.bones), self.duration, 0, table_offset))
+        self.file.seek(end)
+        if self.owns_file:
+            self.file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def allocate_clip(filepath, bone_names, n_keys, duration):
+    """
+    Creates a clip of len(bone_names) bones with n_keys keys each, zero filled, with the bone table
+    right after the header. The bone data is then filled in place through ClipReader(filepath, writable=True).
+    """
+    bone_names = [str(name) for name in bone_names]
+    table_offset = CLIP_HEADER.size
+    table_size = len(bone_names) * BONE_ENTRY.itemsize + sum(len(name.encode("utf-8")) for name in bone_names)
+    data_offset = _aligned(table_offset + table_size)
+    bones = []
+    for name in bone_names:
+        bones.append((name, n_keys, n_keys, data_offset))
+        data_offset = _aligned(data_offset + bone_data_size(n_keys))
+    with open(filepath, "wb") as f:
+        f.write(CLIP_HEADER.pack(CLIP_MAGIC, CLIP_VERSION, len(bones), duration, 0, table_offset))
+        f.write(_table_bytes(bones, table_offset))
+        #sparse where the file system supports it, the data is written by the caller
+        f.truncate(data_offset)
+
+
+class ClipTrack:
+    """Keys of one bone, float32 views into the clip."""
+
+    def __init__(self, name, key_count, times, translations, quaternions, scales):
+        self.name = name
+        self.key_count = key_count
+        self.times = times
+        self.translations = translations
+        self.quaternions = quaternions
+        self.scales = scales
+
+
+class ClipReader:
+    """
+    Memory mapped clip, a file path or a bytes-like object. track() and tracks() return views into
+    the mapping, with writable=True (files only) assigning to them writes the clip in place.
+    """
+
+    def __init__(self, source, writable=False):
+        is_path = isinstance(source, str) or hasattr(source, "__fspath__")
+        self.name = str(source) if is_path else "clip"
+        if is_path:
+            self.data = np.memmap(source, dtype=np.uint8, mode="r+" if writable else "r")
+        else:
+            self.data = np.frombuffer(source, dtype=np.uint8)
+        if len(self.data) < CLIP_HEADER.size:
+            raise ValueError(self.name+" is too small to be a clip")
+        magic, version, n_bones, self.duration, self.flags, table_offset = CLIP_HEADER.unpack_from(self.data, 0)
+        if magic != CLIP_MAGIC:
+            raise ValueError(self.name+" is not an armaToHKX clip")
+        if version != CLIP_VERSION:
+            raise ValueError("{name}: unsupported clip version {v}".format(name=self.name, v=version))
+        if table_offset + n_bones * BONE_ENTRY.itemsize > len(self.data):
+            raise ValueError(self.name+" is truncated")
+        self.table = np.frombuffer(self.data, dtype=BONE_ENTRY, count=n_bones, offset=table_offset)
+        self.bone_names = [bytes(self.data[entry["name_offset"]:entry["name_offset"] + entry["name_length"]]).decode("utf-8") for entry in self.table]
+        self.bone_index = {name: i for i, name in enumerate(self.bone_names)}
+        end = self.table["data_offset"] + bone_data_size(self.table["n_keys"].astype(np.uint64))
+        if n_bones and end.max() > len(self.data):
+            raise ValueError(self.name+" is truncated")
+
+    def track(self, name):
+        entry = self.table[self.bone_index[name]]
+        n = int(entry["n_keys"])
+        offset = int(entry["data_offset"])
+        arrays = []
+        for width in KEY_WIDTHS:
+            values = self.data[offset:offset + n * width * 4].view("<f4")
+            arrays.append(values.reshape(n, width) if width > 1 else values)
+            offset += n * width * 4
+        return ClipTrack(name, int(entry["key_count"]), *arrays)
+
+    def tracks(self):
+        return [self.track(name) for name in self.bone_names]
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    def close(self):
+        #views handed out keep the mapping alive until they are gone
+        self.flush()
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_text_dump(clip, dump_target):
+    """
+    Writes the text dump (AnimationDumpWriter) of a clip, a ClipReader or anything ClipReader opens.
+    The dump is only an export of the clip now, keys are written as the clip stores them.
+    """
+    reader = clip if isinstance(clip, ClipReader) else ClipReader(clip)
+    with AnimationDumpWriter(dump_target) as dump:
+        dump.write_header(reader.duration)
+        for track in reader.tracks():
+            dump.write_bone(track.name, track.times, track.translations, track.quaternions, track.scales, track.key_count)
@@ -0,0 +1,341 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Runs the external converters (hkxcmd, convertKF) and waits on the real process exit
+#instead of sleeping a fixed time and force killing the process.
+
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#Default time in seconds a single conversion may take before it is killed
+DEFAULT_TIMEOUT = 60.0
+
+#Default number of converters allowed to run at the same time
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+#Seconds between checks of the cancel event while a converter runs
+CANCEL_POLL_INTERVAL = 0.1
+
+#hkxcmd -v: layouts for the two skyrim versions
+HKX_TARGETS = {
+    "LE": "WIN32",
+    "SSE": "AMD64",
+}
+
+
+class ConversionResult:
+    """Outcome of a single converter run."""
+
+    def __init__(self, label, cmd, output_path):
+        self.label = label
+        self.cmd = cmd
+        self.output_path = output_path
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.elapsed = 0.0
+        self.error = None
+        self.cached = False
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def summary(self):
+        if self.ok and self.cached:
+            return "{label}: copied {path} from cache".format(label=self.label, path=self.output_path)
+        if self.ok:
+            return "{label}: wrote {path} in {t:.2f}s".format(label=self.label, path=self.output_path, t=self.elapsed)
+        reportStr = "{label} failed: {error}".format(label=self.label, error=self.error)
+        details = (self.stderr or self.stdout).strip()
+        if details:
+            reportStr += " ("+details.splitlines()[-1]+")"
+        return reportStr
+
+
+class ConversionJob:
+    """
+    A converter command line and the file it is expected to produce.
+    Jobs with a cache_key are looked up in / stored to the ExportCache passed to the runner.
+    """
+
+    def __init__(self, label, cmd, output_path, cache_key=None):
+        self.label = label
+        self.cmd = cmd
+        self.output_path = output_path
+        self.cache_key = cache_key
+
+
+def hkxcmd_convert_cmd(hkxcmd, src_path, dst_path, skyrim_version):
+    #hkxcmd convert -v:<layout> <src> <dst>
+    return [hkxcmd, "convert", "-v:"+HKX_TARGETS[skyrim_version], src_path, dst_path]
+
+
+def convertkf_cmd(convertKF, skeleton_path, kf_path, dst_path):
+    #convertKF <skeleton.hkx> <anim.kf> <out.hkx>
+    return [convertKF, skeleton_path, kf_path, dst_path]
+
+
+def _output_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _kill(proc):
+    #hkxcmd can leave child processes behind on windows, kill the whole tree there
+    if os.name == "nt":
+        subprocess.run(["TASKKILL", "/F", "/T", "/PID", str(proc.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        proc.kill()
+
+
+def run_converter(cmd, output_path, timeout=DEFAULT_TIMEOUT, label=None, cancel=None):
+    """
+    Run cmd until it exits or timeout seconds have passed and check that it produced
+    a non-empty output_path. Never raises for converter failures, check result.ok.
+    The converter is killed as soon as the threading.Event cancel is set.
+    """
+    result = ConversionResult(label or os.path.basename(output_path), cmd, output_path)
+    if cancel is not None and cancel.is_set():
+        result.error = "cancelled"
+        return result
+    print(subprocess.list2cmdline(cmd))
+
+    before = _output_stamp(output_path)
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, universal_newlines=True)
+    except OSError as e:
+        result.error = "could not start {exe}: {e}".format(exe=cmd[0], e=e)
+        return result
+
+    deadline = start + timeout
+    while True:
+        #without a cancel event wait the whole timeout at once
+        wait = deadline - time.perf_counter() if cancel is None else min(CANCEL_POLL_INTERVAL, deadline - time.perf_counter())
+        try:
+            result.stdout, result.stderr = proc.communicate(timeout=max(0.0, wait))
+            break
+        except subprocess.TimeoutExpired:
+            if cancel is not None and cancel.is_set():
+                result.error = "cancelled"
+            elif time.perf_counter() >= deadline:
+                result.error = "timed out after {t:g}s".format(t=timeout)
+            else:
+                continue
+            _kill(proc)
+            result.stdout, result.stderr = proc.communicate()
+            break
+    result.returncode = proc.returncode
+    result.elapsed = time.perf_counter() - start
+
+    if result.error is None:
+        after = _output_stamp(output_path)
+        if result.returncode != 0:
+            result.error = "exited with code {code}".format(code=result.returncode)
+        elif after is None:
+            result.error = "no output file written"
+        elif after[0] == 0:
+            result.error = "output file is empty"
+        elif after == before:
+            result.error = "output file was not updated"
+
+    print(result.summary())
+    return result
+
+
+def run_job(job, timeout=DEFAULT_TIMEOUT, cache=None, cancel=None):
+    #run_converter for a job, served from / added to cache if the job has a cache_key
+    use_cache = cache is not None and job.cache_key is not None
+    if use_cache and cache.fetch(job.cache_key, job.output_path):
+        result = ConversionResult(job.label, job.cmd, job.output_path)
+        result.cached = True
+        print(result.summary())
+        return result
+    result = run_converter(job.cmd, job.output_path, timeout, job.label, cancel)
+    if use_cache and result.ok:
+        cache.store(job.cache_key, job.output_path)
+    return result
+
+
+def run_chain(jobs, timeout=DEFAULT_TIMEOUT, cache=None, cancel=None):
+    #Run dependent jobs one after another, stops at the first failure
+    results = []
+    for job in jobs:
+        result = run_job(job, timeout, cache, cancel)
+        results.append(result)
+        if not result.ok:
+            break
+    return results
+
+
+class ConversionPool:
+    """
+    Bounded pool of worker threads for converter runs. The threads only wait on the
+    external processes, so the main thread can keep baking/exporting while they run.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_workers=DEFAULT_MAX_WORKERS, cache=None, cancel=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.cancel = cancel
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    def submit(self, job):
+        return self.executor.submit(run_job, job, self.timeout, self.cache, self.cancel)
+
+    def submit_chain(self, jobs):
+        #future result is a list of ConversionResults
+        return self.executor.submit(run_chain, list(jobs), self.timeout, self.cache, self.cancel)
+
+    def submit_call(self, function, *args):
+        #Any other function that runs converters, on the same bounded pool
+        return self.executor.submit(function, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+class StepResult:
+    """Outcome of one BackgroundExport step, error is set if it raised."""
+
+    def __init__(self, label, value=None, elapsed=0.0, error=None):
+        self.label = label
+        self.value = value
+        self.elapsed = elapsed
+        self.error = error
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+class BackgroundExport:
+    """
+    The converter runs and file writes of one export, run on worker threads so blender stays usable
+    while the operator polls them from a modal timer. Steps run in submission order, up to max_workers
+    at a time. Pass cancel_event to the converter runs of a step so cancel() also stops running
+    converters, steps that have not started yet are skipped.
+    """
+
+    def __init__(self, max_workers=1):
+        self.cancel_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.steps = []
+
+    def submit(self, label, function, *args):
+        future = self.executor.submit(_timed, function, *args)
+        self.steps.append((label, future))
+        return future
+
+    @property
+    def done(self):
+        return all(future.done() for _, future in self.steps)
+
+    @property
+    def progress(self):
+        #fraction of the steps that are finished
+        if not self.steps:
+            return 1.0
+        return sum(future.done() for _, future in self.steps) / len(self.steps)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def running(self):
+        return [label for label, future in self.steps if future.running()]
+
+    def cancel(self):
+        self.cancel_event.set()
+        for _, future in self.steps:
+            future.cancel()
+
+    def wait(self):
+        for _, future in self.steps:
+            try:
+                future.result()
+            except BaseException:
+                pass
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def results(self):
+        #StepResult of every finished step, in submission order
+        results = []
+        for label, future in self.steps:
+            if future.cancelled():
+                results.append(StepResult(label, error="cancelled"))
+            elif future.exception() is not None:
+                e = future.exception()
+                results.append(StepResult(label, error="{kind}: {e}".format(kind=type(e).__name__, e=e)))
+            else:
+                value, elapsed = future.result()
+                results.append(StepResult(label, value, elapsed))
+        return results
+
+
+def failed_results(results):
+    return [result for result in results if not result.ok]
+
+
+def report_results(operator, results):
+    #Report every result to the operator, returns True if all of them succeeded
+    for result in results:
+        if result.ok:
+            operator.report({"INFO"}, result.summary())
+        else:
+            operator.report({"ERROR"}, result.summary())
+    failed = failed_results(results)
+    if failed and len(results) > 1:
+        operator.report({"ERROR"}, "{n} of {total} conversions failed: {labels}".format(n=len(failed), total=len(results), labels=", ".join(result.label for result in failed)))
+    return not failed
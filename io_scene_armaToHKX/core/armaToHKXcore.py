@@ -41,8 +41,10 @@
 #Built using v0.0.9, might not work with future versions or pyffi updates
 
 import os
+import tempfile
 import bpy
 import mathutils
+import numpy as np
 
 import pyffi.spells.nif.fix
 
@@ -55,11 +57,24 @@ from io_scene_niftools.utils.singleton import NifOp, NifData
 from io_scene_niftools.utils.logging import NifLog, NifError
 from io_scene_niftools.modules.nif_export import scene
 
-import subprocess
-import time
+from io_scene_armaToHKX.core.armaToHKXsampling import sample_bone_keys, sample_visual_pose, iter_visual_pose
+from io_scene_armaToHKX.core.armaToHKXclip import ClipWriter, ClipReader, allocate_clip, export_text_dump
+from io_scene_armaToHKX.core.armaToHKXreduce import continuous_quaternions
+from io_scene_armaToHKX.core.armaToHKXpackfile import PackedArray, StreamedArray, save_packfile, skeleton_root, character_root, project_root, animation_root, spline_animation_root
+from io_scene_armaToHKX.core.armaToHKXspline import compress_tracks, encode_spline_blocks
+from io_scene_armaToHKX.core.armaToHKXreader import PackfileReader, read_skeletons
 
+#Shortest bone created on import, blender removes zero length bones
+MIN_BONE_LENGTH = 0.01
 
-def export_animation(filepath, transform_anim, dump_file_path):
+#Frames sampled and transformed at a time by the streamed export
+DEFAULT_STREAM_WINDOW = 256
+
+
+def export_animation(filepath, transform_anim, clip_file_path, reduction=None, dump_file_path=None):
+    #Writes the keys of every bone to the binary clip clip_file_path, which can also be a binary file-like object (e.g. io.BytesIO)
+    #reduction is an optional KeyReduction applied to the keys of every bone
+    #with dump_file_path the clip is also exported to the text dump
     # extract directory, base name, extension
     directory = os.path.dirname(filepath)
     filebase, fileext = os.path.splitext(os.path.basename(filepath))
@@ -78,25 +93,265 @@ def export_animation(filepath, transform_anim, dump_file_path):
 
     #NifLog.info("Extracting f-curve animation keys")
     print("Extracting f-curve animation keys")
-    if b_armature:
-        b_action = get_active_action(b_armature)
-        for b_bone in b_armature.data.bones:
-            print(b_bone.name)
-            export_transforms(b_armature, b_action, transform_anim, dump_file_path, b_bone)
-    
-    #addition, add end tag
-    with open(dump_file_path,'a') as f:
-        reportStr="[End]"
-        f.write(reportStr)
+    #the clip is opened once, the bone table is added when the writer closes
+    with ClipWriter(clip_file_path) as clip:
+        if b_armature:
+            b_action = get_active_action(b_armature)
+            for b_bone in b_armature.data.bones:
+                print(b_bone.name)
+                export_transforms(b_armature, b_action, transform_anim, clip, b_bone, reduction)
+
+    print("Created animation clip")
+    _export_clip_dump(clip, clip_file_path, dump_file_path)
+    if reduction is not None:
+        print(reduction.summary())
+    return
+
 
-    #NifLog.info("Created animation text file")
+def _export_clip_dump(clip, clip_file_path, dump_file_path):
+    #Optional text dump of a written clip
+    if dump_file_path is None:
+        return
+    export_text_dump(clip.file.getvalue() if not clip.owns_file else clip_file_path, dump_file_path)
     print("Created animation text file")
-    return
 
-def export_transforms(b_obj, b_action, transform_anim, dump_file_path, bone=None):
+class AnimationTracks:
+    """
+    Visual pose of the exported bones (skeleton order) sampled on every frame, in havok's bind space.
+    translations (n_frames, n_bones, 3), quaternions (n_frames, n_bones, 4) w x y z, continuous per bone,
+    uniform scales (n_frames, n_bones), times (n_frames,) in seconds from the first frame.
+    """
+
+    def __init__(self, bones, times, duration, frame_duration, translations, quaternions, scales):
+        self.bones = bones
+        #names are copied so the tracks can be written on a worker thread without touching blender data
+        self.bone_names = [bone.name for bone in bones]
+        self.times = times
+        self.duration = duration
+        self.frame_duration = frame_duration
+        self.translations = translations
+        self.quaternions = quaternions
+        self.scales = scales
+
+
+def sample_animation_tracks(context, frame_start=None, frame_end=None, skip_IK=True):
+    """
+    Samples the visual pose from the depsgraph (sample_visual_pose), no action is baked, and moves
+    every bone's keys to bind space. Returns AnimationTracks, None if there is no armature.
+    """
+    try: 
+        b_armature = math.get_armature()
+        #init bone orientation
+        math.set_bone_orientation(b_armature.data.niftools.axis_forward, b_armature.data.niftools.axis_up)
+    except AttributeError:
+        reportStr="No armature found in scene, cancelling."
+        print("ERROR "+reportStr)
+        return None
+
+    scene = context.scene
+    frame_start = scene.frame_start if frame_start is None else frame_start
+    frame_end = scene.frame_end if frame_end is None else frame_end
+    fps = scene.render.fps / scene.render.fps_base
+
+    print("Sampling visual pose")
+    samples = sample_visual_pose(context, b_armature, frame_start, frame_end)
+    bones = [bone for bone, parent_idx in build_bone_hierarchy(b_armature.data.bones, skip_IK)]
+    n_frames = len(samples.frames)
+    translations = np.empty((n_frames, len(bones), 3))
+    quaternions = np.empty((n_frames, len(bones), 4))
+    scales = np.empty((n_frames, len(bones)))
+    for i, bone in enumerate(bones):
+        bind_scale, bind_rot, bind_trans = math.decompose_srt(math.get_object_bind(bone))
+        transform = BindSpaceTransform(bone, bind_rot, bind_trans)
+        matrices = samples.bone_matrices(bone.name)
+        quaternions[:, i] = continuous_quaternions(transform.quaternions(_matrices_to_quaternions(matrices)))
+        translations[:, i] = transform.translations(matrices[:, :3, 3])
+        #uniform scale, taken from the x axis like the first scale curve in export_transforms
+        scales[:, i] = np.linalg.norm(matrices[:, :3, 0], axis=1)
+    return AnimationTracks(bones, (samples.frames - frame_start) / fps, (frame_end - frame_start) / fps, 1.0 / fps, translations, quaternions, scales)
+
+
+class StreamedAnimation:
+    """
+    An animation sampled by stream_animation_clip, the keys stay in the clip at clip_file_path.
+    Has the bones, bone_names, duration and frame_duration of AnimationTracks.
+    """
+
+    def __init__(self, clip_file_path, bones, duration, frame_duration):
+        self.clip_file_path = clip_file_path
+        self.bones = bones
+        self.bone_names = [bone.name for bone in bones]
+        self.duration = duration
+        self.frame_duration = frame_duration
+
+
+def stream_animation_clip(context, clip_file_path, frame_start=None, frame_end=None, skip_IK=True, window=DEFAULT_STREAM_WINDOW):
+    """
+    sample_animation_tracks for long clips: the clip is allocated at full length up front and the visual
+    pose is sampled, moved to bind space and written into the memory mapped clip window frames at a time,
+    so memory is bounded by the window and not by the clip length. Returns a StreamedAnimation, None if there is no armature.
+    """
+    try: 
+        b_armature = math.get_armature()
+        #init bone orientation
+        math.set_bone_orientation(b_armature.data.niftools.axis_forward, b_armature.data.niftools.axis_up)
+    except AttributeError:
+        reportStr="No armature found in scene, cancelling."
+        print("ERROR "+reportStr)
+        return None
+
+    scene = context.scene
+    frame_start = scene.frame_start if frame_start is None else frame_start
+    frame_end = scene.frame_end if frame_end is None else frame_end
+    fps = scene.render.fps / scene.render.fps_base
+
+    bones = [bone for bone, parent_idx in build_bone_hierarchy(b_armature.data.bones, skip_IK)]
+    transforms = []
+    for bone in bones:
+        bind_scale, bind_rot, bind_trans = math.decompose_srt(math.get_object_bind(bone))
+        transforms.append(BindSpaceTransform(bone, bind_rot, bind_trans))
+    animation = StreamedAnimation(clip_file_path, bones, (frame_end - frame_start) / fps, 1.0 / fps)
+    allocate_clip(clip_file_path, animation.bone_names, frame_end - frame_start + 1, animation.duration)
+
+    print("Streaming visual pose to "+clip_file_path+", "+str(window)+" frames at a time")
+    with ClipReader(clip_file_path, writable=True) as clip:
+        clip_tracks = clip.tracks()
+        written = 0
+        for samples in iter_visual_pose(context, b_armature, frame_start, frame_end, window):
+            rows = slice(written, written + len(samples.frames))
+            for i, bone in enumerate(bones):
+                track = clip_tracks[i]
+                matrices = samples.bone_matrices(bone.name)
+                quaternions = transforms[i].quaternions(_matrices_to_quaternions(matrices))
+                if written:
+                    #continuous with the last key of the previous window
+                    quaternions = continuous_quaternions(np.vstack((track.quaternions[written - 1], quaternions)))[1:]
+                else:
+                    quaternions = continuous_quaternions(quaternions)
+                track.times[rows] = (samples.frames - frame_start) / fps
+                track.translations[rows] = transforms[i].translations(matrices[:, :3, 3])
+                track.quaternions[rows] = quaternions
+                #uniform scale, taken from the x axis like sample_animation_tracks
+                track.scales[rows] = np.linalg.norm(matrices[:, :3, 0], axis=1)
+            written += len(samples.frames)
+            clip.flush()
+        del clip_tracks
+    return animation
+
+
+def pack_transforms(tracks):
+    #Interleaved hkQsTransforms (frame by frame, every bone) of the tracks as a PackedArray
+    n_frames, n_bones = tracks.scales.shape
+    packed = np.zeros((n_frames, n_bones, 12), dtype="<f4")
+    packed[:, :, 0:3] = tracks.translations
+    #havok's quaternion order is x y z w
+    packed[:, :, 4:7] = tracks.quaternions[:, :, 1:4]
+    packed[:, :, 7] = tracks.quaternions[:, :, 0]
+    packed[:, :, 8:11] = tracks.scales[:, :, np.newaxis]
+    return PackedArray(n_frames * n_bones, packed.tobytes())
+
+
+def marker_annotations(context, tracks, markers, frame_start=None):
+    #(time, text) annotations of the (frame, text) markers that fall within the sampled tracks
+    frame_start = context.scene.frame_start if frame_start is None else frame_start
+    annotations = (((frame - frame_start) * tracks.frame_duration, text) for frame, text in markers)
+    return sorted((time, text) for time, text in annotations if 0.0 <= time <= tracks.duration)
+
+
+def _clip_frames(clip_tracks, first, last):
+    #translations (n, n_bones, 3), quaternions (n, n_bones, 4) and scales (n, n_bones) of frames first to last of a clip
+    frames = slice(first, last + 1)
+    return (np.stack([track.translations[frames] for track in clip_tracks], axis=1),
+        np.stack([track.quaternions[frames] for track in clip_tracks], axis=1),
+        np.stack([track.scales[frames] for track in clip_tracks], axis=1))
+
+
+def clip_transforms(clip_file_path, window=DEFAULT_STREAM_WINDOW):
+    """
+    pack_transforms of a clip as a StreamedArray. The interleaved transforms are packed from the memory
+    mapped clip window frames at a time while the packfile is written, the whole array is never in memory.
+    """
+    with ClipReader(clip_file_path) as clip:
+        n_frames = len(clip.track(clip.bone_names[0]).times) if clip.bone_names else 0
+        n_bones = len(clip.bone_names)
+
+    def chunks():
+        with ClipReader(clip_file_path) as clip:
+            clip_tracks = clip.tracks()
+            for first in range(0, n_frames, window):
+                last = min(first + window, n_frames) - 1
+                translations, quaternions, scales = _clip_frames(clip_tracks, first, last)
+                packed = np.zeros((last - first + 1, n_bones, 12), dtype="<f4")
+                packed[:, :, 0:3] = translations
+                #havok's quaternion order is x y z w
+                packed[:, :, 4:7] = quaternions[:, :, 1:4]
+                packed[:, :, 7] = quaternions[:, :, 0]
+                packed[:, :, 8:11] = scales[:, :, np.newaxis]
+                yield packed.tobytes()
+
+    return StreamedArray(n_frames * n_bones, n_frames * n_bones * 48, chunks)
+
+
+def spool_chunks(spool, chunk_size=1 << 20):
+    #chunks() of a StreamedArray reading back a temporary file
+    def chunks():
+        spool.seek(0)
+        for chunk in iter(lambda: spool.read(chunk_size), b""):
+            yield chunk
+    return chunks
+
+
+def write_streamed_animation_hkx(hkx_files, skeleton_name, animation, annotations=(), spline_settings=None, window=DEFAULT_STREAM_WINDOW):
+    """
+    write_animation_hkx of a StreamedAnimation, read from its clip a window (uncompressed) or a block
+    (spline compressed) of frames at a time. Spline blocks are spooled to a temporary file and copied
+    into the packfiles from there, memory stays bounded by the window or block size.
+    """
+    report = None
+    if spline_settings is not None:
+        with tempfile.TemporaryFile() as spool:
+            with ClipReader(animation.clip_file_path) as clip:
+                clip_tracks = clip.tracks()
+                n_frames = len(clip_tracks[0].times) if clip_tracks else 0
+                spline, report = encode_spline_blocks(lambda first, last: _clip_frames(clip_tracks, first, last),
+                    n_frames, len(clip_tracks), animation.frame_duration, spool, spline_settings)
+                del clip_tracks
+            print(report.summary())
+            spline.data = StreamedArray(report.size, report.size, spool_chunks(spool))
+            root = spline_animation_root(skeleton_name, animation.bone_names, spline, annotations)
+            for hkx_file, skyrim_version in hkx_files:
+                save_packfile(hkx_file, root, skyrim_version)
+        return report
+    root = animation_root(skeleton_name, animation.bone_names, animation.duration, clip_transforms(animation.clip_file_path, window), annotations)
+    for hkx_file, skyrim_version in hkx_files:
+        save_packfile(hkx_file, root, skyrim_version)
+    return report
+
+
+def write_animation_hkx(hkx_files, skeleton_name, tracks, annotations=(), spline_settings=None):
+    """
+    Encodes AnimationTracks from sample_animation_tracks and writes the .hkx files, see marker_annotations for the annotations.
+    hkx_files: (filepath, skyrim_version) pairs. With spline_settings the animation is spline compressed, otherwise interleaved uncompressed.
+    Touches no blender data, so it can run on a worker thread. Returns the SplineReport, None when uncompressed.
+    """
+    track_names = tracks.bone_names
+    report = None
+    if spline_settings is not None:
+        spline, report = compress_tracks(tracks.translations, tracks.quaternions, tracks.scales, tracks.frame_duration, spline_settings)
+        print(report.summary())
+        root = spline_animation_root(skeleton_name, track_names, spline, annotations)
+    else:
+        root = animation_root(skeleton_name, track_names, tracks.duration, pack_transforms(tracks), annotations)
+    for hkx_file, skyrim_version in hkx_files:
+        save_packfile(hkx_file, root, skyrim_version)
+    return report
+
+
+def export_transforms(b_obj, b_action, transform_anim, dump, bone=None, reduction=None):
         """
         If bone == None, object level animation is exported.
         If a bone is given, skeletal animation is exported.
+        dump is a ClipWriter or an AnimationDumpWriter.
         """
 
         # b_action may be None, then nothing is done.
@@ -145,59 +400,141 @@ def export_transforms(b_obj, b_action, transform_anim, dump_file_path, bone=None
                     f"Incomplete key set {bonestr} for action {b_action.name}."
                     f"Ensure that if a bone is keyframed for a property, all channels are keyframed.")
 
-        # go over all fcurves collected above and transform and store all their keys
-        quat_curve = []
-        euler_curve = []
-        trans_curve = []
-        scale_curve = []
-        for frame, quat in transform_anim.iter_frame_key(quaternions, mathutils.Quaternion):
-            quat = math.export_keymat(bind_rot, quat.to_matrix().to_4x4(), bone).to_quaternion()
-            quat_curve.append((frame, quat))
-            
-        for frame, euler in transform_anim.iter_frame_key(eulers, mathutils.Euler):
-            keymat = math.export_keymat(bind_rot, euler.to_matrix().to_4x4(), bone)
-            euler = keymat.to_euler("XYZ", euler)
-            euler_curve.append((frame, euler))
-
-        for frame, trans in transform_anim.iter_frame_key(translations, mathutils.Vector):
-            keymat = math.export_keymat(bind_rot, mathutils.Matrix.Translation(trans), bone)
-            trans = keymat.to_translation() + bind_trans
-            trans_curve.append((frame, trans))
+        # read all keys of the bone in bulk and transform them all at once
+        bone_keys = sample_bone_keys(bone.name, exp_fcurves)
+        transform = BindSpaceTransform(bone, bind_rot, bind_trans)
+        #the bone header holds the number of quaternion keys, before the cut to a common length
+        key_count = len(bone_keys.quaternion) if bone_keys.quaternion is not None else 0
 
         #TODO
         #If user hasn't keyframed scales, i.e. just location + rotation, scales_curve will be empty and _NOTHING_ gets exported
         #design choice is to then set scales to 1.0, another option would be to throw an error
-        for frame, scale in transform_anim.iter_frame_key(scales, mathutils.Vector):
-            # just use the first scale curve and assume even scale over all curves
-            scale_curve.append((frame, scale[0]))
-            print(scale)
+        # just use the first scale curve and assume even scale over all curves
         #TODO cont
-        if len(scale_curve) != len(quat_curve):
+        if (len(bone_keys.scale) if bone_keys.scale is not None else 0) != key_count:
             reportStr="ArmaToHKX WARNING: scale curve empty, assuming scale 1.0 for all keyframes for bone "+bone.name
             print(reportStr)        
-            scale_curve=[]
-            for frame, quat in transform_anim.iter_frame_key(quaternions, mathutils.Quaternion):
-                scale_curve.append((frame, 1.0))
 
-        #Export it
-        with open(dump_file_path,'a') as f:
-            if not bone.parent: #root bone - will bug out if root siblings.
-                reportStr="[Begin] {Data Format = (Time, Location Keys [X Y Z], Rotation Keys 'Quaternions' [W X Y Z], Scale)}\n"
-                f.write(reportStr)
-                reportStr="{:10.6f}\n".format((stop_frame-start_frame)/transform_anim.fps)
-                f.write(reportStr)
-
-            reportStr="Bone_Name=['"+str(bone.name)+"']\n"
-            f.write(reportStr)
-            reportStr=str(len(quat_curve))+"\n"
-            f.write(reportStr)
-            for quat_val, trans_val, scale_val in zip(quat_curve, trans_curve, scale_curve):
-                if quat_val is None or trans_val is None:
-                    continue
-                reportStr='%s    %s %s %s    %s %s %s %s    %s\n' % ("{:10.6f}".format(quat_val[0]/transform_anim.fps), "{:10.6f}".format(trans_val[1].x), "{:10.6f}".format(trans_val[1].y), "{:10.6f}".format(trans_val[1].z), "{:10.6f}".format(quat_val[1].w),"{:10.6f}".format(quat_val[1].x),"{:10.6f}".format(quat_val[1].y),"{:10.6f}".format(quat_val[1].z),"{:10.6f}".format(scale_val[1]))
-                #reportStr="\t"+str(quat_val[0])+"\t"+str(trans_val[1].x)+"\t"+str(trans_val[1].y)+"\t"+str(trans_val[1].z)+"\t"+str(quat_val[1].w)+"\t"+str(quat_val[1].x)+"\t"+str(quat_val[1].y)+"\t"+str(quat_val[1].z)+"\t1.000000"+"\n"
-                f.write(reportStr)
+        #quaternion, location and scale keys paired by index and cut to a common length in one step
+        quat_frames, trans_keys, quat_keys, scale_keys = (np.asarray(keys, dtype=np.float64) for keys in bone_keys.aligned())
+        quat_keys = transform.quaternions(quat_keys)
+        trans_keys = transform.translations(trans_keys)
+
+        times = quat_frames/transform_anim.fps
+        if reduction is not None:
+            #one key mask for all channels
+            times, trans_keys, quat_keys, scale_keys = reduction.reduce_arrays(times, trans_keys, quat_keys, scale_keys)
+            key_count = len(quat_keys)
 
+        #Export it
+        if not bone.parent: #root bone - will bug out if root siblings.
+            dump.write_header((stop_frame-start_frame)/transform_anim.fps)
+        dump.write_bone(bone.name, times, trans_keys, quat_keys, scale_keys, key_count)
+
+
+
+def _quaternions_to_matrices(quats):
+    #(n, 4) w x y z -> (n, 4, 4) row major, same formula as mathutils Quaternion.to_matrix (no normalization)
+    q = quats * np.sqrt(2.0)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    mats = np.zeros((len(quats), 4, 4))
+    mats[:, 0, 0] = 1.0 - y*y - z*z
+    mats[:, 0, 1] = x*y - w*z
+    mats[:, 0, 2] = x*z + w*y
+    mats[:, 1, 0] = x*y + w*z
+    mats[:, 1, 1] = 1.0 - x*x - z*z
+    mats[:, 1, 2] = y*z - w*x
+    mats[:, 2, 0] = x*z - w*y
+    mats[:, 2, 1] = y*z + w*x
+    mats[:, 2, 2] = 1.0 - x*x - y*y
+    mats[:, 3, 3] = 1.0
+    return mats
+
+
+def _matrices_to_quaternions(mats):
+    #(n, 4, 4) -> (n, 4) w x y z, same branches as mathutils Matrix.to_quaternion
+    m = mats[:, :3, :3]
+    m = m / np.linalg.norm(m, axis=1, keepdims=True)
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+    quats = np.empty((len(mats), 4))
+
+    trace = 0.25 * (1.0 + m00 + m11 + m22)
+    branches = (
+        trace > np.finfo(np.float32).eps,
+        (m00 > m11) & (m00 > m22),
+        m11 > m22,
+        np.ones(len(mats), dtype=bool),
+    )
+    todo = np.ones(len(mats), dtype=bool)
+    for branch, selected in enumerate(branches):
+        rows = todo & selected
+        todo &= ~selected
+        if not rows.any():
+            continue
+        r = m[rows]
+        if branch == 0:
+            s = np.sqrt(trace[rows])
+            inv = 1.0 / (4.0 * s)
+            quats[rows] = np.stack((s, (r[:, 2, 1] - r[:, 1, 2]) * inv, (r[:, 0, 2] - r[:, 2, 0]) * inv, (r[:, 1, 0] - r[:, 0, 1]) * inv), axis=1)
+        elif branch == 1:
+            s = 2.0 * np.sqrt(1.0 + r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2])
+            quats[rows] = np.stack(((r[:, 2, 1] - r[:, 1, 2]) / s, 0.25 * s, (r[:, 0, 1] + r[:, 1, 0]) / s, (r[:, 0, 2] + r[:, 2, 0]) / s), axis=1)
+        elif branch == 2:
+            s = 2.0 * np.sqrt(1.0 + r[:, 1, 1] - r[:, 0, 0] - r[:, 2, 2])
+            quats[rows] = np.stack(((r[:, 0, 2] - r[:, 2, 0]) / s, (r[:, 0, 1] + r[:, 1, 0]) / s, 0.25 * s, (r[:, 1, 2] + r[:, 2, 1]) / s), axis=1)
+        else:
+            s = 2.0 * np.sqrt(1.0 + r[:, 2, 2] - r[:, 0, 0] - r[:, 1, 1])
+            quats[rows] = np.stack(((r[:, 1, 0] - r[:, 0, 1]) / s, (r[:, 0, 2] + r[:, 2, 0]) / s, (r[:, 1, 2] + r[:, 2, 1]) / s, 0.25 * s), axis=1)
+
+    #canonical result with a non-negative w, like blender
+    quats[quats[:, 0] < 0.0] *= -1.0
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+class BindSpaceTransform:
+    """
+    Bind-space correction of one bone applied to whole key arrays at once.
+    math.export_keymat(bind_rot, key_matrix, bone) is a product of matrices, so it is linear in
+    key_matrix and is sampled once on the 16 unit matrices. If that does not reproduce export_keymat
+    (a niftools version doing something else) the per-key mathutils path is used instead.
+    """
+
+    def __init__(self, bone, bind_rot, bind_trans):
+        self.bone = bone
+        self.bind_rot = bind_rot
+        self.bind_trans = np.array(bind_trans)
+        basis = []
+        for k in range(16):
+            unit = mathutils.Matrix(((0.0, 0.0, 0.0, 0.0),) * 4)
+            unit[k // 4][k % 4] = 1.0
+            basis.append(np.array(math.export_keymat(bind_rot, unit, bone)).reshape(16))
+        #column k is export_keymat of unit matrix k
+        self.operator = np.array(basis).T
+
+        test_matrix = mathutils.Euler((0.3, -0.7, 1.1)).to_matrix().to_4x4()
+        test_matrix.translation = (0.5, -0.25, 2.0)
+        expected = np.array(math.export_keymat(bind_rot, test_matrix, bone))
+        self.is_linear = np.allclose(self.apply(np.array(test_matrix)[np.newaxis])[0], expected, atol=1e-5)
+        if not self.is_linear:
+            print("ArmaToHKX WARNING: export_keymat is not linear, using per key transforms for bone "+bone.name)
+
+    def apply(self, key_matrices):
+        #export_keymat for (n, 4, 4) row major key matrices
+        return (key_matrices.reshape(-1, 16) @ self.operator.T).reshape(-1, 4, 4)
+
+    def quaternions(self, quats):
+        #(n, 4) w x y z bone keys -> (n, 4) w x y z in bind space
+        if not self.is_linear:
+            return np.array([tuple(math.export_keymat(self.bind_rot, mathutils.Quaternion(q).to_matrix().to_4x4(), self.bone).to_quaternion()) for q in quats.tolist()]).reshape(-1, 4)
+        return _matrices_to_quaternions(self.apply(_quaternions_to_matrices(quats)))
+
+    def translations(self, translations):
+        #(n, 3) locations -> (n, 3) translations in bind space, bind translation included
+        if not self.is_linear:
+            return np.array([tuple(math.export_keymat(self.bind_rot, mathutils.Matrix.Translation(t), self.bone).to_translation() + mathutils.Vector(self.bind_trans)) for t in translations.tolist()]).reshape(-1, 3)
+        mats = np.tile(np.identity(4), (len(translations), 1, 1))
+        mats[:, :3, 3] = translations
+        return self.apply(mats)[:, :3, 3] + self.bind_trans
 
 
 def get_active_action(b_obj):
@@ -209,75 +546,166 @@ def get_active_action(b_obj):
                     return b_action
 
 
-def export_skeleton(xml_file, hkx_name, skip_IK=True):
-    
-     
-    try: 
-        b_armature = math.get_armature()
-        #init bone orientation
-        math.set_bone_orientation(b_armature.data.niftools.axis_forward, b_armature.data.niftools.axis_up)
-    except AttributeError:
-        reportStr="No armature found in scene, cancelling."
-        print("ERROR "+reportStr)
-        return
-
-    Armature = b_armature.data
-
-    bone_parent_index = []
-    for i,CurrentBONE in enumerate(Armature.bones):
+def build_bone_hierarchy(bones, skip_IK=True):
+    """
+    Single ordered pass over bones, parents come before their children as in Armature.bones.
+    Returns (bone, parent index) for every exported bone, the parent index being the parent's own
+    position in the list. IK_ bones are skipped if skip_IK, and so is everything parented below them.
+    """
+    index_of = {}
+    hierarchy = []
+    for CurrentBONE in bones:
         if CurrentBONE.name[0:3]=="IK_" and skip_IK:
             continue
         if not CurrentBONE.parent:
-            bone_parent_index.append((CurrentBONE.name, -1))
+            parent_idx = -1
+        elif CurrentBONE.parent.name in index_of:
+            parent_idx = index_of[CurrentBONE.parent.name]
         else:
-            for name_index_tuple in bone_parent_index:
-                if CurrentBONE.parent.name == name_index_tuple[0]:
-                    bone_parent_index.append((CurrentBONE.name, name_index_tuple[1]+1))
-                else:
-                    continue #raise? bones parent is not in index, likely an IK bone that was skipped, and should therefore also be skipped
+            continue #bones parent is not in index, likely an IK bone that was skipped, and should therefore also be skipped
+        index_of[CurrentBONE.name] = len(hierarchy)
+        hierarchy.append((CurrentBONE, parent_idx))
+    return hierarchy
 
 
-    numBones = 0
-    bone_position_string=""
+def get_skeleton_data(skip_IK=True, b_armature=None):
+    #Collects the bone names, parent indices and reference pose of b_armature, default the scene armature
+    #reference pose is ((tx, ty, tz), (qx, qy, qz, qw), (sx, sy, sz)) per bone, havok's quaternion order
+    try: 
+        if b_armature is None:
+            b_armature = math.get_armature()
+        #init bone orientation
+        math.set_bone_orientation(b_armature.data.niftools.axis_forward, b_armature.data.niftools.axis_up)
+    except AttributeError:
+        reportStr="No armature found in scene, cancelling."
+        print("ERROR "+reportStr)
+        return None
 
-    for i,CurrentBONE in enumerate(Armature.bones):
-        for name_index_tuple in bone_parent_index:
-            if CurrentBONE.name == name_index_tuple[0]:
-                break
-        else:
-            continue #Not in bone_parent index, skip the bone
+    hierarchy = build_bone_hierarchy(b_armature.data.bones, skip_IK)
+    bone_parent_index = [(CurrentBONE.name, parent_idx) for CurrentBONE, parent_idx in hierarchy]
 
+    reference_pose = []
+    for CurrentBONE, parent_idx in hierarchy:
         object_nif_mat = math.get_object_bind(CurrentBONE)
         rotationQuat = object_nif_mat.to_quaternion()
-        rotation = ("{:.6f}".format(rotationQuat.w), "{:.6f}".format(rotationQuat.x), "{:.6f}".format(rotationQuat.y), "{:.6f}".format(rotationQuat.z))
-
-        translationVec = object_nif_mat.to_translation().to_tuple()
-        translation=("{:.6f}".format(translationVec[0]), "{:.6f}".format(translationVec[1]), "{:.6f}".format(translationVec[2]))
-        
-        scaleVec = object_nif_mat.to_scale().to_tuple()
-        scale = ("{:.6f}".format(scaleVec[0]), "{:.6f}".format(scaleVec[1]), "{:.6f}".format(scaleVec[2]))
-        
-        bone_position_string+="""
-        \t\t\t{translation}{rotation}{scale}""".format(translation=str(translation).replace("'",""),rotation=str(rotation).replace("'",""),scale=str(scale).replace("'",""))
-        
-        numBones+=1            
-
-
-
-
-    bone_declarations = ""
-    bone_parent_index_string=""
-
-    for name,parent_idx in bone_parent_index:
-        bone_declarations+="""
-                    <hkobject>
-                        <hkparam name="name">{bone_name}</hkparam>
-                        <hkparam name="lockTranslation">true</hkparam>
-                    </hkobject>
-    """.format(bone_name=name)
-        bone_parent_index_string+="""{index} """.format(index=parent_idx)
-        
-    textblock = """<?xml version="1.0" encoding="ascii"?>
+        reference_pose.append((object_nif_mat.to_translation().to_tuple(),
+                               (rotationQuat.x, rotationQuat.y, rotationQuat.z, rotationQuat.w),
+                               object_nif_mat.to_scale().to_tuple()))
+
+    return bone_parent_index, reference_pose
+
+
+def write_skeleton_hkx(hkx_file, hkx_name, skeleton_data, skyrim_version):
+    #Writes the (bone_parent_index, reference_pose) of get_skeleton_data, touches no blender data so it can run on a worker thread
+    bone_parent_index, reference_pose = skeleton_data
+    root = skeleton_root(hkx_name.replace(".hkx",""), [name for name, _ in bone_parent_index], [parent_idx for _, parent_idx in bone_parent_index], reference_pose)
+    save_packfile(hkx_file, root, skyrim_version)
+
+
+def skeleton_bind_matrices(parent_indices, reference_pose):
+    """
+    Armature space bind matrices (n, 4, 4) row major of a skeleton read from .hkx, the local reference
+    pose ((tx, ty, tz), (qx, qy, qz, qw), (sx, sy, sz)) chained down the hierarchy one depth at a time.
+    """
+    n_bones = len(reference_pose)
+    translations = np.array([translation for translation, _, _ in reference_pose], dtype=np.float64).reshape(n_bones, 3)
+    quats = np.array([(rotation[3], rotation[0], rotation[1], rotation[2]) for _, rotation, _ in reference_pose], dtype=np.float64).reshape(n_bones, 4)
+    scales = np.array([scale for _, _, scale in reference_pose], dtype=np.float64).reshape(n_bones, 3)
+    local = _quaternions_to_matrices(quats / np.linalg.norm(quats, axis=1, keepdims=True))
+    local[:, :3, :3] *= scales[:, np.newaxis, :]
+    local[:, :3, 3] = translations
+
+    parents = np.asarray(parent_indices, dtype=np.int64)
+    if len(parents) != n_bones or np.any((parents < -1) | (parents >= n_bones)):
+        raise ValueError("Parent indices do not match the {n} bones".format(n=n_bones))
+    depth = np.full(n_bones, -1, dtype=np.int64)
+    for b in range(n_bones):
+        chain = []
+        while b != -1 and depth[b] < 0:
+            if b in chain:
+                raise ValueError("Bone hierarchy has a loop")
+            chain.append(b)
+            b = parents[b]
+        d = -1 if b == -1 else depth[b]
+        for c in reversed(chain):
+            d += 1
+            depth[c] = d
+
+    armature = local.copy()
+    for d in range(1, depth.max() + 1 if n_bones else 0):
+        level = np.nonzero(depth == d)[0]
+        armature[level] = armature[parents[level]] @ local[level]
+    return armature
+
+
+def _bone_lengths(heads, parent_indices):
+    #Distance to the closest child head, bones without children get their parent's length
+    n_bones = len(heads)
+    parents = np.asarray(parent_indices, dtype=np.int64)
+    lengths = np.full(n_bones, np.inf)
+    children = np.nonzero(parents >= 0)[0]
+    distances = np.linalg.norm(heads[children] - heads[parents[children]], axis=1)
+    valid = distances >= MIN_BONE_LENGTH
+    np.minimum.at(lengths, parents[children[valid]], distances[valid])
+    default = np.median(lengths[np.isfinite(lengths)]) if np.isfinite(lengths).any() else 1.0
+    for b in range(n_bones):
+        if not np.isfinite(lengths[b]):
+            lengths[b] = lengths[parents[b]] if parents[b] >= 0 and np.isfinite(lengths[parents[b]]) else default
+    return lengths
+
+
+def import_skeleton_hkx(context, filepath, import_all=False):
+    """
+    Creates an armature from the first skeleton (or every skeleton if import_all) of a binary
+    skeleton .hkx, LE or SSE. Returns the created armature objects.
+    """
+    with PackfileReader(filepath) as reader:
+        skeletons = read_skeletons(reader)
+    if not skeletons:
+        raise ValueError(os.path.basename(filepath)+" holds no skeleton")
+    if not import_all:
+        skeletons = skeletons[:1]
+    return [create_armature(context, skeleton) for skeleton in skeletons]
+
+
+def create_armature(context, skeleton):
+    #Armature object from a reader SkeletonData, the inverse of get_skeleton_data
+    b_armature_data = bpy.data.armatures.new(skeleton.name or "skeleton")
+    b_armature_obj = bpy.data.objects.new(b_armature_data.name, b_armature_data)
+    context.collection.objects.link(b_armature_obj)
+
+    #nif bind -> blender bind is a multiplication with the bone orientation correction on the right
+    math.set_bone_orientation(b_armature_data.niftools.axis_forward, b_armature_data.niftools.axis_up)
+    correction = np.array(math.nif_bind_to_blender_bind(mathutils.Matrix.Identity(4)))
+    matrices = skeleton_bind_matrices(skeleton.parent_indices, skeleton.reference_pose) @ correction
+    lengths = _bone_lengths(matrices[:, :3, 3], skeleton.parent_indices)
+
+    if context.object is not None and context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for obj in context.selected_objects:
+        obj.select_set(False)
+    b_armature_obj.select_set(True)
+    context.view_layer.objects.active = b_armature_obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    try:
+        edit_bones = b_armature_data.edit_bones
+        b_edit_bones = []
+        for name, matrix, length in zip(skeleton.bone_names, matrices, lengths):
+            b_edit_bone = edit_bones.new(name)
+            #the matrix setter keeps the bone length, so the tail comes first
+            b_edit_bone.tail = (0.0, float(length), 0.0)
+            b_edit_bone.matrix = mathutils.Matrix(matrix.tolist())
+            b_edit_bones.append(b_edit_bone)
+        for b_edit_bone, parent_idx in zip(b_edit_bones, skeleton.parent_indices):
+            if parent_idx >= 0:
+                b_edit_bone.parent = b_edit_bones[parent_idx]
+    finally:
+        bpy.ops.object.mode_set(mode='OBJECT')
+    return b_armature_obj
+
+
+#skeleton .xml template, written piece by piece around the per bone parts
+SKELETON_XML_HEAD = """<?xml version="1.0" encoding="ascii"?>
     <hkpackfile classversion="8" contentsversion="hk_2010.2.0-r1" toplevelobject="#0044">
 
         <hksection name="__data__">
@@ -296,11 +724,22 @@ def export_skeleton(xml_file, hkx_name, skip_IK=True):
                 <!-- referenceCount SERIALIZE_IGNORED -->
                 <hkparam name="name">{skeleton_name}</hkparam>
                 <hkparam name="parentIndices" numelements="{nBones}">
-                    {bone_parent_index_string}
+                    """
+SKELETON_XML_BONES = """
                 </hkparam>
-                <hkparam name="bones" numelements="{nBones}">{bone_declarations}
+                <hkparam name="bones" numelements="{nBones}">"""
+SKELETON_XML_BONE = """
+                    <hkobject>
+                        <hkparam name="name">{bone_name}</hkparam>
+                        <hkparam name="lockTranslation">true</hkparam>
+                    </hkobject>
+    """
+SKELETON_XML_POSE = """
                 </hkparam>
-                <hkparam name="referencePose" numelements="{nBones}">{bone_positions}
+                <hkparam name="referencePose" numelements="{nBones}">"""
+SKELETON_XML_POSE_ENTRY = """
+        \t\t\t({:.6f}, {:.6f}, {:.6f})({:.6f}, {:.6f}, {:.6f}, {:.6f})({:.6f}, {:.6f}, {:.6f})"""
+SKELETON_XML_TAIL = """
                 </hkparam>
                 <hkparam name="referenceFloats" numelements="0"></hkparam>
                 <hkparam name="floatSlots" numelements="0"></hkparam>
@@ -336,10 +775,32 @@ def export_skeleton(xml_file, hkx_name, skip_IK=True):
 
         </hksection>
 
-    </hkpackfile>""".format(nBones = str(numBones),bone_positions=bone_position_string, bone_declarations=bone_declarations, bone_parent_index_string=bone_parent_index_string, skeleton_name=hkx_name.replace(".hkx",""))
+    </hkpackfile>"""
+
 
+def export_skeleton(xml_file, hkx_name, skip_IK=True, b_armature=None):
+    #Returns the (bone_parent_index, reference_pose) written, None if there is no armature
+    skeleton_data = get_skeleton_data(skip_IK, b_armature)
+    if skeleton_data is None:
+        return None
+    bone_parent_index, reference_pose = skeleton_data
+
+    #streamed straight into the file, nothing is grown per bone
     with open(xml_file,"w") as f:
-        f.write(textblock)
+        write_skeleton_xml(f, hkx_name, bone_parent_index, reference_pose)
+    return skeleton_data
+
+
+def write_skeleton_xml(f, hkx_name, bone_parent_index, reference_pose):
+    #Writes the skeleton .xml to the text file-like object f
+    numBones = len(bone_parent_index)
+    f.write(SKELETON_XML_HEAD.format(nBones=numBones, skeleton_name=hkx_name.replace(".hkx","")))
+    f.writelines("{index} ".format(index=parent_idx) for name, parent_idx in bone_parent_index)
+    f.write(SKELETON_XML_BONES.format(nBones=numBones))
+    f.writelines(SKELETON_XML_BONE.format(bone_name=name) for name, parent_idx in bone_parent_index)
+    f.write(SKELETON_XML_POSE.format(nBones=numBones))
+    f.writelines(SKELETON_XML_POSE_ENTRY.format(*translation, *rotation, *scale) for translation, rotation, scale in reference_pose)
+    f.write(SKELETON_XML_TAIL)
 
 
 def export_project(xml_file, skeleton_hkx_name):
@@ -394,6 +855,11 @@ def export_project(xml_file, skeleton_hkx_name):
     return
 
 
+def export_project_hkx(hkx_file, skeleton_hkx_name, skyrim_version):
+    #Writes the project straight to a binary .hkx, no hkxcmd needed
+    save_packfile(hkx_file, project_root(skeleton_hkx_name), skyrim_version)
+
+
 def export_character(xml_file, character_hkx_name, skeleton_hkx_name, behavior_hkx_name):
     #Simple function to export a character file
     textblock = """<?xml version="1.0" encoding="ascii"?>
@@ -477,4 +943,9 @@ def export_character(xml_file, character_hkx_name, skeleton_hkx_name, behavior_h
     with open(xml_file,"w") as f:
         f.write(textblock)
         
-    return
\ No newline at end of file
+    return
+
+
+def export_character_hkx(hkx_file, character_hkx_name, skeleton_hkx_name, behavior_hkx_name, skyrim_version):
+    #Writes the character straight to a binary .hkx, no hkxcmd needed
+    save_packfile(hkx_file, character_root(character_hkx_name.replace(".hkx",""), skeleton_hkx_name, behavior_hkx_name), skyrim_version)
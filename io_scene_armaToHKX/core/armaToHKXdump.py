@@ -0,0 +1,119 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Writer for the animation text dump (time, location, rotation, scale per key and bone).
+#The target is opened once, bone blocks are formatted from whole arrays at a time.
+
+import io
+import numpy as np
+
+#Bytes collected before they are handed to the file
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+DUMP_HEADER = "[Begin] {Data Format = (Time, Location Keys [X Y Z], Rotation Keys 'Quaternions' [W X Y Z], Scale)}\n"
+DUMP_FOOTER = "[End]"
+_KEY_FORMAT = "%10.6f    %10.6f %10.6f %10.6f    %10.6f %10.6f %10.6f %10.6f    %10.6f\n"
+
+
+class AnimationDumpWriter:
+    """
+    Streams the dump to a file path or to a text file-like object such as io.StringIO.
+    Use as a context manager, close() writes the end tag and closes the file exactly once.
+    """
+
+    def __init__(self, target, buffer_size=DEFAULT_BUFFER_SIZE):
+        if isinstance(target, (str, bytes)) or hasattr(target, "__fspath__"):
+            self.file = open(target, "w")
+            self.owns_file = True
+        else:
+            self.file = target
+            self.owns_file = False
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.buffered = 0
+        self.closed = False
+
+    @classmethod
+    def in_memory(cls):
+        return cls(io.StringIO())
+
+    def _write(self, text):
+        self.chunks.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.file.write("".join(self.chunks))
+            self.chunks = []
+            self.buffered = 0
+
+    def write_header(self, duration):
+        self._write(DUMP_HEADER + "{:10.6f}\n".format(duration))
+
+    def write_bone(self, name, times, translations, quaternions, scales, key_count=None):
+        """
+        times (n,), translations (n, 3), quaternions (n, 4) w x y z and scales (n,).
+        key_count is the number written in the bone header, defaults to n.
+        """
+        n = min(len(times), len(translations), len(quaternions), len(scales))
+        self._write("Bone_Name=['"+str(name)+"']\n" + str(n if key_count is None else key_count) + "\n")
+        if n == 0:
+            return
+        rows = np.column_stack((times[:n], translations[:n], quaternions[:n], scales[:n]))
+        self._write((_KEY_FORMAT * n) % tuple(rows.ravel().tolist()))
+
+    def getvalue(self):
+        #Dump text of an in-memory writer
+        self.flush()
+        return self.file.getvalue()
+
+    def close(self):
+        if self.closed:
+            return
+        self._write(DUMP_FOOTER)
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,192 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Headless batch exporter.
+#
+#Driver, run with any python 3 (or blender's):
+#   python armaToHKXheadless.py jobs.json [--blender PATH] [--workers N] [--timeout SECONDS]
+#Every job is exported by its own "blender --background <file.blend> --python armaToHKXheadless.py -- --job <json>"
+#worker process, up to --workers of them at a time. The worker runs the regular armaToHKX operators, so the
+#export_skeleton/export_character/export_project code paths are the same as in the UI.
+#
+#jobs.json:
+#   {
+#     "blender": "C:/Program Files/Blender Foundation/Blender 3.3/blender.exe",
+#     "settings": {"hkxcmd": "...", "convertKF": "...", "path": "skeleton_LE.hkx", "workdir": "...", "native_writer": false},
+#     "jobs": [
+#       {"blend": "door01.blend", "operator": "project", "output": "out/door01/door01.hkx", "options": {"skyrim_version": "SSE"}},
+#       {"blend": "door01.blend", "operator": "animation", "output": "out/door01/Animations/open.hkx", "armature": "DoorRig"}
+#     ]
+#   }
+#"settings" are applied to the scene's armaToHKX properties, "options" are passed to the operator.
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+RESULT_MARKER = "ARMATOHKX_RESULT "
+DEFAULT_JOB_TIMEOUT = 600.0
+
+#job "operator" -> bpy.ops operator of the addon
+OPERATORS = {
+    "skeleton": ("object", "armature_to_hkx"),
+    "project": ("export_project", "file_names"),
+    "animation": ("animation", "animation_to_hkx"),
+}
+
+
+def load_job_list(job_file):
+    with open(job_file) as f:
+        job_list = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(job_file))
+    jobs = []
+    for job in job_list.get("jobs", []):
+        if job.get("operator") not in OPERATORS:
+            raise ValueError("Unknown operator {op!r} in job for {blend}, expected one of {ops}".format(op=job.get("operator"), blend=job.get("blend"), ops=", ".join(OPERATORS)))
+        job = dict(job)
+        #paths in the job list are relative to the job file
+        job["blend"] = os.path.join(base_dir, job["blend"])
+        job["output"] = os.path.join(base_dir, job["output"])
+        job.setdefault("settings", job_list.get("settings", {}))
+        jobs.append(job)
+    return job_list, jobs
+
+
+def run_worker(blender, job, timeout=DEFAULT_JOB_TIMEOUT):
+    #Exports one job in a background blender process, returns the worker's result dict
+    cmd = [blender, "--background", job["blend"], "--python", os.path.abspath(__file__), "--", "--job", json.dumps(job)]
+    start = time.perf_counter()
+    result = {"blend": job["blend"], "operator": job["operator"], "output": job["output"], "ok": False}
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, universal_newlines=True, timeout=timeout)
+        for line in proc.stdout.splitlines():
+            if line.startswith(RESULT_MARKER):
+                result.update(json.loads(line[len(RESULT_MARKER):]))
+                break
+        else:
+            result["error"] = "worker exited with code {code} without a result: {tail}".format(code=proc.returncode, tail=" | ".join(proc.stdout.strip().splitlines()[-3:]))
+    except subprocess.TimeoutExpired:
+        result["error"] = "timed out after {t:g}s".format(t=timeout)
+    except OSError as e:
+        result["error"] = "could not start blender: "+str(e)
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(blender, jobs, workers, timeout=DEFAULT_JOB_TIMEOUT):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run_worker, blender, job, timeout) for job in jobs]
+        results = []
+        for future in futures:
+            result = future.result()
+            status = "OK  " if result["ok"] else "FAIL"
+            print("{status} {op:9s} {blend} -> {output} ({t:.1f}s){error}".format(status=status, op=result["operator"], blend=result["blend"], output=result["output"], t=result["elapsed"], error="" if result["ok"] else ": "+result.get("error", "")))
+            results.append(result)
+    return results, time.perf_counter() - start
+
+
+def print_summary(results, wall_time, workers):
+    n_ok = sum(1 for result in results if result["ok"])
+    busy_time = sum(result["elapsed"] for result in results)
+    print("")
+    print("armaToHKX batch: {ok}/{total} jobs exported, {failed} failed".format(ok=n_ok, total=len(results), failed=len(results)-n_ok))
+    print("wall time {wall:.1f}s with {workers} workers, {rate:.1f} jobs/min, {busy:.1f}s of worker time ({speedup:.1f}x)".format(
+        wall=wall_time, workers=workers, rate=60.0*len(results)/wall_time if wall_time > 0 else 0.0, busy=busy_time, speedup=busy_time/wall_time if wall_time > 0 else 0.0))
+    for operator in OPERATORS:
+        times = [result["elapsed"] for result in results if result["operator"] == operator]
+        if times:
+            print("  {op:9s} {n:4d} jobs, {avg:.1f}s average".format(op=operator, n=len(times), avg=sum(times)/len(times)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export skeletons, projects and animations of many .blend files with armaToHKX")
+    parser.add_argument("job_file", help="json job list")
+    parser.add_argument("--blender", help="blender executable, overrides the job list")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="number of blender processes to run at the same time")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_JOB_TIMEOUT, help="seconds a single job may take")
+    args = parser.parse_args(argv)
+
+    job_list, jobs = load_job_list(args.job_file)
+    blender = args.blender or job_list.get("blender", "blender")
+    results, wall_time = run_batch(blender, jobs, args.workers, args.timeout)
+    print_summary(results, wall_time, args.workers)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+def worker_main(job):
+    #Runs inside blender --background with the job's .blend loaded
+    import bpy
+    import addon_utils
+
+    result = {"ok": False}
+    try:
+        #user preferences are loaded, so niftools is available, make sure armaToHKX is enabled as well
+        addon_utils.enable("io_scene_armaToHKX", default_set=True)
+        scene = bpy.context.scene
+        for name, value in job.get("settings", {}).items():
+            setattr(scene.armaToHKX, name, value)
+
+        if job.get("armature"):
+            arm_obj = bpy.data.objects[job["armature"]]
+            for obj in bpy.context.view_layer.objects:
+                obj.select_set(obj == arm_obj)
+            bpy.context.view_layer.objects.active = arm_obj
+
+        os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        category, name = OPERATORS[job["operator"]]
+        operator = getattr(getattr(bpy.ops, category), name)
+        status = operator(filepath=job["output"], **job.get("options", {}))
+        result["ok"] = "FINISHED" in status
+        if not result["ok"]:
+            result["error"] = "operator returned "+", ".join(sorted(status))
+    except Exception as e:
+        result["error"] = "{kind}: {e}".format(kind=type(e).__name__, e=e)
+    print(RESULT_MARKER + json.dumps(result))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    if "--" in sys.argv and "--job" in sys.argv[sys.argv.index("--"):]:
+        worker_args = sys.argv[sys.argv.index("--") + 1:]
+        worker_main(json.loads(worker_args[worker_args.index("--job") + 1]))
+    else:
+        sys.exit(main())
@@ -0,0 +1,178 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Export of every armature of the scene, or of a collection, in one run. Each armature gets its own
+#project folder (project, character, skeleton and animations). Blender side work runs on the main
+#thread armature by armature, all hkxcmd and convertKF runs share one ConversionPool.
+
+import os
+import time
+import bpy
+
+from io_scene_armaToHKX.core.armaToHKXcore import get_skeleton_data, export_skeleton, write_skeleton_hkx, export_character, export_character_hkx, export_project, export_project_hkx
+from io_scene_armaToHKX.core.armaToHKXconverter import ConversionJob, ConversionPool, hkxcmd_convert_cmd
+from io_scene_armaToHKX.core.armaToHKXcache import ExportCache
+from io_scene_armaToHKX.core.armaToHKXbatch import collect_clips, submit_clips, wait_clips, write_manifest
+
+PROJECT_FOLDERS = ("Animations", "Behaviors", "CharacterAssets", "Characters")
+
+
+def collect_armatures(scene, collection=None):
+    #Every armature object of the scene, or of collection and its children
+    objects = collection.all_objects if collection is not None else scene.objects
+    return [obj for obj in objects if obj.type == 'ARMATURE']
+
+
+class ArmatureExport:
+    """Output paths and pending conversions of one armature's project folder."""
+
+    def __init__(self, arm_obj, out_dir, skyrim_version):
+        self.arm_obj = arm_obj
+        self.name = bpy.path.clean_name(arm_obj.name)
+        self.folder = os.path.join(out_dir, self.name)
+        self.project_path = os.path.join(self.folder, self.name+".hkx")
+        self.character_path = os.path.join(self.folder, "Characters", self.name+".hkx")
+        self.skeleton_path = os.path.join(self.folder, "CharacterAssets", "skeleton.hkx")
+        #convertKF needs a LE skeleton
+        self.LE_skeleton_path = self.skeleton_path if skyrim_version == "LE" else self.skeleton_path.replace(".hkx", "_LE.hkx")
+        self.animations_dir = os.path.join(self.folder, "Animations")
+        self.skeleton_data = None
+        self.jobs = []          #(ConversionJob, future) of skeleton, character and project
+        self.entries = []
+        self.pending = []
+        self.errors = []
+        self.start = time.perf_counter()
+
+    def make_folders(self):
+        for folder in PROJECT_FOLDERS:
+            os.makedirs(os.path.join(self.folder, folder), exist_ok=True)
+
+
+def _select_only(context, arm_obj):
+    #niftools exports the selected/active armature
+    for obj in context.view_layer.objects:
+        obj.select_set(obj == arm_obj)
+    context.view_layer.objects.active = arm_obj
+
+
+def _project_job(label, hkxcmd, xml_path, out_path, skyrim_version, cache):
+    #hkxcmd conversion of a generated xml, looked up in / stored to cache when there is one
+    key = ExportCache.conversion_key(xml_path, skyrim_version, hkxcmd) if cache is not None else None
+    return ConversionJob(label, hkxcmd_convert_cmd(hkxcmd, xml_path, out_path, skyrim_version), out_path, key)
+
+
+def _submit_project(context, export, pool, skyrim_version, workdir, native_writer, cache=None):
+    #Skeleton, character and project of one armature, returns the future of the LE skeleton conversion
+    character_name = os.path.basename(export.character_path)
+    skeleton_name = os.path.basename(export.skeleton_path)
+    behavior_name = export.name+"_behavior.hkx"
+    if native_writer:
+        export.skeleton_data = get_skeleton_data(b_armature=export.arm_obj)
+        if export.skeleton_data is None:
+            export.errors.append("no skeleton data")
+            return None
+        #no external process involved, these take milliseconds
+        write_skeleton_hkx(export.skeleton_path, skeleton_name, export.skeleton_data, skyrim_version)
+        if export.LE_skeleton_path != export.skeleton_path:
+            write_skeleton_hkx(export.LE_skeleton_path, skeleton_name, export.skeleton_data, "LE")
+        export_character_hkx(export.character_path, character_name, skeleton_name, behavior_name, skyrim_version)
+        export_project_hkx(export.project_path, character_name, skyrim_version)
+        return None
+
+    xml_prefix = os.path.join(workdir, export.name+"_")
+    export.skeleton_data = export_skeleton(xml_prefix+"skeleton.xml", skeleton_name, b_armature=export.arm_obj)
+    if export.skeleton_data is None:
+        export.errors.append("no skeleton data")
+        return None
+    export_character(xml_prefix+"character.xml", character_name, skeleton_name, behavior_name)
+    export_project(xml_prefix+"project.xml", character_name)
+
+    hkxcmd = context.scene.armaToHKX.hkxcmd
+    jobs = [_project_job(export.name+" skeleton (LE)", hkxcmd, xml_prefix+"skeleton.xml", export.LE_skeleton_path, "LE", cache)]
+    if export.LE_skeleton_path != export.skeleton_path:
+        jobs.append(_project_job(export.name+" skeleton ("+skyrim_version+")", hkxcmd, xml_prefix+"skeleton.xml", export.skeleton_path, skyrim_version, cache))
+    jobs.append(_project_job(export.name+" character ("+skyrim_version+")", hkxcmd, xml_prefix+"character.xml", export.character_path, skyrim_version, cache))
+    jobs.append(_project_job(export.name+" project ("+skyrim_version+")", hkxcmd, xml_prefix+"project.xml", export.project_path, skyrim_version, cache))
+    export.jobs = [(job, pool.submit(job)) for job in jobs]
+    return export.jobs[0][1]
+
+
+def export_armatures(context, armatures, out_dir, skyrim_version="SSE", source='NLA', bake=True, max_workers=1, timeout=60.0, reduction=None, cache=None):
+    """
+    Exports the project, character, skeleton and the clips (collect_clips with source) of every armature
+    into out_dir/<armature name>/. Skeleton, character and project conversions are queued first, so the
+    clips of an armature are converted with its own LE skeleton. Every conversion of every armature runs
+    on one ConversionPool of max_workers. Returns the ArmatureExports, with the per armature manifest written.
+    """
+    props = context.scene.armaToHKX
+    view_layer = context.view_layer
+    selection = [obj for obj in view_layer.objects if obj.select_get()]
+    active = view_layer.objects.active
+    exports = []
+    try:
+        with ConversionPool(timeout, max_workers, cache) as pool:
+            for arm_obj in armatures:
+                print("Exporting armature "+arm_obj.name)
+                export = ArmatureExport(arm_obj, out_dir, skyrim_version)
+                exports.append(export)
+                export.make_folders()
+                _select_only(context, arm_obj)
+                after = _submit_project(context, export, pool, skyrim_version, props.workdir, props.native_writer, cache)
+                if export.skeleton_data is None:
+                    continue
+                clips = collect_clips(arm_obj, source)
+                if not clips:
+                    print("No clips found for "+arm_obj.name)
+                    continue
+                kf_dir = os.path.join(props.workdir, export.name)
+                os.makedirs(kf_dir, exist_ok=True)
+                export.entries, export.pending = submit_clips(context, arm_obj, clips, export.animations_dir, pool, bake, timeout, reduction,
+                    skeleton_path=export.LE_skeleton_path, after=after, kf_dir=kf_dir)
+
+            for export in exports:
+                for job, future in export.jobs:
+                    result = future.result()
+                    if not result.ok:
+                        export.errors.append(result.summary())
+                wait_clips(export.pending)
+                if export.skeleton_data is not None:
+                    write_manifest(export.animations_dir, export.arm_obj, export.LE_skeleton_path, export.entries, time.perf_counter() - export.start)
+    finally:
+        for obj in view_layer.objects:
+            obj.select_set(obj in selection)
+        view_layer.objects.active = active
+    return exports
@@ -0,0 +1,667 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Pure python writer for hk_2010.2.0-r1 binary packfiles, the format hkxcmd produces.
+#Objects are described with HkObject and laid out from the HK_CLASSES member tables,
+#for either the WIN32 (LE, 4 byte pointers) or AMD64 (SSE, 8 byte pointers) layout.
+
+import struct
+
+CONTENTS_VERSION = "hk_2010.2.0-r1"
+FILE_VERSION = 8
+MAGIC = (0x57E0E057, 0x10C0C010)
+
+#Pointer size of each skyrim version, the only difference between the two layouts
+POINTER_SIZES = {
+    "LE": 4,
+    "SSE": 8,
+}
+
+#Section order in the file, the data section holds the objects
+CLASSNAMES_SECTION = 0
+TYPES_SECTION = 1
+DATA_SECTION = 2
+SECTION_NAMES = ("__classnames__", "__types__", "__data__")
+
+#hkArray capacityAndFlags bit telling havok the storage is owned by the packfile
+DONT_DEALLOCATE_FLAG = 0x80000000
+
+#Enum values used by the templates
+EVENT_MODE_IGNORE_FROM_GENERATOR = 2
+
+#hkaAnimation::AnimationType
+ANIMATION_TYPE_INTERLEAVED = 1
+ANIMATION_TYPE_SPLINE_COMPRESSED = 5
+
+#hkaAnimationBinding::BlendHint
+BLEND_HINT_NORMAL = 0
+
+
+class HkClass:
+    """Serialized layout of a havok class, members in declaration order."""
+
+    def __init__(self, name, signature, members, parent=None):
+        self.name = name
+        self.signature = signature
+        self.members = members
+        self.parent = parent
+
+
+class PackedArray:
+    """
+    Array elements already packed in the member layout (e.g. numpy .tobytes() of a large transform
+    array) and their count. Used instead of a list for arrays too large to pack element by element.
+    """
+
+    def __init__(self, count, data):
+        self.count = count
+        self.data = bytes(data)
+
+    def __len__(self):
+        return self.count
+
+
+class StreamedArray:
+    """
+    Array elements in the member layout produced in chunks while the file is written, for arrays too large
+    to hold in memory. chunks() returns an iterator over bytes and is called once for every file written,
+    size is the total number of bytes it yields. Streamed arrays are placed after all objects of the data section.
+    """
+
+    def __init__(self, count, size, chunks):
+        self.count = count
+        self.size = size
+        self.chunks = chunks
+
+    def __len__(self):
+        return self.count
+
+
+class HkObject:
+    """An instance of a havok class, members not given are written as zero/null/empty."""
+
+    def __init__(self, class_name, **members):
+        self.class_name = class_name
+        self.members = members
+
+    def __getitem__(self, name):
+        return self.members[name]
+
+
+#Member types:
+#  "vtable", "ptr", "string", "bool", "int8", "uint8", "int16", "uint16", "int32", "uint32",
+#  "real", "vector4", "qstransform", ("array", element type), ("struct", class name)
+#Arrays that are always written empty use None as element type.
+#SERIALIZE_IGNORED members are listed as well since they take up space in the layout.
+HK_CLASSES = {}
+
+def _register(name, signature, members, parent=None):
+    HK_CLASSES[name] = HkClass(name, signature, members, parent)
+
+#Packfiles always list these in __classnames__
+_register("hkClass", 0x75585EF6, [])
+_register("hkClassMember", 0x5C7EA4C2, [])
+_register("hkClassEnum", 0x8A3609CF, [])
+_register("hkClassEnumItem", 0xCE6F8A6C, [])
+
+_register("hkBaseObject", None, [
+    ("vtable", "vtable"),
+])
+_register("hkReferencedObject", None, [
+    ("memSizeAndFlags", "uint16"),
+    ("referenceCount", "int16"),
+], "hkBaseObject")
+
+_register("hkRootLevelContainerNamedVariant", None, [
+    ("name", "string"),
+    ("className", "string"),
+    ("variant", "ptr"),
+])
+_register("hkRootLevelContainer", 0x2772C11E, [
+    ("namedVariants", ("array", ("struct", "hkRootLevelContainerNamedVariant"))),
+])
+
+_register("hkMemoryResourceContainer", 0x4762F92A, [
+    ("name", "string"),
+    ("parent", "ptr"),
+    ("resourceHandles", ("array", "ptr")),
+    ("children", ("array", "ptr")),
+], "hkReferencedObject")
+
+_register("hkaBone", None, [
+    ("name", "string"),
+    ("lockTranslation", "bool"),
+])
+_register("hkaSkeleton", 0x366E8220, [
+    ("name", "string"),
+    ("parentIndices", ("array", "int16")),
+    ("bones", ("array", ("struct", "hkaBone"))),
+    ("referencePose", ("array", "qstransform")),
+    ("referenceFloats", ("array", "real")),
+    ("floatSlots", ("array", "string")),
+    ("localFrames", ("array", None)),
+], "hkReferencedObject")
+_register("hkaAnimationContainer", 0x8DC20333, [
+    ("skeletons", ("array", "ptr")),
+    ("animations", ("array", "ptr")),
+    ("bindings", ("array", "ptr")),
+    ("attachments", ("array", "ptr")),
+    ("skins", ("array", "ptr")),
+], "hkReferencedObject")
+
+_register("hkaAnnotationTrackAnnotation", None, [
+    ("time", "real"),
+    ("text", "string"),
+])
+_register("hkaAnnotationTrack", None, [
+    ("trackName", "string"),
+    ("annotations", ("array", ("struct", "hkaAnnotationTrackAnnotation"))),
+])
+_register("hkaAnimation", None, [
+    ("type", "int32"),
+    ("duration", "real"),
+    ("numberOfTransformTracks", "int32"),
+    ("numberOfFloatTracks", "int32"),
+    ("extractedMotion", "ptr"),
+    ("annotationTracks", ("array", ("struct", "hkaAnnotationTrack"))),
+], "hkReferencedObject")
+_register("hkaInterleavedUncompressedAnimation", 0x930AF031, [
+    ("transforms", ("array", "qstransform")),
+    ("floats", ("array", "real")),
+], "hkaAnimation")
+_register("hkaSplineCompressedAnimation", 0x792EE0BB, [
+    ("numFrames", "int32"),
+    ("numBlocks", "int32"),
+    ("maxFramesPerBlock", "int32"),
+    ("maskAndQuantizationSize", "int32"),
+    ("blockDuration", "real"),
+    ("blockInverseDuration", "real"),
+    ("frameDuration", "real"),
+    ("blockOffsets", ("array", "uint32")),
+    ("floatBlockOffsets", ("array", "uint32")),
+    ("transformOffsets", ("array", "uint32")),
+    ("floatOffsets", ("array", "uint32")),
+    ("data", ("array", "uint8")),
+    ("endian", "int32"),
+], "hkaAnimation")
+_register("hkaAnimationBinding", 0x66EAC971, [
+    ("originalSkeletonName", "string"),
+    ("animation", "ptr"),
+    ("transformTrackToBoneIndices", ("array", "int16")),
+    ("floatTrackToFloatSlotIndices", ("array", "int16")),
+    ("blendHint", "int8"),
+], "hkReferencedObject")
+
+_register("hkbProjectStringData", 0x076AD60A, [
+    ("animationFilenames", ("array", "string")),
+    ("behaviorFilenames", ("array", "string")),
+    ("characterFilenames", ("array", "string")),
+    ("eventNames", ("array", "string")),
+    ("animationPath", "string"),
+    ("behaviorPath", "string"),
+    ("characterPath", "string"),
+    ("fullPathToSource", "string"),
+    ("rootPath", "string"),
+], "hkReferencedObject")
+_register("hkbProjectData", 0x13A39BA7, [
+    ("worldUpWS", "vector4"),
+    ("stringData", "ptr"),
+    ("defaultEventMode", "int8"),
+], "hkReferencedObject")
+
+_register("hkbMirroredSkeletonInfo", 0xC6C2DA4F, [
+    ("mirrorAxis", "vector4"),
+    ("bonePairMap", ("array", "int16")),
+], "hkReferencedObject")
+_register("hkbCharacterStringData", 0x655B42BC, [
+    ("deformableSkinNames", ("array", "string")),
+    ("rigidSkinNames", ("array", "string")),
+    ("animationNames", ("array", "string")),
+    ("animationFilenames", ("array", "string")),
+    ("characterPropertyNames", ("array", "string")),
+    ("retargetingSkeletonMapperFilenames", ("array", "string")),
+    ("lodNames", ("array", "string")),
+    ("mirroredSyncPointSubstringsA", ("array", "string")),
+    ("mirroredSyncPointSubstringsB", ("array", "string")),
+    ("name", "string"),
+    ("rigName", "string"),
+    ("ragdollName", "string"),
+    ("behaviorFilename", "string"),
+], "hkReferencedObject")
+_register("hkbVariableValueSet", 0x27812D8D, [
+    ("wordVariableValues", ("array", "int32")),
+    ("quadVariableValues", ("array", "vector4")),
+    ("variantVariableValues", ("array", "ptr")),
+], "hkReferencedObject")
+_register("hkbCharacterDataCharacterControllerInfo", None, [
+    ("capsuleHeight", "real"),
+    ("capsuleRadius", "real"),
+    ("collisionFilterInfo", "uint32"),
+    ("characterControllerCinfo", "ptr"),
+])
+_register("hkbCharacterData", 0x300D6808, [
+    ("characterControllerInfo", ("struct", "hkbCharacterDataCharacterControllerInfo")),
+    ("modelUpMS", "vector4"),
+    ("modelForwardMS", "vector4"),
+    ("modelRightMS", "vector4"),
+    ("characterPropertyInfos", ("array", None)),
+    ("numBonesPerLod", ("array", "int32")),
+    ("characterPropertyValues", "ptr"),
+    ("footIkDriverInfo", "ptr"),
+    ("handIkDriverInfo", "ptr"),
+    ("stringData", "ptr"),
+    ("mirroredSkeletonInfo", "ptr"),
+    ("scale", "real"),
+    ("numHands", "int16"),
+    ("numFloatSlots", "int16"),
+], "hkReferencedObject")
+
+
+_SCALARS = {
+    "bool": ("<B", 1),
+    "int8": ("<b", 1),
+    "uint8": ("<B", 1),
+    "int16": ("<h", 2),
+    "uint16": ("<H", 2),
+    "int32": ("<i", 4),
+    "uint32": ("<I", 4),
+    "real": ("<f", 4),
+}
+
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def type_size(member_type, pointer_size):
+    #(size, alignment) of a member type
+    if member_type in ("vtable", "ptr", "string"):
+        return pointer_size, pointer_size
+    if member_type in _SCALARS:
+        size = _SCALARS[member_type][1]
+        return size, size
+    if member_type == "vector4":
+        return 16, 16
+    if member_type == "qstransform":
+        return 48, 16
+    if member_type[0] == "array":
+        return pointer_size + 8, pointer_size
+    if member_type[0] == "struct":
+        layout = class_layout(member_type[1], pointer_size)
+        return layout.size, layout.alignment
+    raise ValueError("Unknown havok member type "+str(member_type))
+
+
+class ClassLayout:
+    def __init__(self, members, size, alignment):
+        #members: list of (name, type, offset), base class members first
+        self.members = members
+        self.size = size
+        self.alignment = alignment
+
+
+_layout_cache = {}
+
+def class_layout(class_name, pointer_size):
+    key = (class_name, pointer_size)
+    if key in _layout_cache:
+        return _layout_cache[key]
+    hk_class = HK_CLASSES[class_name]
+    if hk_class.parent:
+        parent = class_layout(hk_class.parent, pointer_size)
+        #derived members start after the padded base class
+        members, offset, alignment = list(parent.members), parent.size, parent.alignment
+    else:
+        members, offset, alignment = [], 0, 1
+    for name, member_type in hk_class.members:
+        size, member_alignment = type_size(member_type, pointer_size)
+        offset = _align(offset, member_alignment)
+        members.append((name, member_type, offset))
+        offset += size
+        alignment = max(alignment, member_alignment)
+    layout = ClassLayout(members, _align(offset, alignment), alignment)
+    _layout_cache[key] = layout
+    return layout
+
+
+class PackfileWriter:
+    """Lays out an object graph into the __data__ section of a packfile."""
+
+    def __init__(self, pointer_size):
+        self.pointer_size = pointer_size
+        self.data = bytearray()
+        self.local_fixups = []      #(src offset, dst offset)
+        self.global_fixups = []     #(src offset, dst object)
+        self.virtual_fixups = []    #(object offset, class name)
+        self.object_offsets = {}
+        self.object_queue = []
+        self.streamed = []          #(dst offset, StreamedArray), after self.data
+        self.streamed_pending = []  #(src offset, element size, StreamedArray)
+
+    def _reserve(self, size, alignment=16):
+        offset = _align(len(self.data), alignment)
+        self.data.extend(bytes(offset + size - len(self.data)))
+        return offset
+
+    def add_object(self, obj):
+        self.object_queue.append(obj)
+        while self.object_queue:
+            obj = self.object_queue.pop(0)
+            if id(obj) in self.object_offsets:
+                continue
+            layout = class_layout(obj.class_name, self.pointer_size)
+            offset = self._reserve(layout.size)
+            self.object_offsets[id(obj)] = offset
+            self.virtual_fixups.append((offset, obj.class_name))
+            deferred = []
+            self._write_members(layout, obj.members, offset, deferred)
+            self._write_deferred(deferred)
+
+    def place_streamed(self):
+        #Lays out the streamed arrays behind the objects, returns the end of the data they take up
+        end = len(self.data)
+        for src_offset, element_size, items in self.streamed_pending:
+            if items.size != element_size * items.count:
+                raise ValueError("Streamed array holds {size} bytes, expected {count} elements of {element_size}".format(size=items.size, count=items.count, element_size=element_size))
+            dst_offset = _align(end, 16)
+            self.local_fixups.append((src_offset, dst_offset))
+            self.streamed.append((dst_offset, items))
+            end = dst_offset + items.size
+        self.streamed_pending = []
+        return end
+
+    def _write_members(self, layout, values, base, deferred):
+        for name, member_type, offset in layout.members:
+            self._write_value(member_type, values.get(name), base + offset, deferred)
+
+    def _write_value(self, member_type, value, offset, deferred):
+        #Inline part of a value, pointed-to data is deferred until after the owning object
+        if member_type == "vtable":
+            return
+        if member_type in _SCALARS:
+            struct.pack_into(_SCALARS[member_type][0], self.data, offset, value or 0)
+        elif member_type == "vector4":
+            struct.pack_into("<4f", self.data, offset, *(value or (0.0, 0.0, 0.0, 0.0)))
+        elif member_type == "qstransform":
+            translation, rotation, scale = value
+            struct.pack_into("<12f", self.data, offset, *translation, 0.0, *rotation, *scale, 0.0)
+        elif member_type == "string":
+            if value:
+                deferred.append(("string", offset, value))
+        elif member_type == "ptr":
+            if value is not None:
+                self.global_fixups.append((offset, value))
+                self.object_queue.append(value)
+        elif member_type[0] == "array":
+            items = value or ()
+            struct.pack_into("<iI", self.data, offset + self.pointer_size, len(items), len(items) | DONT_DEALLOCATE_FLAG)
+            if items:
+                if member_type[1] is None:
+                    raise ValueError("Writing non-empty arrays of this type is not supported")
+                deferred.append(("array", offset, (member_type[1], items)))
+        elif member_type[0] == "struct":
+            self._write_members(class_layout(member_type[1], self.pointer_size), (value or HkObject(member_type[1])).members, offset, deferred)
+
+    def _write_deferred(self, deferred):
+        for kind, src_offset, value in deferred:
+            if kind == "string":
+                encoded = value.encode("ascii") + b"\0"
+                dst_offset = self._reserve(len(encoded))
+                self.data[dst_offset:dst_offset + len(encoded)] = encoded
+                self.local_fixups.append((src_offset, dst_offset))
+            else:
+                element_type, items = value
+                element_size = _align(*type_size(element_type, self.pointer_size))
+                if isinstance(items, StreamedArray):
+                    self.streamed_pending.append((src_offset, element_size, items))
+                    continue
+                dst_offset = self._reserve(element_size * len(items))
+                self.local_fixups.append((src_offset, dst_offset))
+                if isinstance(items, PackedArray):
+                    if len(items.data) != element_size * items.count:
+                        raise ValueError("Packed array holds {size} bytes, expected {count} elements of {element_size}".format(size=len(items.data), count=items.count, element_size=element_size))
+                    self.data[dst_offset:dst_offset + len(items.data)] = items.data
+                    continue
+                nested = []
+                for i, item in enumerate(items):
+                    self._write_value(element_type, item, dst_offset + i * element_size, nested)
+                self._write_deferred(nested)
+
+
+def _pad(buffer, alignment=16, fill=b"\xff"):
+    buffer.extend(fill * (_align(len(buffer), alignment) - len(buffer)))
+
+
+def _section_header(name, absolute_start, offsets):
+    #offsets: local, global and virtual fixups, exports, imports and end, relative to absolute_start
+    return struct.pack("<19sB7I", name.encode("ascii"), 0xFF, absolute_start, *offsets)
+
+
+def write_packfile(root, skyrim_version):
+    """Serialize the object graph below the hkRootLevelContainer root, returns the file contents."""
+    return b"".join(packfile_chunks(root, skyrim_version))
+
+
+def _streamed_chunks(data, streamed, end):
+    #the objects, then every streamed array padded to its offset, then the padding up to end
+    yield bytes(data)
+    position = len(data)
+    for offset, items in streamed:
+        yield bytes(offset - position)
+        written = 0
+        for chunk in items.chunks():
+            written += len(chunk)
+            yield chunk
+        if written != items.size:
+            raise ValueError("Streamed array yielded {written} bytes, expected {size}".format(written=written, size=items.size))
+        position = offset + written
+    yield bytes(end - position)
+
+
+def packfile_chunks(root, skyrim_version):
+    """
+    write_packfile as an iterator over the parts of the file, streamed arrays are only produced
+    while it is iterated so the file never has to be held in memory as a whole.
+    """
+    pointer_size = POINTER_SIZES[skyrim_version]
+    writer = PackfileWriter(pointer_size)
+    writer.add_object(root)
+
+    #__classnames__: signature, tab, null terminated name for every class written
+    classnames = bytearray()
+    classname_offsets = {}
+    used = ["hkClass", "hkClassMember", "hkClassEnum", "hkClassEnumItem"]
+    for _, class_name in writer.virtual_fixups:
+        if class_name not in used:
+            used.append(class_name)
+    for class_name in used:
+        classnames += struct.pack("<IB", HK_CLASSES[class_name].signature, 0x09)
+        classname_offsets[class_name] = len(classnames)
+        classnames += class_name.encode("ascii") + b"\0"
+    _pad(classnames)
+
+    #__data__: objects and streamed arrays followed by the local, global and virtual fixup tables
+    objects_end = writer.place_streamed()
+    fixups_start = _align(objects_end, 16)
+    data = bytearray()
+    local_fixups_offset = fixups_start
+    for src, dst in writer.local_fixups:
+        data += struct.pack("<2I", src, dst)
+    _pad(data)
+    global_fixups_offset = fixups_start + len(data)
+    for src, obj in writer.global_fixups:
+        data += struct.pack("<3I", src, DATA_SECTION, writer.object_offsets[id(obj)])
+    _pad(data)
+    virtual_fixups_offset = fixups_start + len(data)
+    for offset, class_name in writer.virtual_fixups:
+        data += struct.pack("<3I", offset, CLASSNAMES_SECTION, classname_offsets[class_name])
+    _pad(data)
+    end_offset = fixups_start + len(data)
+
+    header = struct.pack("<2Ii I4B iiiii 16s iI",
+        MAGIC[0], MAGIC[1], 0, FILE_VERSION,
+        pointer_size, 1, 0, 1,
+        len(SECTION_NAMES), DATA_SECTION, writer.object_offsets[id(root)], CLASSNAMES_SECTION, classname_offsets[root.class_name],
+        CONTENTS_VERSION.encode("ascii") + b"\0\xff",
+        0, 0xFFFFFFFF)
+
+    classnames_start = len(header) + 48 * len(SECTION_NAMES)
+    types_start = classnames_start + len(classnames)
+    data_start = types_start
+    sections = (
+        _section_header(SECTION_NAMES[CLASSNAMES_SECTION], classnames_start, [len(classnames)] * 6),
+        _section_header(SECTION_NAMES[TYPES_SECTION], types_start, [0] * 6),
+        _section_header(SECTION_NAMES[DATA_SECTION], data_start, [local_fixups_offset, global_fixups_offset, virtual_fixups_offset, end_offset, end_offset, end_offset]),
+    )
+    yield header + b"".join(sections) + bytes(classnames)
+    yield from _streamed_chunks(writer.data, writer.streamed, fixups_start)
+    yield bytes(data)
+
+
+def save_packfile(filepath, root, skyrim_version):
+    size = 0
+    with open(filepath, "wb") as f:
+        for chunk in packfile_chunks(root, skyrim_version):
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def root_level_container(*variants):
+    #variants: (name, HkObject) pairs
+    return HkObject("hkRootLevelContainer", namedVariants=[
+        HkObject("hkRootLevelContainerNamedVariant", name=name, className=obj.class_name, variant=obj)
+        for name, obj in variants
+    ])
+
+
+def skeleton_root(skeleton_name, bone_names, parent_indices, reference_pose):
+    #reference_pose: ((tx, ty, tz), (qx, qy, qz, qw), (sx, sy, sz)) per bone
+    skeleton = HkObject("hkaSkeleton",
+        name=skeleton_name,
+        parentIndices=list(parent_indices),
+        bones=[HkObject("hkaBone", name=name, lockTranslation=True) for name in bone_names],
+        referencePose=list(reference_pose))
+    container = HkObject("hkaAnimationContainer", skeletons=[skeleton])
+    resources = HkObject("hkMemoryResourceContainer", name="")
+    return root_level_container(("Merged Animation Container", container), ("Resource Data", resources))
+
+
+def character_root(character_name, skeleton_hkx_name, behavior_hkx_name):
+    string_data = HkObject("hkbCharacterStringData",
+        name=character_name,
+        rigName="CharacterAssets\\"+skeleton_hkx_name,
+        ragdollName=None,
+        behaviorFilename="Behaviors\\"+behavior_hkx_name)
+    mirrored_skeleton_info = HkObject("hkbMirroredSkeletonInfo", mirrorAxis=(1.0, 0.0, 0.0, 0.0))
+    character_data = HkObject("hkbCharacterData",
+        characterControllerInfo=HkObject("hkbCharacterDataCharacterControllerInfo", capsuleHeight=1.7, capsuleRadius=0.4, collisionFilterInfo=1),
+        modelUpMS=(0.0, 0.0, 0.0, 1.0),
+        modelForwardMS=(1.0, 0.0, 0.0, 0.0),
+        modelRightMS=(-0.0, -1.0, -0.0, 0.0),
+        characterPropertyValues=HkObject("hkbVariableValueSet"),
+        stringData=string_data,
+        mirroredSkeletonInfo=mirrored_skeleton_info,
+        scale=1.0)
+    return root_level_container(("hkbCharacterData", character_data))
+
+
+def project_root(character_hkx_name):
+    string_data = HkObject("hkbProjectStringData", characterFilenames=["Characters\\"+character_hkx_name])
+    project_data = HkObject("hkbProjectData",
+        worldUpWS=(0.0, 0.0, 1.0, 0.0),
+        stringData=string_data,
+        defaultEventMode=EVENT_MODE_IGNORE_FROM_GENERATOR)
+    return root_level_container(("hkbProjectData", project_data))
+
+
+def animation_root(skeleton_name, track_names, duration, transforms, annotations=()):
+    """
+    Interleaved uncompressed animation bound to the skeleton, one track per bone in skeleton order.
+    transforms: (translation, (qx, qy, qz, qw), scale) of every track frame by frame, or a PackedArray or StreamedArray of them.
+    annotations: (time, text) pairs, written to the first track like convertKF does.
+    """
+    animation = HkObject("hkaInterleavedUncompressedAnimation",
+        type=ANIMATION_TYPE_INTERLEAVED,
+        duration=duration,
+        numberOfTransformTracks=len(track_names),
+        annotationTracks=annotation_tracks(track_names, annotations),
+        transforms=transforms)
+    return animation_container_root(skeleton_name, animation)
+
+
+def spline_animation_root(skeleton_name, track_names, spline, annotations=()):
+    """
+    Spline compressed animation bound to the skeleton. spline holds the encoded members
+    (num_frames, max_frames_per_block, frame_duration, block_offsets, float_block_offsets, data,
+    mask_size, block_duration, duration), e.g. a SplineAnimation.
+    """
+    animation = HkObject("hkaSplineCompressedAnimation",
+        type=ANIMATION_TYPE_SPLINE_COMPRESSED,
+        duration=spline.duration,
+        numberOfTransformTracks=len(track_names),
+        annotationTracks=annotation_tracks(track_names, annotations),
+        numFrames=spline.num_frames,
+        numBlocks=len(spline.block_offsets),
+        maxFramesPerBlock=spline.max_frames_per_block,
+        maskAndQuantizationSize=spline.mask_size,
+        blockDuration=spline.block_duration,
+        blockInverseDuration=1.0 / spline.block_duration if spline.block_duration else 0.0,
+        frameDuration=spline.frame_duration,
+        blockOffsets=list(spline.block_offsets),
+        floatBlockOffsets=list(spline.float_block_offsets),
+        data=spline.data if isinstance(spline.data, StreamedArray) else PackedArray(len(spline.data), spline.data))
+    return animation_container_root(skeleton_name, animation)
+
+
+def annotation_tracks(track_names, annotations):
+    #One annotation track per transform track, the (time, text) annotations go on the first one
+    tracks = [HkObject("hkaAnnotationTrack", trackName=name) for name in track_names]
+    if tracks:
+        tracks[0].members["annotations"] = [HkObject("hkaAnnotationTrackAnnotation", time=time, text=text) for time, text in annotations]
+    return tracks
+
+
+def animation_container_root(skeleton_name, animation):
+    #Binds an hkaAnimation to the skeleton, track i drives bone i
+    binding = HkObject("hkaAnimationBinding",
+        originalSkeletonName=skeleton_name,
+        animation=animation,
+        transformTrackToBoneIndices=list(range(animation["numberOfTransformTracks"])),
+        blendHint=BLEND_HINT_NORMAL)
+    container = HkObject("hkaAnimationContainer", animations=[animation], bindings=[binding])
+    return root_level_container(("Merged Animation Container", container))
@@ -0,0 +1,200 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Per stage timing of the exports (wall time, cpu time, optionally peak python memory through tracemalloc).
+#Every run is appended as one json line to the export history in the workdir.
+
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+HISTORY_FILE = "armaToHKX_history.jsonl"
+#runs compared against the latest one in the trend report
+DEFAULT_TREND_RUNS = 10
+
+
+class ExportProfile:
+    """
+    Timings of one export run. Wrap each stage in `with profile.stage(name):`, converter runs
+    are added from their ConversionResults. Use as a context manager around the whole run, or call
+    begin() and end() for runs that outlive one function (modal exports). On exit the run is appended
+    to the history when a history_dir is given.
+    """
+
+    def __init__(self, operation, history_dir=None, trace_memory=False):
+        self.operation = operation
+        self.history_dir = history_dir
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        self.stages = []
+        self.status = None
+        self.start_wall = None
+        self.start_cpu = None
+        self.total_wall = None
+        self.total_cpu = None
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc_type, exc)
+        return False
+
+    def begin(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def end(self, exc_type=None, exc=None):
+        if exc_type is not None:
+            self.status = "ERROR: {kind}: {e}".format(kind=exc_type.__name__, e=exc)
+        self.total_wall = time.perf_counter() - self.start_wall
+        self.total_cpu = time.process_time() - self.start_cpu
+        if self.started_tracing:
+            tracemalloc.stop()
+        if self.history_dir is not None:
+            try:
+                self.save()
+            except OSError as e:
+                print("ArmaToHKX WARNING: could not write export history: "+str(e))
+        print(self.summary())
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            #reset_peak is python 3.9+, older blenders report the peak since tracing started
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry = {"stage": name, "wall": time.perf_counter() - start_wall, "cpu": time.process_time() - start_cpu, "peak_memory": None}
+            if tracing:
+                entry["peak_memory"] = max(0, tracemalloc.get_traced_memory()[1] - start_memory)
+            self.stages.append(entry)
+
+    def add_stage(self, name, wall):
+        #A stage timed elsewhere, such as on a worker thread
+        self.stages.append({"stage": name, "wall": wall, "cpu": None, "peak_memory": None})
+
+    def add_results(self, results):
+        #Converter runs happen in other processes, only their wall time is known
+        for result in results:
+            self.stages.append({"stage": result.label, "wall": result.elapsed, "cpu": None, "peak_memory": None, "cached": result.cached, "ok": result.ok})
+
+    def finish(self, status):
+        #Records the operator's return value and passes it on
+        self.status = ", ".join(sorted(status))
+        return status
+
+    def to_dict(self):
+        return {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "operation": self.operation,
+            "status": self.status,
+            "wall": self.total_wall,
+            "cpu": self.total_cpu,
+            "stages": self.stages,
+        }
+
+    def save(self):
+        with open(os.path.join(self.history_dir, HISTORY_FILE), "a") as f:
+            f.write(json.dumps(self.to_dict()) + "\n")
+
+    def summary(self):
+        lines = ["armaToHKX {op} export {status} in {t:.2f}s:".format(op=self.operation, status=self.status, t=self.total_wall or 0.0)]
+        for entry in self.stages:
+            line = "  {stage:24s} {wall:8.3f}s wall".format(**entry)
+            if entry["cpu"] is not None:
+                line += " {cpu:8.3f}s cpu".format(**entry)
+            if entry["peak_memory"] is not None:
+                line += " {mb:8.1f} MB peak".format(mb=entry["peak_memory"] / (1024.0 * 1024.0))
+            if entry.get("cached"):
+                line += " (cached)"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def load_history(history_dir, operation=None):
+    #Runs from the history, oldest first, unreadable lines are skipped
+    path = os.path.join(history_dir, HISTORY_FILE)
+    runs = []
+    if not os.path.exists(path):
+        return runs
+    with open(path) as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue
+            if operation is None or run.get("operation") == operation:
+                runs.append(run)
+    return runs
+
+
+def trend_report(runs, n_runs=DEFAULT_TREND_RUNS):
+    """
+    Compares the latest run of every operation with the average of the n_runs before it,
+    stage by stage. Returns the report lines.
+    """
+    lines = []
+    operations = []
+    for run in runs:
+        if run.get("operation") not in operations:
+            operations.append(run.get("operation"))
+    for operation in operations:
+        op_runs = [run for run in runs if run.get("operation") == operation]
+        latest, previous = op_runs[-1], op_runs[-n_runs - 1:-1]
+        lines.append("{op}: {n} runs, latest {time} {status} {t:.2f}s".format(op=operation, n=len(op_runs), time=latest.get("time"), status=latest.get("status"), t=latest.get("wall") or 0.0))
+        for entry in latest.get("stages", []):
+            before = [stage["wall"] for run in previous for stage in run.get("stages", []) if stage["stage"] == entry["stage"]]
+            line = "  {stage:24s} {wall:8.3f}s".format(**entry)
+            if before:
+                average = sum(before) / len(before)
+                change = (entry["wall"] - average) / average * 100.0 if average > 0 else 0.0
+                line += "  avg {avg:8.3f}s over {n} runs ({change:+.0f}%)".format(avg=average, n=len(before), change=change)
+            lines.append(line)
+    return lines
@@ -0,0 +1,144 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Persistent state of the units of a batch export (bake, kf, LE hkx, SSE hkx of every clip), kept as
+#json in the workdir and rewritten after every change, so a batch interrupted by a crash or a hung
+#converter can be resumed and only redoes the units that did not finish.
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+QUEUE_FILE = "armaToHKX_queue.json"
+
+#Export units of a clip, in the order they run
+UNITS = ("bake", "kf", "LE hkx", "SSE hkx")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def file_hash(path):
+    #sha256 of a file, None if it does not exist
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class ExportQueue:
+    """
+    Unit states of one batch, identified by batch_key (the output folder). The stored batch is started
+    over when its settings differ, and a clip's units when its fingerprint (the keys of its action) differs.
+    Units may be started and finished from converter threads.
+    """
+
+    def __init__(self, workdir, batch_key, settings):
+        self.path = os.path.join(workdir, QUEUE_FILE)
+        self.batch_key = batch_key
+        self.lock = threading.Lock()
+        self.data = self._load()
+        batch = self.data["batches"].get(batch_key)
+        if batch is None or batch.get("settings") != settings:
+            batch = {"settings": settings, "clips": {}}
+            self.data["batches"][batch_key] = batch
+        self.batch = batch
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if isinstance(data.get("batches"), dict):
+                return data
+        except (OSError, ValueError, AttributeError):
+            pass
+        return {"batches": {}}
+
+    def save(self):
+        #written next to the queue and renamed over it, a crash never leaves half a file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self.lock:
+            self.batch["clips"] = {}
+            self.save()
+
+    def clip(self, name, fingerprint):
+        #Registers a clip, its units start over if its action changed since they ran
+        with self.lock:
+            clip = self.batch["clips"].get(name)
+            if clip is None or clip.get("fingerprint") != fingerprint:
+                self.batch["clips"][name] = {"fingerprint": fingerprint, "units": {unit: {"state": PENDING} for unit in UNITS}}
+                self.save()
+
+    def start(self, clip_name, unit):
+        with self.lock:
+            self.batch["clips"][clip_name]["units"][unit] = {"state": RUNNING, "started": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self.save()
+
+    def finish(self, clip_name, unit, output_path=None, error=None):
+        #Records the outcome of a unit, with the hash of its output file
+        output_hash = file_hash(output_path) if output_path is not None and error is None else None
+        with self.lock:
+            record = self.batch["clips"][clip_name]["units"][unit]
+            record["state"] = FAILED if error is not None else DONE
+            record["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            record["output"] = output_path
+            record["hash"] = output_hash
+            record["error"] = error
+            self.save()
+
+    def is_done(self, clip_name, unit):
+        #Finished, and its output file is still the one it wrote
+        with self.lock:
+            record = dict(self.batch["clips"][clip_name]["units"][unit])
+        if record["state"] != DONE:
+            return False
+        if record.get("output") is None:
+            return True
+        return record.get("hash") is not None and file_hash(record["output"]) == record["hash"]
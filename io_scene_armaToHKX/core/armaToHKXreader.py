@@ -0,0 +1,392 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Reader for hk_2010.2.0-r1 binary packfiles, WIN32 (LE) and AMD64 (SSE) layouts, used to check the
+#files hkxcmd, convertKF and the native writer produce. The file is memory mapped and only the parts
+#that are asked for are read: the fixup tables are parsed on first use and object members on access,
+#using the same HK_CLASSES layouts as the writer.
+
+import mmap
+import os
+import struct
+
+from io_scene_armaToHKX.core.armaToHKXpackfile import HK_CLASSES, MAGIC, FILE_VERSION, SECTION_NAMES, POINTER_SIZES, _SCALARS, class_layout, type_size, _align
+from io_scene_armaToHKX.core.armaToHKXspline import SplineAnimation
+
+#Largest reference pose difference verify_skeleton accepts, the xml only holds 6 decimals
+VERIFY_TOLERANCE = 0.0001
+
+HEADER_SIZE = 64
+SECTION_HEADER_SIZE = 48
+
+
+class Section:
+    """A section header, offsets are absolute in the file."""
+
+    def __init__(self, name, start, local_fixups, global_fixups, virtual_fixups, end):
+        self.name = name
+        self.start = start
+        self.local_fixups = start + local_fixups
+        self.global_fixups = start + global_fixups
+        self.virtual_fixups = start + virtual_fixups
+        self.end = start + end
+
+
+class PackfileObject:
+    """An object (or embedded struct) in the data section, members are read when they are indexed."""
+
+    def __init__(self, reader, class_name, offset):
+        self.reader = reader
+        self.class_name = class_name
+        self.offset = offset
+
+    def __getitem__(self, name):
+        member_type, offset = self.reader.member(self.class_name, name)
+        return self.reader.read_value(member_type, self.offset + offset)
+
+    def __repr__(self):
+        return "<{c} at 0x{o:X}>".format(c=self.class_name, o=self.offset)
+
+    def array_buffer(self, name):
+        #(element count, raw element bytes) of an array member, for bulk reads
+        member_type, offset = self.reader.member(self.class_name, name)
+        if member_type[0] != "array":
+            raise ValueError(name+" of "+self.class_name+" is not an array")
+        return self.reader.array_buffer(member_type[1], self.offset + offset)
+
+
+class PackfileReader:
+    """
+    Memory mapped binary packfile. Use as a context manager, or call close(), so the file is not kept
+    open (hkxcmd can not overwrite it on windows while it is mapped).
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            if not f.seek(0, 2):
+                raise ValueError(filepath+" is empty")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+        self._local_fixups = None
+        self._global_fixups = None
+        self._virtual_fixups = None
+        self._members = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _read_header(self):
+        if len(self._mm) < HEADER_SIZE:
+            raise ValueError(self.filepath+" is too small to be a packfile")
+        (magic0, magic1, _, file_version, pointer_size, little_endian, _, _,
+         num_sections, contents_section, contents_offset, _, _, contents_version, _, _) = struct.unpack_from("<2Ii I4B iiiii 16s iI", self._mm, 0)
+        if (magic0, magic1) != MAGIC:
+            raise ValueError(self.filepath+" is not a binary packfile")
+        if file_version != FILE_VERSION or pointer_size not in POINTER_SIZES.values() or not little_endian:
+            raise ValueError("{path}: unsupported packfile version {v}, pointer size {p}".format(path=self.filepath, v=file_version, p=pointer_size))
+        self.pointer_size = pointer_size
+        self.skyrim_version = [version for version, size in POINTER_SIZES.items() if size == pointer_size][0]
+        self.contents_version = contents_version.split(b"\0")[0].decode("ascii")
+        self.sections = []
+        for i in range(num_sections):
+            name, _, start, local_fixups, global_fixups, virtual_fixups, _, _, end = struct.unpack_from("<19sB7I", self._mm, HEADER_SIZE + i * SECTION_HEADER_SIZE)
+            self.sections.append(Section(name.split(b"\0")[0].decode("ascii"), start, local_fixups, global_fixups, virtual_fixups, end))
+        if self.sections[-1].end > len(self._mm):
+            raise ValueError(self.filepath+" is truncated")
+        names = [section.name for section in self.sections]
+        if SECTION_NAMES[-1] not in names or contents_section != names.index(SECTION_NAMES[-1]):
+            raise ValueError(self.filepath+" has no __data__ section holding the contents")
+        self.data = self.sections[contents_section]
+        self.classnames = self.sections[names.index(SECTION_NAMES[0])]
+        self.root_offset = self.data.start + contents_offset
+
+    def _fixup_table(self, start, end, fmt):
+        #Entries of a fixup table, without the 0xFF padding
+        size = struct.calcsize(fmt)
+        return [entry for entry in struct.iter_unpack(fmt, self._mm[start:start + (end - start) // size * size]) if entry[0] != 0xFFFFFFFF]
+
+    @property
+    def local_fixups(self):
+        #absolute pointer offset -> absolute target offset, within the data section
+        if self._local_fixups is None:
+            start = self.data.start
+            self._local_fixups = {start + src: start + dst for src, dst in self._fixup_table(self.data.local_fixups, self.data.global_fixups, "<2I")}
+        return self._local_fixups
+
+    @property
+    def global_fixups(self):
+        #absolute pointer offset -> absolute target offset, any section
+        if self._global_fixups is None:
+            start = self.data.start
+            self._global_fixups = {start + src: self.sections[section].start + dst for src, section, dst in self._fixup_table(self.data.global_fixups, self.data.virtual_fixups, "<3I")}
+        return self._global_fixups
+
+    @property
+    def virtual_fixups(self):
+        #absolute object offset -> class name, in file order
+        if self._virtual_fixups is None:
+            start = self.data.start
+            self._virtual_fixups = {start + offset: self.read_string_at(self.sections[section].start + name_offset)
+                                    for offset, section, name_offset in self._fixup_table(self.data.virtual_fixups, self.data.end, "<3I")}
+        return self._virtual_fixups
+
+    def root(self):
+        return self.object_at(self.root_offset)
+
+    def object_at(self, offset):
+        if offset not in self.virtual_fixups:
+            raise ValueError("No object at 0x{o:X} in {path}".format(o=offset, path=self.filepath))
+        return PackfileObject(self, self.virtual_fixups[offset], offset)
+
+    def objects(self, class_name):
+        #Every object of the class, found through the virtual fixups without walking the object graph
+        return [PackfileObject(self, name, offset) for offset, name in self.virtual_fixups.items() if name == class_name]
+
+    def member(self, class_name, name):
+        #(type, offset) of a member, from the writer's class layouts
+        if class_name not in self._members:
+            if class_name not in HK_CLASSES:
+                raise KeyError("Layout of "+class_name+" is not known, can not read its members")
+            self._members[class_name] = {member_name: (member_type, offset) for member_name, member_type, offset in class_layout(class_name, self.pointer_size).members}
+        return self._members[class_name][name]
+
+    def read_string_at(self, offset):
+        return self._mm[offset:self._mm.find(b"\0", offset)].decode("ascii", "replace")
+
+    def read_value(self, member_type, offset):
+        if member_type == "vtable":
+            return None
+        if member_type in _SCALARS:
+            value = struct.unpack_from(_SCALARS[member_type][0], self._mm, offset)[0]
+            return bool(value) if member_type == "bool" else value
+        if member_type == "vector4":
+            return struct.unpack_from("<4f", self._mm, offset)
+        if member_type == "qstransform":
+            values = struct.unpack_from("<12f", self._mm, offset)
+            return values[0:3], values[4:8], values[8:11]
+        if member_type == "string":
+            target = self.local_fixups.get(offset)
+            return None if target is None else self.read_string_at(target)
+        if member_type == "ptr":
+            target = self.global_fixups.get(offset)
+            return None if target is None else self.object_at(target)
+        if member_type[0] == "struct":
+            return PackfileObject(self, member_type[1], offset)
+        if member_type[0] == "array":
+            return self.read_array(member_type[1], offset)
+        raise ValueError("Unknown havok member type "+str(member_type))
+
+    def read_array(self, element_type, offset):
+        count, data = self.array_buffer(element_type, offset)
+        if not count:
+            return []
+        if element_type in _SCALARS:
+            values = list(struct.unpack("<{n}{f}".format(n=count, f=_SCALARS[element_type][0][1]), data))
+            return [bool(value) for value in values] if element_type == "bool" else values
+        if element_type == "qstransform":
+            return [(values[0:3], values[4:8], values[8:11]) for values in struct.iter_unpack("<12f", data)]
+        start = self.local_fixups[offset]
+        element_size = _align(*type_size(element_type, self.pointer_size))
+        return [self.read_value(element_type, start + i * element_size) for i in range(count)]
+
+    def array_buffer(self, element_type, offset):
+        #(count, bytes) of the array whose hkArray is at offset
+        count = struct.unpack_from("<i", self._mm, offset + self.pointer_size)[0]
+        if count <= 0:
+            return 0, b""
+        if element_type is None:
+            raise ValueError("Reading non-empty arrays of this type is not supported")
+        start = self.local_fixups.get(offset)
+        if start is None:
+            raise ValueError("Array at 0x{o:X} in {path} has {n} elements but no data".format(o=offset, path=self.filepath, n=count))
+        size = count * _align(*type_size(element_type, self.pointer_size))
+        if start + size > self.data.end:
+            raise ValueError("Array at 0x{o:X} in {path} runs past the data section".format(o=offset, path=self.filepath))
+        return count, self._mm[start:start + size]
+
+
+class SkeletonData:
+    """Bones of an hkaSkeleton, reference pose in the same form skeleton_root takes."""
+
+    def __init__(self, name, bone_names, parent_indices, reference_pose):
+        self.name = name
+        self.bone_names = bone_names
+        self.parent_indices = parent_indices
+        self.reference_pose = reference_pose
+
+
+class AnimationInfo:
+    """Track counts and timing of an hkaAnimation and the binding that maps it to a skeleton."""
+
+    def __init__(self, animation, binding):
+        self.animation = animation
+        self.class_name = animation.class_name
+        self.duration = animation["duration"]
+        self.num_transform_tracks = animation["numberOfTransformTracks"]
+        self.num_float_tracks = animation["numberOfFloatTracks"]
+        self.skeleton_name = binding["originalSkeletonName"] if binding is not None else None
+        self.track_to_bone = binding["transformTrackToBoneIndices"] if binding is not None else []
+        if self.class_name == "hkaSplineCompressedAnimation":
+            self.num_frames = animation["numFrames"]
+        elif self.class_name == "hkaInterleavedUncompressedAnimation" and self.num_transform_tracks:
+            self.num_frames = animation.array_buffer("transforms")[0] // self.num_transform_tracks
+        else:
+            self.num_frames = None
+
+
+def read_skeletons(reader):
+    skeletons = []
+    for skeleton in reader.objects("hkaSkeleton"):
+        skeletons.append(SkeletonData(skeleton["name"],
+            [bone["name"] for bone in skeleton["bones"]],
+            skeleton["parentIndices"],
+            skeleton["referencePose"]))
+    return skeletons
+
+
+def read_animations(reader):
+    bindings = {}
+    for binding in reader.objects("hkaAnimationBinding"):
+        animation = binding["animation"]
+        if animation is not None:
+            bindings[animation.offset] = binding
+    animations = []
+    for container in reader.objects("hkaAnimationContainer"):
+        for animation in container["animations"]:
+            animations.append(AnimationInfo(animation, bindings.get(animation.offset)))
+    return animations
+
+
+def spline_animation(info):
+    #SplineAnimation of a spline compressed AnimationInfo, for decode_spline_animation
+    animation = info.animation
+    return SplineAnimation(info.num_transform_tracks, animation["numFrames"], animation["frameDuration"], animation["maxFramesPerBlock"],
+        animation["blockOffsets"], animation["floatBlockOffsets"], bytes(animation.array_buffer("data")[1]))
+
+
+def _rotation_difference(a, b):
+    #q and -q are the same rotation
+    return min(max(abs(x - y) for x, y in zip(a, b)), max(abs(x + y) for x, y in zip(a, b)))
+
+
+def verify_skeleton(filepath, skeleton_name, bone_parent_index, reference_pose, tolerance=VERIFY_TOLERANCE):
+    """
+    Compares a skeleton .hkx with what get_skeleton_data collected (bone_parent_index, reference_pose).
+    Returns a list of the differences found, empty if the file holds the skeleton.
+    """
+    try:
+        with PackfileReader(filepath) as reader:
+            skeletons = read_skeletons(reader)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        return ["can not be read: "+str(e)]
+    if len(skeletons) != 1:
+        return ["holds {n} skeletons, expected 1".format(n=len(skeletons))]
+    skeleton = skeletons[0]
+    problems = []
+    if skeleton.name != skeleton_name:
+        problems.append("skeleton is named {a}, expected {b}".format(a=skeleton.name, b=skeleton_name))
+    if len(skeleton.bone_names) != len(bone_parent_index) or len(skeleton.parent_indices) != len(bone_parent_index) or len(skeleton.reference_pose) != len(bone_parent_index):
+        problems.append("{n} bones, {p} parent indices and {r} reference transforms, expected {e} bones".format(
+            n=len(skeleton.bone_names), p=len(skeleton.parent_indices), r=len(skeleton.reference_pose), e=len(bone_parent_index)))
+        return problems
+    for i, ((name, parent_idx), (translation, rotation, scale)) in enumerate(zip(bone_parent_index, reference_pose)):
+        if skeleton.bone_names[i] != name or skeleton.parent_indices[i] != parent_idx:
+            problems.append("bone {i} is {a} (parent {p}), expected {b} (parent {q})".format(i=i, a=skeleton.bone_names[i], p=skeleton.parent_indices[i], b=name, q=parent_idx))
+            continue
+        file_translation, file_rotation, file_scale = skeleton.reference_pose[i]
+        difference = max(max(abs(x - y) for x, y in zip(file_translation, translation)),
+                         _rotation_difference(file_rotation, rotation),
+                         max(abs(x - y) for x, y in zip(file_scale, scale)))
+        if difference > tolerance:
+            problems.append("reference pose of {name} differs by {d:.6f}".format(name=name, d=difference))
+    return problems
+
+
+def verify_animation(filepath, num_tracks=None, duration=None, num_bones=None, tolerance=0.001):
+    """
+    Checks an animation .hkx has a single animation with its frame data in place and every track bound
+    to a bone, and (those given) num_tracks transform tracks, a length of duration seconds and only
+    bones below num_bones bound. Returns a list of the differences found, empty if the file is as expected.
+    """
+    try:
+        with PackfileReader(filepath) as reader:
+            animations = read_animations(reader)
+            if len(animations) != 1:
+                return ["holds {n} animations, expected 1".format(n=len(animations))]
+            info = animations[0]
+            problems = []
+            if num_tracks is not None and info.num_transform_tracks != num_tracks:
+                problems.append("{n} transform tracks, expected {e}".format(n=info.num_transform_tracks, e=num_tracks))
+            if len(info.track_to_bone) != info.num_transform_tracks:
+                problems.append("{n} of {t} tracks are bound to bones".format(n=len(info.track_to_bone), t=info.num_transform_tracks))
+            if num_bones is not None and any(not 0 <= bone < num_bones for bone in info.track_to_bone):
+                problems.append("tracks are bound to bones missing from the {n} bone skeleton".format(n=num_bones))
+            if duration is not None and abs(info.duration - duration) > tolerance:
+                problems.append("lasts {d:.4f}s, expected {e:.4f}s".format(d=info.duration, e=duration))
+            if info.class_name == "hkaSplineCompressedAnimation":
+                block_offsets = info.animation["blockOffsets"]
+                data_size = info.animation.array_buffer("data")[0]
+                if len(block_offsets) != info.animation["numBlocks"] or any(offset >= data_size for offset in block_offsets):
+                    problems.append("spline block offsets do not match the {n} bytes of data".format(n=data_size))
+            elif info.class_name == "hkaInterleavedUncompressedAnimation":
+                if info.num_transform_tracks and info.animation.array_buffer("transforms")[0] % info.num_transform_tracks:
+                    problems.append("transforms are not a whole number of frames")
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        return ["can not be read: "+str(e)]
+    return problems
+
+
+def report_verification(operator, filepath, problems):
+    #Report the differences found in a written file to the operator, returns True if there were none
+    for problem in problems:
+        operator.report({"WARNING"}, "{name}: {problem}".format(name=os.path.basename(filepath), problem=problem))
+    if not problems:
+        print("Verified "+filepath)
+    return not problems
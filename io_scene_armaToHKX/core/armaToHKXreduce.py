@@ -0,0 +1,197 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Error bounded keyframe reduction. Keys of a bone are removed as long as linear interpolation
+#(slerp for quaternions) between the remaining keys stays within the translation, rotation and
+#scale tolerances (Ramer-Douglas-Peucker). One key mask is used for all channels of a bone,
+#the dump and the KF export pair location, rotation and scale keys by index.
+
+import numpy as np
+
+from io_scene_armaToHKX.core.armaToHKXsampling import sample_bone_keys
+
+DEFAULT_TRANSLATION_TOLERANCE = 0.0001
+#radians
+DEFAULT_ROTATION_TOLERANCE = 0.0005
+DEFAULT_SCALE_TOLERANCE = 0.0001
+
+
+def quaternion_flips(quats):
+    #(n,) bool, keys to negate so every key is in the hemisphere of the key before it
+    flips = np.zeros(len(quats), dtype=bool)
+    if len(quats) > 1:
+        flips[1:] = np.cumsum(np.einsum("ij,ij->i", quats[1:], quats[:-1]) < 0.0) % 2 == 1
+    return flips
+
+
+def continuous_quaternions(quats):
+    #copy of quats with hemisphere continuity, they interpolate the short way
+    return np.where(quaternion_flips(quats)[:, np.newaxis], -quats, quats)
+
+
+def _slerp(q0, q1, t):
+    #(4,), (4,), (m,) -> (m, 4)
+    dot = np.dot(q0, q1)
+    if dot < 0.0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        result = q0 + t[:, np.newaxis] * (q1 - q0)
+        return result / np.linalg.norm(result, axis=1, keepdims=True)
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    return (np.sin((1.0 - t) * theta) / sin_theta)[:, np.newaxis] * q0 + (np.sin(t * theta) / sin_theta)[:, np.newaxis] * q1
+
+
+def _vector_error(values, a, b, t):
+    interpolated = values[a] + t[:, np.newaxis] * (values[b] - values[a])
+    return np.linalg.norm(values[a+1:b] - interpolated, axis=1)
+
+
+def _rotation_error(quats, a, b, t):
+    #angle between the slerped and the actual rotation
+    dot = np.abs(np.einsum("ij,ij->i", _slerp(quats[a], quats[b], t), quats[a+1:b]))
+    return 2.0 * np.arccos(np.clip(dot / np.linalg.norm(quats[a+1:b], axis=1), 0.0, 1.0))
+
+
+def _euler_error(eulers, a, b, t):
+    #largest per axis deviation, the rotation error is not larger than the sum of those
+    interpolated = eulers[a] + t[:, np.newaxis] * (eulers[b] - eulers[a])
+    return np.abs(eulers[a+1:b] - interpolated).max(axis=1) * 3.0
+
+
+class KeyReduction:
+    """
+    Tolerances and running totals of a reduction. key_mask is called once per bone,
+    summary() reports the total reduction.
+    """
+
+    def __init__(self, translation_tolerance=DEFAULT_TRANSLATION_TOLERANCE, rotation_tolerance=DEFAULT_ROTATION_TOLERANCE, scale_tolerance=DEFAULT_SCALE_TOLERANCE):
+        self.translation_tolerance = translation_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self.scale_tolerance = scale_tolerance
+        self.keys_before = 0
+        self.keys_after = 0
+
+    def key_mask(self, times, translations=None, quaternions=None, eulers=None, scales=None):
+        """
+        (n,) bool mask of the keys to keep, first and last are always kept. Channels that are None
+        are ignored, quaternions are w x y z and should be continuous (continuous_quaternions).
+        """
+        n = len(times)
+        if n == 0:
+            #a bone without quaternion keys, nothing to keep and nothing counted
+            return np.zeros(0, dtype=bool)
+        channels = []
+        for values, error, tolerance in ((translations, _vector_error, self.translation_tolerance),
+                                         (quaternions, _rotation_error, self.rotation_tolerance),
+                                         (eulers, _euler_error, self.rotation_tolerance),
+                                         (scales, _vector_error, self.scale_tolerance)):
+            if values is not None and len(values):
+                values = np.asarray(values, dtype=np.float64)[:n]
+                channels.append((values.reshape(n, -1), error, tolerance))
+
+        keep = np.zeros(n, dtype=bool)
+        keep[[0, -1]] = True
+        times = np.asarray(times, dtype=np.float64)
+        segments = [(0, n - 1)]
+        while segments:
+            a, b = segments.pop()
+            if b - a < 2:
+                continue
+            t = (times[a+1:b] - times[a]) / (times[b] - times[a])
+            #error relative to the tolerance, the worst channel decides
+            error = np.zeros(b - a - 1)
+            for values, channel_error, tolerance in channels:
+                error = np.maximum(error, channel_error(values, a, b, t) / tolerance)
+            worst = int(np.argmax(error))
+            if error[worst] > 1.0:
+                split = a + 1 + worst
+                keep[split] = True
+                segments.append((a, split))
+                segments.append((split, b))
+        self.keys_before += n
+        self.keys_after += int(keep.sum())
+        return keep
+
+    def reduce_arrays(self, times, translations, quaternions, scales):
+        #Reduced copies of one bone's aligned key arrays, quaternions made continuous first
+        quaternions = continuous_quaternions(np.asarray(quaternions, dtype=np.float64))
+        keep = self.key_mask(times, translations, quaternions, None, scales)
+        return times[keep], translations[keep], quaternions[keep], scales[keep]
+
+    def summary(self):
+        removed = self.keys_before - self.keys_after
+        percent = 100.0 * removed / self.keys_before if self.keys_before else 0.0
+        return "Key reduction: {before} -> {after} bone keys ({percent:.0f}% removed)".format(before=self.keys_before, after=self.keys_after, percent=percent)
+
+
+def reduce_action(action, reduction):
+    """
+    Reduces the keys of every bone group of action in place. The f-curves of a group are rebuilt
+    with the kept keys and linear interpolation, which is what the tolerances were measured against.
+    Groups whose f-curves don't share the same number of keys (not a baked action) are left alone.
+    """
+    for group_name, fcurves in [(group.name, list(group.channels)) for group in action.groups]:
+        if not fcurves:
+            continue
+        n_keys = len(fcurves[0].keyframe_points)
+        if n_keys < 3 or any(len(fcu.keyframe_points) != n_keys for fcu in fcurves):
+            continue
+        keys = sample_bone_keys(group_name, fcurves)
+        frames = next(frames for frames in (keys.quaternion_frames, keys.euler_frames, keys.location_frames, keys.scale_frames) if frames is not None)
+        flips = quaternion_flips(keys.quaternion) if keys.quaternion is not None else None
+        quaternions = np.where(flips[:, np.newaxis], -keys.quaternion, keys.quaternion) if flips is not None else None
+        keep = reduction.key_mask(frames, keys.location, quaternions, keys.euler, keys.scale)
+        if keep.all() and (flips is None or not flips.any()):
+            continue
+
+        for fcu in fcurves:
+            coords = np.empty(n_keys * 2, dtype=np.float32)
+            fcu.keyframe_points.foreach_get("co", coords)
+            coords = coords.reshape(n_keys, 2)
+            if flips is not None and fcu.data_path.endswith("quaternion"):
+                coords[flips, 1] *= -1.0
+            coords = coords[keep]
+            data_path, index = fcu.data_path, fcu.array_index
+            action.fcurves.remove(fcu)
+            new_fcu = action.fcurves.new(data_path, index=index, action_group=group_name)
+            new_fcu.keyframe_points.add(len(coords))
+            new_fcu.keyframe_points.foreach_set("co", coords.ravel())
+            for point in new_fcu.keyframe_points:
+                point.interpolation = 'LINEAR'
+            new_fcu.update()
+    return reduction
@@ -0,0 +1,213 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Bulk f-curve sampling, reads keyframe_points with foreach_get into numpy arrays
+#instead of building a mathutils object per key.
+#Also samples the visual pose straight from the evaluated depsgraph, without baking an action,
+#all frames at once or in frame windows.
+
+import numpy as np
+
+
+def fcurve_keys(fcurves):
+    """
+    Keyframes of a channel group (e.g. the 4 quaternion f-curves of a bone).
+    Returns frames (n,) and values (n, len(fcurves)), channel order as given.
+    Like TransformAnimation.iter_frame_key keys are paired by index and cut to the shortest f-curve,
+    frames are taken from the first f-curve.
+    """
+    if not fcurves:
+        return np.zeros(0, dtype=np.float32), np.zeros((0, 0), dtype=np.float32)
+    n_keys = min(len(fcu.keyframe_points) for fcu in fcurves)
+    coords = np.empty((len(fcurves), n_keys * 2), dtype=np.float32)
+    for i, fcu in enumerate(fcurves):
+        points = fcu.keyframe_points
+        if len(points) == n_keys:
+            points.foreach_get("co", coords[i])
+        else:
+            buffer = np.empty(len(points) * 2, dtype=np.float32)
+            points.foreach_get("co", buffer)
+            coords[i] = buffer[:n_keys * 2]
+    coords = coords.reshape(len(fcurves), n_keys, 2)
+    return coords[0, :, 0].copy(), coords[:, :, 1].T.copy()
+
+
+class BoneKeys:
+    """Dense key arrays of one bone, None for channel groups that are not keyed."""
+
+    def __init__(self, name):
+        self.name = name
+        self.quaternion_frames = self.quaternion = None     #(n,), (n, 4) w x y z
+        self.euler_frames = self.euler = None               #(n,), (n, 3)
+        self.location_frames = self.location = None         #(n,), (n, 3)
+        self.scale_frames = self.scale = None               #(n,), (n, 3)
+
+    def aligned_length(self):
+        #Number of keys written to the dump, quaternion and location keys are paired by index
+        if self.quaternion is None or self.location is None:
+            return 0
+        return min(len(self.quaternion), len(self.location))
+
+    def aligned(self):
+        """
+        Quaternion, location and scale keys cut to a common length in one step, as the
+        dump pairs them by index. Scales default to 1.0 unless every quaternion key has one,
+        like export_transforms. Returns frames (n,), location (n, 3), quaternion (n, 4) and uniform scale (n,).
+        """
+        n = self.aligned_length()
+        if n == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros((0, 3), dtype=np.float32), np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        if self.scale is not None and len(self.scale) == len(self.quaternion):
+            scale = self.scale[:n, 0]
+        else:
+            scale = np.ones(n, dtype=np.float32)
+        return self.quaternion_frames[:n], self.location[:n], self.quaternion[:n], scale
+
+
+def sample_bone_keys(name, exp_fcurves):
+    #Splits a bone's f-curve group into its channel groups and reads each of them in bulk
+    keys = BoneKeys(name)
+    channels = {"quaternion": [], "euler": [], "location": [], "scale": []}
+    for fcu in exp_fcurves:
+        for suffix, fcus in channels.items():
+            if fcu.data_path.endswith(suffix):
+                fcus.append(fcu)
+                break
+    for suffix, fcus in channels.items():
+        if fcus:
+            frames, values = fcurve_keys(fcus)
+            setattr(keys, suffix+"_frames", frames)
+            setattr(keys, suffix, values)
+    return keys
+
+
+class VisualPoseSamples:
+    """
+    Visual pose of an armature sampled frame by frame. matrices (n_frames, n_bones, 4, 4) are row major
+    local bone matrices, what visual keying would write to the bones' location, rotation and scale.
+    """
+
+    def __init__(self, frames, bone_names, matrices):
+        self.frames = frames
+        self.bone_names = bone_names
+        self.matrices = matrices
+        self.bone_index = {name: i for i, name in enumerate(bone_names)}
+
+    def bone_matrices(self, name):
+        #(n_frames, 4, 4) local matrices of one bone
+        return self.matrices[:, self.bone_index[name]]
+
+
+def _has_default_inheritance(bone):
+    return bone.use_inherit_rotation and bone.use_local_location and getattr(bone, "inherit_scale", "FULL") == "FULL"
+
+
+class PoseSampler:
+    """
+    Reads the evaluated pose matrices of all bones of arm_obj in bulk with foreach_get. Pose space matrices
+    are turned into local matrices with numpy, bones with non default inheritance (rotation, scale or local
+    location) go through convert_space instead. The rest pose data is collected once, sample() can then be
+    called for any number of frame windows.
+    """
+
+    def __init__(self, arm_obj):
+        bones = arm_obj.data.bones
+        self.arm_obj = arm_obj
+        self.n_bones = len(bones)
+        self.bone_names = [bone.name for bone in bones]
+        self.parent_idx = np.array([bones.find(bone.parent.name) if bone.parent else -1 for bone in bones])
+        rest = np.empty(self.n_bones * 16, dtype=np.float32)
+        bones.foreach_get("matrix_local", rest)
+        #rna matrices are stored column major
+        self.rest = rest.reshape(self.n_bones, 4, 4).transpose(0, 2, 1).astype(np.float64)
+        self.rest_inv = np.linalg.inv(self.rest)
+        self.fallback = [i for i, bone in enumerate(bones) if not _has_default_inheritance(bone)]
+        #pose.bones are not guaranteed to be in the order of data.bones
+        self.pose_order = np.array([bones.find(pose_bone.name) for pose_bone in arm_obj.pose.bones])
+        self.buffer = np.empty(self.n_bones * 16, dtype=np.float32)
+
+    def sample(self, context, frames):
+        """
+        Steps the scene through frames and returns their VisualPoseSamples. The current frame
+        is restored afterwards, nothing is keyed.
+        """
+        scene = context.scene
+        n_bones = self.n_bones
+        pose = np.empty((len(frames), n_bones, 4, 4), dtype=np.float64)
+        local = np.empty((len(frames), n_bones, 4, 4), dtype=np.float64)
+        old_frame, old_subframe = scene.frame_current, scene.frame_subframe
+        try:
+            for i, frame in enumerate(frames):
+                scene.frame_set(int(frame), subframe=frame - int(frame))
+                eval_obj = self.arm_obj.evaluated_get(context.evaluated_depsgraph_get())
+                eval_obj.pose.bones.foreach_get("matrix", self.buffer)
+                pose[i, self.pose_order] = self.buffer.reshape(n_bones, 4, 4).transpose(0, 2, 1)
+                for b in self.fallback:
+                    pose_bone = eval_obj.pose.bones[self.bone_names[b]]
+                    local[i, b] = np.array(eval_obj.convert_space(pose_bone=pose_bone, matrix=pose_bone.matrix, from_space='POSE', to_space='LOCAL'))
+        finally:
+            scene.frame_set(old_frame, subframe=old_subframe)
+
+        #local = (rest relative to parent)^-1 @ parent pose^-1 @ pose, for all frames of a bone at once
+        fallback = set(self.fallback)
+        for b in range(n_bones):
+            if b in fallback:
+                continue
+            p = self.parent_idx[b]
+            if p < 0:
+                local[:, b] = self.rest_inv[b] @ pose[:, b]
+            else:
+                rest_rel_inv = self.rest_inv[b] @ self.rest[p]
+                local[:, b] = rest_rel_inv @ np.linalg.inv(pose[:, p]) @ pose[:, b]
+        return VisualPoseSamples(np.asarray(frames, dtype=np.float64), self.bone_names, local)
+
+
+def sample_visual_pose(context, arm_obj, frame_start, frame_end, step=1):
+    """
+    Steps the scene from frame_start to frame_end and reads the visual pose of every frame
+    into one preallocated array (PoseSampler).
+    """
+    frames = np.arange(frame_start, frame_end + 1, step, dtype=np.float64)
+    return PoseSampler(arm_obj).sample(context, frames)
+
+
+def iter_visual_pose(context, arm_obj, frame_start, frame_end, window, step=1):
+    #VisualPoseSamples of frame_start to frame_end, window frames at a time, memory is bounded by the window
+    sampler = PoseSampler(arm_obj)
+    frames = np.arange(frame_start, frame_end + 1, step, dtype=np.float64)
+    for first in range(0, len(frames), max(1, window)):
+        yield sampler.sample(context, frames[first:first + window])
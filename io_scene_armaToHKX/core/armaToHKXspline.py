@@ -0,0 +1,604 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+#Pure python/numpy encoder (and decoder) for hkaSplineCompressedAnimation, hk_2010.2.0-r1.
+#The clip is cut into blocks of up to max_frames_per_block frames (neighbouring blocks share a frame).
+#Per block and track, position, rotation and scale are each identity, static (one value) or a clamped
+#B-spline over the block's frames, fitted by least squares with as few control points as the tolerance
+#allows. Control points are quantized: positions/scales to 8 or 16 bits within their per block range,
+#rotations as THREECOMP48 (or uncompressed). Errors are measured on the decoded bytes.
+
+import struct
+import time
+from functools import lru_cache
+
+import numpy as np
+
+#quantization types, stored in the low (position), middle (rotation) and high (scale) bits of a track mask
+QUANTIZATION_BITS8 = 0
+QUANTIZATION_BITS16 = 1
+QUANTIZATION_FROM_BITS = {8: QUANTIZATION_BITS8, 16: QUANTIZATION_BITS16}
+ROTATION_THREECOMP48 = 2
+ROTATION_UNCOMPRESSED = 5
+ROTATION_QUANTIZATIONS = {"THREECOMP48": ROTATION_THREECOMP48, "UNCOMPRESSED": ROTATION_UNCOMPRESSED}
+#(size, alignment) of one quantized rotation
+ROTATION_SIZES = {ROTATION_THREECOMP48: (6, 2), ROTATION_UNCOMPRESSED: (16, 4)}
+
+#per component flags of the position/scale masks, components with neither are identity
+STATIC_FLAGS = (0x01, 0x02, 0x04)
+SPLINE_FLAGS = (0x10, 0x20, 0x40)
+#rotations are static or spline as a whole
+ROTATION_STATIC = 0x0F
+ROTATION_SPLINE = 0xF0
+
+THREECOMP48_FRACTAL = 0.000043161
+THREECOMP48_MASK = 0x7FFF
+THREECOMP48_HALF = THREECOMP48_MASK >> 1
+
+#components kept by THREECOMP48 for each dropped component
+_THREECOMP48_KEPT = np.array([[i for i in range(4) if i != dropped] for dropped in range(4)])
+
+IDENTITY_QUATERNION = np.array((0.0, 0.0, 0.0, 1.0))
+#havok can store at most 256 frames per block, knots are uint8 frame numbers
+MAX_FRAMES_PER_BLOCK = 256
+
+
+class SplineSettings:
+    """Block size, spline degree, tolerances (havok units and radians) and quantization of an encoding."""
+
+    def __init__(self, max_frames_per_block=MAX_FRAMES_PER_BLOCK, degree=3, translation_tolerance=0.01, rotation_tolerance=0.001, scale_tolerance=0.001, position_bits=16, scale_bits=16, rotation_quantization="THREECOMP48"):
+        if not 2 <= max_frames_per_block <= MAX_FRAMES_PER_BLOCK:
+            raise ValueError("max_frames_per_block must be between 2 and {n}".format(n=MAX_FRAMES_PER_BLOCK))
+        self.max_frames_per_block = max_frames_per_block
+        self.degree = degree
+        self.translation_tolerance = translation_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self.scale_tolerance = scale_tolerance
+        self.position_quantization = QUANTIZATION_FROM_BITS[position_bits]
+        self.scale_quantization = QUANTIZATION_FROM_BITS[scale_bits]
+        self.rotation_quantization = ROTATION_QUANTIZATIONS[rotation_quantization]
+
+    def __repr__(self):
+        return "SplineSettings(block={b}, degree={d}, tolerances={t:g}/{r:g}/{s:g}, position {pb} bits, scale {sb} bits, rotation {rq})".format(
+            b=self.max_frames_per_block, d=self.degree, t=self.translation_tolerance, r=self.rotation_tolerance, s=self.scale_tolerance,
+            pb=8 << self.position_quantization, sb=8 << self.scale_quantization,
+            rq=[name for name, value in ROTATION_QUANTIZATIONS.items() if value == self.rotation_quantization][0])
+
+
+class SplineAnimation:
+    """Encoded clip, the members of hkaSplineCompressedAnimation."""
+
+    def __init__(self, num_tracks, num_frames, frame_duration, max_frames_per_block, block_offsets, float_block_offsets, data):
+        self.num_tracks = num_tracks
+        self.num_frames = num_frames
+        self.frame_duration = frame_duration
+        self.max_frames_per_block = max_frames_per_block
+        self.block_offsets = block_offsets
+        self.float_block_offsets = float_block_offsets
+        self.data = data
+
+    @property
+    def num_blocks(self):
+        return len(self.block_offsets)
+
+    @property
+    def mask_size(self):
+        #4 mask bytes per transform track, no float tracks
+        return 4 * self.num_tracks
+
+    @property
+    def block_duration(self):
+        return (self.max_frames_per_block - 1) * self.frame_duration
+
+    @property
+    def duration(self):
+        return (self.num_frames - 1) * self.frame_duration
+
+
+def block_ranges(num_frames, max_frames_per_block):
+    #(first, last) frame of every block, the last frame of a block is the first of the next
+    step = max_frames_per_block - 1
+    ranges = []
+    first = 0
+    while True:
+        last = min(first + step, num_frames - 1)
+        ranges.append((first, last))
+        if last >= num_frames - 1:
+            return ranges
+        first = last
+
+
+def basis_matrix(knots, degree, t):
+    #(len(t), n_control_points) clamped B-spline basis (Cox-de Boor), evaluated like havok's findSpan/de Boor
+    knots = np.asarray(knots, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[:, np.newaxis]
+    basis = ((t >= knots[:-1]) & (t < knots[1:])).astype(np.float64)
+    #t at the end of the range belongs to the last non empty span
+    spans = np.nonzero(knots[:-1] < knots[1:])[0]
+    at_end = t[:, 0] >= knots[-1]
+    basis[at_end] = 0.0
+    basis[at_end, spans[-1]] = 1.0
+    for k in range(1, degree + 1):
+        left_den = knots[k:-1] - knots[:-k-1]
+        right_den = knots[k+1:] - knots[1:-k]
+        left = np.divide(t - knots[:-k-1], left_den, out=np.zeros((len(t), len(left_den))), where=left_den > 0)
+        right = np.divide(knots[k+1:] - t, right_den, out=np.zeros((len(t), len(right_den))), where=right_den > 0)
+        basis = left * basis[:, :-1] + right * basis[:, 1:]
+    return basis
+
+
+def _knot_vector(n_frames, n_control_points, degree):
+    interior = np.round(np.linspace(0.0, n_frames - 1, n_control_points - degree + 1))[1:-1]
+    return np.concatenate((np.zeros(degree + 1), interior, np.full(degree + 1, float(n_frames - 1))))
+
+
+def encode_threecomp48(quats):
+    #(n, 4) x y z w unit quaternions -> (n, 3) uint16, the largest component is dropped
+    quats = np.asarray(quats, dtype=np.float64)
+    n = len(quats)
+    dropped = np.argmax(np.abs(quats), axis=1)
+    sign = quats[np.arange(n), dropped] < 0.0
+    others = quats[np.arange(n)[:, np.newaxis], _THREECOMP48_KEPT[dropped]]
+    values = np.clip(np.round(others / THREECOMP48_FRACTAL) + THREECOMP48_HALF, 0, THREECOMP48_MASK).astype(np.uint16)
+    values[:, 0] |= ((dropped & 1) << 15).astype(np.uint16)
+    values[:, 1] |= ((dropped >> 1) << 15).astype(np.uint16)
+    values[:, 2] |= (sign.astype(np.uint16) << 15)
+    return values
+
+
+def decode_threecomp48(values):
+    #(n, 3) uint16 -> (n, 4) x y z w, like havok's unpackQuaternion48
+    values = np.asarray(values, dtype=np.uint16).astype(np.int64)
+    n = len(values)
+    dropped = ((values[:, 1] >> 14) & 2) | ((values[:, 0] >> 15) & 1)
+    sign = (values[:, 2] >> 15) != 0
+    others = ((values & THREECOMP48_MASK) - THREECOMP48_HALF) * THREECOMP48_FRACTAL
+    w = np.sqrt(np.maximum(0.0, 1.0 - (others ** 2).sum(axis=1)))
+    w[sign] *= -1.0
+    quats = np.empty((n, 4))
+    quats[np.arange(n)[:, np.newaxis], _THREECOMP48_KEPT[dropped]] = others
+    quats[np.arange(n), dropped] = w
+    return quats
+
+
+def _quantize_rotations(quats, rotation_quantization):
+    #-> (packed rotations, decoded (n, 4)), the packed array's tobytes() is what gets written
+    quats = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+    if rotation_quantization == ROTATION_THREECOMP48:
+        values = encode_threecomp48(quats).astype("<u2")
+        return values, decode_threecomp48(values)
+    packed = quats.astype("<f4")
+    return packed, packed.astype(np.float64)
+
+
+def _rotation_angles(evaluated, quats):
+    evaluated = evaluated / np.linalg.norm(evaluated, axis=1, keepdims=True)
+    return 2.0 * np.arccos(np.clip(np.abs(np.einsum("ij,ij->i", evaluated, quats)), 0.0, 1.0))
+
+
+@lru_cache(maxsize=1024)
+def _least_squares_spline(n_frames, n_control_points, degree):
+    #knots, basis and pseudo inverse of a block layout, shared by every track and channel of the same length
+    knots = _knot_vector(n_frames, n_control_points, degree)
+    basis = basis_matrix(knots, degree, np.arange(n_frames, dtype=np.float64))
+    return knots, basis, np.linalg.pinv(basis)
+
+
+def _fit(values, degree, quantize, error):
+    """
+    Spline with the fewest control points whose quantized version has error(evaluated) <= 1, binary search
+    over the control point count. If none does, a linear spline through every frame. Returns (knots, degree, payload).
+    """
+    n = len(values)
+    degree = min(degree, n - 1)
+
+    def attempt(n_control_points, degree):
+        knots, basis, pseudo_inverse = _least_squares_spline(n, n_control_points, degree)
+        payload, decoded = quantize(pseudo_inverse @ values)
+        return error(basis @ decoded), (knots, degree, payload)
+
+    low, high = degree + 1, n
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        worst, result = attempt(middle, degree)
+        if worst <= 1.0:
+            best = result
+            high = middle - 1
+        else:
+            low = middle + 1
+    if best is None:
+        #noisy channel, a higher degree spline through every frame overshoots wildly between the keys
+        #and its huge control points do not survive quantization, the linear one's are the keys themselves
+        best = attempt(n, min(1, degree))[1]
+    return best
+
+
+def _pad(buffer, alignment):
+    buffer.extend(bytes(-len(buffer) % alignment))
+
+
+def _spline_header(buffer, knots, degree):
+    buffer += struct.pack("<HB", len(knots) - degree - 2, degree)
+    buffer += bytes(np.round(knots).astype(np.uint8))
+
+
+def _encode_vector(buffer, values, tolerance, identity, quantization, degree):
+    """Writes one position or scale channel (n, 3) of a block and returns its mask flags."""
+    low, high = values.min(axis=0), values.max(axis=0)
+    middle = (low + high) / 2.0
+    static = (high - low) <= tolerance
+    flags = 0
+    for axis in range(3):
+        if not static[axis]:
+            flags |= SPLINE_FLAGS[axis]
+        elif abs(middle[axis] - identity) > tolerance / 2.0:
+            flags |= STATIC_FLAGS[axis]
+    spline_axes = [axis for axis in range(3) if flags & SPLINE_FLAGS[axis]]
+
+    if not spline_axes:
+        for axis in range(3):
+            if flags & STATIC_FLAGS[axis]:
+                buffer += struct.pack("<f", middle[axis])
+        return flags
+
+    #static and identity components as the decoder will see them
+    fixed = np.array([float(np.float32(middle[axis])) if flags & STATIC_FLAGS[axis] else identity for axis in range(3)])
+    max_value = (1 << (8 << quantization)) - 1
+
+    def quantize(control_points):
+        ranges = []
+        quantized = np.zeros(control_points.shape, dtype=np.int64)
+        decoded = np.empty_like(control_points)
+        for i in range(len(spline_axes)):
+            cp_low, cp_high = float(np.float32(control_points[:, i].min())), float(np.float32(control_points[:, i].max()))
+            span = cp_high - cp_low
+            if span > 0.0:
+                quantized[:, i] = np.clip(np.round((control_points[:, i] - cp_low) / span * max_value), 0, max_value)
+            decoded[:, i] = cp_low + quantized[:, i] / max_value * span
+            ranges.append((cp_low, cp_high))
+        return (ranges, quantized), decoded
+
+    def error(evaluated):
+        full = np.tile(fixed, (len(values), 1))
+        full[:, spline_axes] = evaluated
+        return np.linalg.norm(full - values, axis=1).max() / tolerance
+
+    knots, degree, (ranges, quantized) = _fit(values[:, spline_axes], degree, quantize, error)
+    _spline_header(buffer, knots, degree)
+    _pad(buffer, 4)
+    ranges = iter(ranges)
+    for axis in range(3):
+        if flags & SPLINE_FLAGS[axis]:
+            buffer += struct.pack("<2f", *next(ranges))
+        elif flags & STATIC_FLAGS[axis]:
+            buffer += struct.pack("<f", middle[axis])
+    buffer += quantized.astype("<u2" if quantization == QUANTIZATION_BITS16 else "u1").tobytes()
+    _pad(buffer, 4)
+    return flags
+
+
+def _encode_rotation(buffer, quats, tolerance, rotation_quantization, degree):
+    """Writes one rotation channel (n, 4) x y z w of a block and returns its mask flags."""
+    alignment = ROTATION_SIZES[rotation_quantization][1]
+    if _rotation_angles(np.tile(IDENTITY_QUATERNION, (len(quats), 1)), quats).max() <= tolerance:
+        return 0
+
+    mean = quats.mean(axis=0)
+    if np.linalg.norm(mean) < 1e-6:
+        mean = quats[0]
+    payload, decoded = _quantize_rotations(mean[np.newaxis], rotation_quantization)
+    if _rotation_angles(np.tile(decoded[0], (len(quats), 1)), quats).max() <= tolerance:
+        _pad(buffer, alignment)
+        buffer += payload.tobytes()
+        _pad(buffer, 4)
+        return ROTATION_STATIC
+
+    def quantize(control_points):
+        return _quantize_rotations(control_points, rotation_quantization)
+
+    def error(evaluated):
+        return _rotation_angles(evaluated, quats).max() / tolerance
+
+    knots, degree, payload = _fit(quats, degree, quantize, error)
+    _spline_header(buffer, knots, degree)
+    _pad(buffer, alignment)
+    buffer += payload.tobytes()
+    _pad(buffer, 4)
+    return ROTATION_SPLINE
+
+
+def _xyzw(quaternions):
+    #(..., 4) w x y z -> x y z w
+    return np.concatenate((quaternions[..., 1:4], quaternions[..., 0:1]), axis=-1)
+
+
+def encode_spline_animation(translations, quaternions, scales, frame_duration, settings=None):
+    """
+    Encodes per bone key arrays, one key per frame: translations (n_frames, n_tracks, 3),
+    quaternions (n_frames, n_tracks, 4) w x y z as export_transforms computes them, uniform
+    scales (n_frames, n_tracks) or (n_frames, n_tracks, 3). Returns a SplineAnimation.
+    """
+    settings = settings or SplineSettings()
+    translations = np.asarray(translations, dtype=np.float64)
+    quats = _xyzw(np.asarray(quaternions, dtype=np.float64))
+    scales = np.asarray(scales, dtype=np.float64)
+    if scales.ndim == 2:
+        scales = np.repeat(scales[:, :, np.newaxis], 3, axis=2)
+    num_frames, num_tracks = quats.shape[:2]
+    quats = _continuous(quats)
+
+    data = bytearray()
+    block_offsets = []
+    float_block_offsets = []
+    for first, last in block_ranges(num_frames, settings.max_frames_per_block):
+        _pad(data, 16)
+        frames = slice(first, last + 1)
+        block = _encode_block(translations[frames], quats[frames], scales[frames], settings)
+        block_offsets.append(len(data))
+        data += block
+        float_block_offsets.append(len(block))
+    _pad(data, 16)
+    return SplineAnimation(num_tracks, num_frames, frame_duration, settings.max_frames_per_block, block_offsets, float_block_offsets, bytes(data))
+
+
+def _continuous(quats, previous=None):
+    #hemisphere continuity per track, splines interpolate the short way. previous (n_tracks, 4) is the frame before quats
+    if previous is not None:
+        quats = np.concatenate((previous[np.newaxis], quats))
+    signs = np.where(np.einsum("ftk,ftk->ft", quats[1:], quats[:-1]) < 0.0, -1.0, 1.0)
+    quats = quats * np.concatenate((np.ones((1, quats.shape[1])), np.cumprod(signs, axis=0)))[:, :, np.newaxis]
+    return quats if previous is None else quats[1:]
+
+
+def _encode_block(translations, quats, scales, settings):
+    #masks and data of one block, (n_frames, n_tracks, 3/4/3) arrays of the block's frames, quats x y z w
+    quantization = settings.position_quantization | (settings.rotation_quantization << 2) | (settings.scale_quantization << 6)
+    masks = bytearray()
+    body = bytearray()
+    for track in range(quats.shape[1]):
+        position_flags = _encode_vector(body, translations[:, track], settings.translation_tolerance, 0.0, settings.position_quantization, settings.degree)
+        rotation_flags = _encode_rotation(body, quats[:, track], settings.rotation_tolerance, settings.rotation_quantization, settings.degree)
+        scale_flags = _encode_vector(body, scales[:, track], settings.scale_tolerance, 1.0, settings.scale_quantization, settings.degree)
+        masks += struct.pack("<4B", quantization, position_flags, rotation_flags, scale_flags)
+    return masks + body
+
+
+def _block_errors(block, translations, quats, scales):
+    #largest decoded translation, rotation and scale error of an encoded block
+    num_frames, num_tracks = quats.shape[:2]
+    decoded_translations, decoded_quats, decoded_scales = _decode_block(block, 0, 4 * num_tracks, num_tracks, np.arange(num_frames, dtype=np.float64))
+    dots = np.abs(np.einsum("ftk,ftk->ft", decoded_quats, quats / np.linalg.norm(quats, axis=2, keepdims=True)))
+    return (np.linalg.norm(decoded_translations - translations, axis=2).max(),
+        (2.0 * np.arccos(np.clip(dots, 0.0, 1.0))).max(),
+        np.abs(decoded_scales - scales).max())
+
+
+def encode_spline_blocks(read_frames, num_frames, num_tracks, frame_duration, out, settings=None):
+    """
+    Block by block encode_spline_animation for clips too long to hold in memory. read_frames(first, last) returns
+    the translations, quaternions (w x y z) and scales of frames first to last (inclusive) in the layout
+    encode_spline_animation takes. Blocks are encoded, checked against their input and written to the binary file
+    out one at a time. Returns (SplineAnimation, SplineReport), the animation's data is None, it is in out.
+    """
+    settings = settings or SplineSettings()
+    start = time.perf_counter()
+    size = 0
+    block_offsets = []
+    float_block_offsets = []
+    errors = np.zeros(3)
+    previous = None
+    for first, last in block_ranges(num_frames, settings.max_frames_per_block):
+        translations, quaternions, scales = read_frames(first, last)
+        translations = np.asarray(translations, dtype=np.float64)
+        quats = _continuous(_xyzw(np.asarray(quaternions, dtype=np.float64)), previous)
+        scales = np.asarray(scales, dtype=np.float64)
+        if scales.ndim == 2:
+            scales = np.repeat(scales[:, :, np.newaxis], 3, axis=2)
+        #the first frame of a block is the last of the one before
+        previous = quats[-1]
+        padding = bytes(-size % 16)
+        out.write(padding)
+        size += len(padding)
+        block = _encode_block(translations, quats, scales, settings)
+        errors = np.maximum(errors, _block_errors(block, translations, quats, scales))
+        block_offsets.append(size)
+        out.write(block)
+        size += len(block)
+        float_block_offsets.append(len(block))
+    out.write(bytes(-size % 16))
+    size += -size % 16
+    animation = SplineAnimation(num_tracks, num_frames, frame_duration, settings.max_frames_per_block, block_offsets, float_block_offsets, None)
+    report = SplineReport(settings, size, num_frames * num_tracks * 48, *errors, time.perf_counter() - start)
+    return animation, report
+
+
+class _Reader:
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def read(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def bytes(self, size):
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def align(self, alignment):
+        self.offset += -self.offset % alignment
+
+
+def _decode_vector(reader, flags, quantization, identity, t):
+    values = np.full((len(t), 3), identity)
+    spline_axes = [axis for axis in range(3) if flags & SPLINE_FLAGS[axis]]
+    if not spline_axes:
+        for axis in range(3):
+            if flags & STATIC_FLAGS[axis]:
+                values[:, axis] = reader.read("<f")[0]
+        return values
+    n_items, degree = reader.read("<HB")
+    knots = np.frombuffer(reader.bytes(n_items + degree + 2), dtype=np.uint8).astype(np.float64)
+    reader.align(4)
+    ranges = []
+    for axis in range(3):
+        if flags & SPLINE_FLAGS[axis]:
+            ranges.append(reader.read("<2f"))
+        elif flags & STATIC_FLAGS[axis]:
+            values[:, axis] = reader.read("<f")[0]
+    dtype = np.dtype("<u2" if quantization == QUANTIZATION_BITS16 else "u1")
+    count = (n_items + 1) * len(spline_axes)
+    quantized = np.frombuffer(reader.bytes(count * dtype.itemsize), dtype=dtype).reshape(n_items + 1, len(spline_axes))
+    max_value = (1 << (8 << quantization)) - 1
+    control_points = np.empty(quantized.shape)
+    for i, (low, high) in enumerate(ranges):
+        control_points[:, i] = low + quantized[:, i] / max_value * (high - low)
+    values[:, spline_axes] = basis_matrix(knots, degree, t) @ control_points
+    reader.align(4)
+    return values
+
+
+def _read_rotations(reader, count, rotation_quantization):
+    size = ROTATION_SIZES[rotation_quantization][0]
+    raw = reader.bytes(count * size)
+    if rotation_quantization == ROTATION_THREECOMP48:
+        return decode_threecomp48(np.frombuffer(raw, dtype="<u2").reshape(count, 3))
+    if rotation_quantization == ROTATION_UNCOMPRESSED:
+        return np.frombuffer(raw, dtype="<f4").reshape(count, 4).astype(np.float64)
+    raise ValueError("Rotation quantization {q} is not supported".format(q=rotation_quantization))
+
+
+def _decode_rotation(reader, flags, rotation_quantization, t):
+    alignment = ROTATION_SIZES[rotation_quantization][1]
+    if flags & ROTATION_SPLINE:
+        n_items, degree = reader.read("<HB")
+        knots = np.frombuffer(reader.bytes(n_items + degree + 2), dtype=np.uint8).astype(np.float64)
+        reader.align(alignment)
+        quats = basis_matrix(knots, degree, t) @ _read_rotations(reader, n_items + 1, rotation_quantization)
+        quats /= np.linalg.norm(quats, axis=1, keepdims=True)
+    elif flags & ROTATION_STATIC:
+        reader.align(alignment)
+        quats = np.tile(_read_rotations(reader, 1, rotation_quantization)[0], (len(t), 1))
+    else:
+        quats = np.tile(IDENTITY_QUATERNION, (len(t), 1))
+    reader.align(4)
+    return quats
+
+
+def decode_spline_animation(animation):
+    """
+    Decodes every frame of a SplineAnimation (or anything with its members, such as a packfile reader's
+    animation). Returns translations (n_frames, n_tracks, 3), quaternions (n_frames, n_tracks, 4) x y z w
+    and scales (n_frames, n_tracks, 3).
+    """
+    num_frames, num_tracks = animation.num_frames, animation.num_tracks
+    translations = np.empty((num_frames, num_tracks, 3))
+    quats = np.empty((num_frames, num_tracks, 4))
+    scales = np.empty((num_frames, num_tracks, 3))
+    data = bytes(animation.data)
+    for block, (first, last) in enumerate(block_ranges(num_frames, animation.max_frames_per_block)):
+        t = np.arange(last - first + 1, dtype=np.float64)
+        frames = slice(first, last + 1)
+        translations[frames], quats[frames], scales[frames] = _decode_block(data, animation.block_offsets[block], animation.mask_size, num_tracks, t)
+    return translations, quats, scales
+
+
+def _decode_block(data, offset, mask_size, num_tracks, t):
+    #translations, quaternions (x y z w) and scales (len(t), num_tracks, 3/4/3) of the block at offset
+    translations = np.empty((len(t), num_tracks, 3))
+    quats = np.empty((len(t), num_tracks, 4))
+    scales = np.empty((len(t), num_tracks, 3))
+    masks = data[offset:offset + mask_size]
+    reader = _Reader(data, offset + mask_size)
+    reader.align(4)
+    for track in range(num_tracks):
+        quantization, position_flags, rotation_flags, scale_flags = masks[4 * track:4 * track + 4]
+        translations[:, track] = _decode_vector(reader, position_flags, quantization & 0x3, 0.0, t)
+        quats[:, track] = _decode_rotation(reader, rotation_flags, (quantization >> 2) & 0xF, t)
+        scales[:, track] = _decode_vector(reader, scale_flags, (quantization >> 6) & 0x3, 1.0, t)
+    return translations, quats, scales
+
+
+class SplineReport:
+    """Size and decoded error of an encoding, against the interleaved uncompressed size."""
+
+    def __init__(self, settings, size, uncompressed_size, translation_error, rotation_error, scale_error, encode_time):
+        self.settings = settings
+        self.size = size
+        self.uncompressed_size = uncompressed_size
+        self.translation_error = translation_error
+        self.rotation_error = rotation_error
+        self.scale_error = scale_error
+        self.encode_time = encode_time
+
+    @property
+    def ratio(self):
+        return self.size / self.uncompressed_size if self.uncompressed_size else 0.0
+
+    def summary(self):
+        return "Spline compressed {size} bytes ({percent:.1f}% of {uncompressed} uncompressed) in {t:.2f}s, max error {te:.5f} translation, {re:.4f} deg rotation, {se:.5f} scale".format(
+            size=self.size, percent=100.0 * self.ratio, uncompressed=self.uncompressed_size, t=self.encode_time,
+            te=self.translation_error, re=np.degrees(self.rotation_error), se=self.scale_error)
+
+
+def compress_tracks(translations, quaternions, scales, frame_duration, settings=None):
+    """encode_spline_animation, then decodes the result to measure its error. Returns (SplineAnimation, SplineReport)."""
+    settings = settings or SplineSettings()
+    start = time.perf_counter()
+    animation = encode_spline_animation(translations, quaternions, scales, frame_duration, settings)
+    encode_time = time.perf_counter() - start
+
+    decoded_translations, decoded_quats, decoded_scales = decode_spline_animation(animation)
+    quats = _xyzw(np.asarray(quaternions, dtype=np.float64))
+    scales = np.asarray(scales, dtype=np.float64)
+    if scales.ndim == 2:
+        scales = np.repeat(scales[:, :, np.newaxis], 3, axis=2)
+    translation_error = np.linalg.norm(decoded_translations - translations, axis=2).max()
+    dots = np.abs(np.einsum("ftk,ftk->ft", decoded_quats, quats / np.linalg.norm(quats, axis=2, keepdims=True)))
+    rotation_error = (2.0 * np.arccos(np.clip(dots, 0.0, 1.0))).max()
+    scale_error = np.abs(decoded_scales - scales).max()
+    #interleaved uncompressed: one 48 byte hkQsTransform per track and frame
+    uncompressed_size = animation.num_frames * animation.num_tracks * 48
+    return animation, SplineReport(settings, len(animation.data), uncompressed_size, translation_error, rotation_error, scale_error, encode_time)
+
+
+def compression_tradeoff(translations, quaternions, scales, frame_duration, settings_list):
+    #SplineReport of every settings, to pick block size, degree, tolerances and bit depths for a clip
+    return [compress_tracks(translations, quaternions, scales, frame_duration, settings)[1] for settings in settings_list]
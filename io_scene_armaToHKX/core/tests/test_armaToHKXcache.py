@@ -0,0 +1,90 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import os
+
+from io_scene_armaToHKX.core.armaToHKXcache import ExportCache, CACHE_DIRNAME
+
+
+def _write(path, size, fill=b"x"):
+    with open(path, "wb") as f:
+        f.write(fill * size)
+    return path
+
+
+def _age(cache, key, seconds):
+    #move the entry's mtime back, the eviction order goes by mtime
+    path = cache._path(key)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - int(seconds * 1e9)))
+
+
+def test_fetch_miss_and_hit(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    dst = str(tmp_path / "out.hkx")
+    assert not cache.fetch("missing", dst)
+    assert not os.path.exists(dst)
+    cache.store("a", _write(str(tmp_path / "a.hkx"), 10, b"a"))
+    assert cache.fetch("a", dst)
+    with open(dst, "rb") as f:
+        assert f.read() == b"a" * 10
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ExportCache(str(tmp_path), max_bytes=250)
+    for i, key in enumerate(("a", "b")):
+        cache.store(key, _write(str(tmp_path / (key + ".hkx")), 100))
+        _age(cache, key, 100 - i)
+    #a fetch marks "a" as recently used, so "b" is the oldest when "c" goes over max_bytes
+    assert cache.fetch("a", str(tmp_path / "out.hkx"))
+    cache.store("c", _write(str(tmp_path / "c.hkx"), 100))
+    cached = sorted(os.listdir(str(tmp_path / CACHE_DIRNAME)))
+    assert cached == ["a.hkx", "c.hkx"]
+
+
+def test_conversion_key(tmp_path):
+    src = _write(str(tmp_path / "skeleton.xml"), 10)
+    converter = _write(str(tmp_path / "hkxcmd.exe"), 5)
+    key = ExportCache.conversion_key(src, "LE", converter)
+    assert key == ExportCache.conversion_key(src, "LE", converter)
+    assert key != ExportCache.conversion_key(src, "SSE", converter)
+    _write(src, 10, b"y")
+    assert key != ExportCache.conversion_key(src, "LE", converter)
+    #a rebuilt converter must not hit the old outputs
+    _write(src, 10)
+    _write(converter, 6)
+    assert key != ExportCache.conversion_key(src, "LE", converter)
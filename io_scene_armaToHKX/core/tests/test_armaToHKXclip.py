@@ -0,0 +1,136 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import io
+
+import numpy as np
+import pytest
+
+from io_scene_armaToHKX.core.armaToHKXclip import ClipWriter, ClipReader, allocate_clip, export_text_dump, CLIP_EXTENSION
+from io_scene_armaToHKX.core.armaToHKXdump import AnimationDumpWriter
+
+
+def _bones(seed=0):
+    #name: (times, translations, quaternions, scales), with a non ascii name and a bone without keys
+    rng = np.random.default_rng(seed)
+    bones = {}
+    for name, n in (("NPC Root [Root]", 5), ("Bip01 ü", 3), ("empty", 0)):
+        bones[name] = (np.arange(n) / 30.0, rng.normal(size=(n, 3)), rng.normal(size=(n, 4)), np.ones(n))
+    return bones
+
+
+def _write(writer, bones, duration=1.5):
+    with writer:
+        writer.write_header(duration)
+        for name, keys in bones.items():
+            writer.write_bone(name, *keys)
+    return writer
+
+
+def _assert_keys(reader, bones):
+    assert reader.bone_names == list(bones)
+    for name, (times, translations, quaternions, scales) in bones.items():
+        track = reader.track(name)
+        assert track.key_count == len(times)
+        assert np.array_equal(track.times, times.astype("<f4"))
+        assert np.array_equal(track.translations, translations.astype("<f4"))
+        assert np.array_equal(track.quaternions, quaternions.astype("<f4"))
+        assert np.array_equal(track.scales, scales.astype("<f4"))
+
+
+def test_in_memory_round_trip():
+    bones = _bones()
+    reader = ClipReader(_write(ClipWriter.in_memory(), bones).getvalue())
+    assert reader.duration == 1.5
+    _assert_keys(reader, bones)
+
+
+def test_file_round_trip(tmp_path):
+    bones = _bones()
+    path = tmp_path / ("walk" + CLIP_EXTENSION)
+    _write(ClipWriter(path), bones)
+    with ClipReader(path) as reader:
+        _assert_keys(reader, bones)
+        assert [track.name for track in reader.tracks()] == list(bones)
+
+
+def test_key_count():
+    times, translations, quaternions, scales = _bones()["NPC Root [Root]"]
+    writer = ClipWriter.in_memory()
+    writer.write_header(1.0)
+    writer.write_bone("bone", times, translations, quaternions, scales, key_count=12)
+    assert ClipReader(writer.getvalue()).track("bone").key_count == 12
+
+
+def test_text_dump_matches_dump_writer(tmp_path):
+    bones = _bones()
+    path = tmp_path / ("walk" + CLIP_EXTENSION)
+    _write(ClipWriter(path), bones)
+    from_clip = io.StringIO()
+    export_text_dump(str(path), from_clip)
+    #the clip stores float32, so does the dump written straight from the keys
+    direct = io.StringIO()
+    with AnimationDumpWriter(direct) as dump:
+        dump.write_header(1.5)
+        for name, (times, translations, quaternions, scales) in bones.items():
+            dump.write_bone(name, times.astype(np.float32), translations.astype(np.float32), quaternions.astype(np.float32), scales)
+    assert from_clip.getvalue() == direct.getvalue()
+
+
+def test_allocate_and_fill_in_place(tmp_path):
+    path = str(tmp_path / ("stream" + CLIP_EXTENSION))
+    allocate_clip(path, ["a", "b"], 4, 2.0)
+    with ClipReader(path, writable=True) as clip:
+        track = clip.track("b")
+        track.translations[:] = 7.0
+        track.times[:] = np.arange(4)
+        del track
+    with ClipReader(path) as clip:
+        assert clip.duration == 2.0
+        assert np.array_equal(clip.track("b").translations, np.full((4, 3), 7.0, dtype="<f4"))
+        assert np.array_equal(clip.track("b").times, np.arange(4, dtype="<f4"))
+        assert not clip.track("a").translations.any()
+
+
+def test_invalid_clips():
+    with pytest.raises(ValueError):
+        ClipReader(b"AHKX")
+    with pytest.raises(ValueError):
+        ClipReader(bytes(64))
+    data = _write(ClipWriter.in_memory(), _bones()).getvalue()
+    with pytest.raises(ValueError):
+        ClipReader(data[:100])
@@ -0,0 +1,216 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import tempfile
+
+import numpy as np
+import pytest
+
+from io_scene_armaToHKX.core.armaToHKXpackfile import (PackedArray, StreamedArray, write_packfile, packfile_chunks, save_packfile, skeleton_root,
+    character_root, project_root, animation_root, spline_animation_root, MAGIC, POINTER_SIZES)
+from io_scene_armaToHKX.core.armaToHKXreader import (PackfileReader, read_skeletons, read_animations, spline_animation,
+    verify_skeleton, verify_animation)
+from io_scene_armaToHKX.core.armaToHKXspline import SplineSettings, compress_tracks, decode_spline_animation, encode_spline_blocks
+
+SKYRIM_VERSIONS = ("LE", "SSE")
+
+BONES = [("NPC Root [Root]", -1), ("NPC COM [COM ]", 0), ("NPC Pelvis [Pelv]", 1), ("NPC Spine [Spn0]", 1)]
+REFERENCE_POSE = [
+    ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0), (1.0, 1.0, 1.0)),
+    ((0.0, 0.0, 68.91), (-0.5, -0.5, -0.5, 0.5), (1.0, 1.0, 1.0)),
+    ((0.0, 0.0, 0.0), (0.0, 0.707107, 0.0, 0.707107), (1.0, 1.0, 1.0)),
+    ((8.06, -0.01, 0.0), (0.0, 0.0, 0.069756, 0.997564), (1.0, 1.0, 1.0)),
+]
+
+
+def _save(tmp_path, name, root, skyrim_version):
+    path = str(tmp_path / name)
+    save_packfile(path, root, skyrim_version)
+    return path
+
+
+def _packed_transforms(n_frames, n_tracks, seed=0):
+    #12 floats per hkQsTransform, random values are enough to check the bytes come back
+    return np.random.default_rng(seed).normal(size=(n_frames, n_tracks, 12)).astype("<f4")
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_skeleton_round_trip(tmp_path, skyrim_version):
+    root = skeleton_root("NPC Root [Root]", [name for name, _ in BONES], [parent for _, parent in BONES], REFERENCE_POSE)
+    path = _save(tmp_path, "skeleton.hkx", root, skyrim_version)
+    with open(path, "rb") as f:
+        assert f.read() == write_packfile(root, skyrim_version)
+    with PackfileReader(path) as reader:
+        assert reader.pointer_size == POINTER_SIZES[skyrim_version]
+        skeletons = read_skeletons(reader)
+    assert len(skeletons) == 1
+    assert skeletons[0].name == "NPC Root [Root]"
+    assert skeletons[0].bone_names == [name for name, _ in BONES]
+    assert list(skeletons[0].parent_indices) == [parent for _, parent in BONES]
+    assert verify_skeleton(path, "NPC Root [Root]", BONES, REFERENCE_POSE) == []
+
+
+def test_verify_skeleton_finds_differences(tmp_path):
+    root = skeleton_root("NPC Root [Root]", [name for name, _ in BONES], [parent for _, parent in BONES], REFERENCE_POSE)
+    path = _save(tmp_path, "skeleton.hkx", root, "SSE")
+    moved = list(REFERENCE_POSE)
+    moved[3] = ((8.06, -0.01, 1.0), moved[3][1], moved[3][2])
+    assert verify_skeleton(path, "NPC Root [Root]", BONES, moved) == ["reference pose of NPC Spine [Spn0] differs by 1.000000"]
+    assert len(verify_skeleton(path, "NPC Root [Root]", BONES[:3], REFERENCE_POSE[:3])) == 1
+    #q and -q are the same rotation
+    negated = list(REFERENCE_POSE)
+    negated[1] = (negated[1][0], tuple(-x for x in negated[1][1]), negated[1][2])
+    assert verify_skeleton(path, "NPC Root [Root]", BONES, negated) == []
+
+    empty = tmp_path / "empty.hkx"
+    empty.write_bytes(b"")
+    assert verify_skeleton(str(empty), "NPC Root [Root]", BONES, REFERENCE_POSE)[0].startswith("can not be read")
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_character_and_project_round_trip(tmp_path, skyrim_version):
+    path = _save(tmp_path, "character.hkx", character_root("defaultmale", "skeleton.hkx", "behavior.hkx"), skyrim_version)
+    with PackfileReader(path) as reader:
+        string_data = reader.objects("hkbCharacterStringData")[0]
+        assert string_data["rigName"] == "CharacterAssets\\skeleton.hkx"
+        assert string_data["behaviorFilename"] == "Behaviors\\behavior.hkx"
+
+    path = _save(tmp_path, "project.hkx", project_root("defaultmale.hkx"), skyrim_version)
+    with PackfileReader(path) as reader:
+        assert reader.objects("hkbProjectStringData")[0]["characterFilenames"] == ["Characters\\defaultmale.hkx"]
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_interleaved_animation_round_trip(tmp_path, skyrim_version):
+    names = [name for name, _ in BONES]
+    packed = _packed_transforms(30, len(names))
+    root = animation_root("NPC Root [Root]", names, 29.0 / 30.0, PackedArray(packed.shape[0] * packed.shape[1], packed.tobytes()), [(0.5, "SoundPlay.NPCHumanFootstep")])
+    path = _save(tmp_path, "animation.hkx", root, skyrim_version)
+    assert verify_animation(path, num_tracks=len(names), duration=29.0 / 30.0, num_bones=len(names)) == []
+    with PackfileReader(path) as reader:
+        info = read_animations(reader)[0]
+        count, transforms = info.animation.array_buffer("transforms")
+        assert count == packed.shape[0] * packed.shape[1]
+        assert bytes(transforms) == packed.tobytes()
+        annotations = info.animation["annotationTracks"][0]["annotations"]
+        assert [(annotation["time"], annotation["text"]) for annotation in annotations] == [(0.5, "SoundPlay.NPCHumanFootstep")]
+    assert info.num_frames == 30
+    assert info.skeleton_name == "NPC Root [Root]"
+    assert list(info.track_to_bone) == list(range(len(names)))
+    assert verify_animation(path, num_tracks=3) == ["4 transform tracks, expected 3"]
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_spline_animation_round_trip(tmp_path, skyrim_version):
+    names = [name for name, _ in BONES]
+    rng = np.random.default_rng(1)
+    translations = np.cumsum(rng.normal(scale=0.1, size=(40, len(names), 3)), axis=0)
+    quaternions = np.tile((1.0, 0.0, 0.0, 0.0), (40, len(names), 1))
+    spline, report = compress_tracks(translations, quaternions, np.ones((40, len(names))), 1.0 / 30.0, SplineSettings(max_frames_per_block=16))
+    path = _save(tmp_path, "spline.hkx", spline_animation_root("NPC Root [Root]", names, spline), skyrim_version)
+    assert verify_animation(path, num_tracks=len(names), duration=spline.duration) == []
+    with PackfileReader(path) as reader:
+        info = read_animations(reader)[0]
+        assert info.class_name == "hkaSplineCompressedAnimation"
+        read = spline_animation(info)
+    assert read.data == spline.data
+    assert list(read.block_offsets) == spline.block_offsets
+    decoded = decode_spline_animation(read)
+    assert all(np.array_equal(a, b) for a, b in zip(decoded, decode_spline_animation(spline)))
+
+
+def test_header():
+    data = write_packfile(project_root("defaultmale.hkx"), "SSE")
+    assert np.frombuffer(data[:8], dtype="<u4").tolist() == list(MAGIC)
+    assert b"hk_2010.2.0-r1" in data[:64]
+
+
+def _streamed(packed, frames_per_chunk=7):
+    def chunks():
+        for first in range(0, len(packed), frames_per_chunk):
+            yield packed[first:first + frames_per_chunk].tobytes()
+    return StreamedArray(packed.shape[0] * packed.shape[1], packed.nbytes, chunks)
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_streamed_transforms(tmp_path, skyrim_version):
+    names = [name for name, _ in BONES]
+    packed = _packed_transforms(30, len(names))
+    root = animation_root("NPC Root [Root]", names, 1.0, _streamed(packed), [(0.5, "hit")])
+    path = _save(tmp_path, "streamed.hkx", root, skyrim_version)
+    #chunks() runs again for every file written
+    assert b"".join(packfile_chunks(root, skyrim_version)) == write_packfile(root, skyrim_version)
+    with open(path, "rb") as f:
+        assert f.read() == write_packfile(root, skyrim_version)
+    assert verify_animation(path, num_tracks=len(names), duration=1.0) == []
+    with PackfileReader(path) as reader:
+        info = read_animations(reader)[0]
+        assert bytes(info.animation.array_buffer("transforms")[1]) == packed.tobytes()
+        assert info.animation["annotationTracks"][0]["annotations"][0]["text"] == "hit"
+
+
+def test_streamed_array_size_is_checked():
+    names = [name for name, _ in BONES]
+    packed = _packed_transforms(30, len(names))
+    streamed = _streamed(packed)
+    streamed.size += 48
+    with pytest.raises(ValueError):
+        write_packfile(animation_root("NPC Root [Root]", names, 1.0, streamed), "SSE")
+
+
+@pytest.mark.parametrize("skyrim_version", SKYRIM_VERSIONS)
+def test_streamed_spline_blocks(tmp_path, skyrim_version):
+    names = [name for name, _ in BONES]
+    rng = np.random.default_rng(2)
+    translations = np.cumsum(rng.normal(scale=0.1, size=(50, len(names), 3)), axis=0)
+    quaternions = np.tile((1.0, 0.0, 0.0, 0.0), (50, len(names), 1))
+    scales = np.ones((50, len(names)))
+    settings = SplineSettings(max_frames_per_block=16)
+    spline, report = compress_tracks(translations, quaternions, scales, 1.0 / 30.0, settings)
+    with tempfile.TemporaryFile() as spool:
+        streamed, streamed_report = encode_spline_blocks(lambda first, last: (translations[first:last + 1], quaternions[first:last + 1], scales[first:last + 1]),
+            50, len(names), 1.0 / 30.0, spool, settings)
+        assert streamed_report.size == report.size
+        def chunks():
+            spool.seek(0)
+            yield spool.read()
+        streamed.data = StreamedArray(streamed_report.size, streamed_report.size, chunks)
+        path = _save(tmp_path, "spline.hkx", spline_animation_root("NPC Root [Root]", names, streamed), skyrim_version)
+    with PackfileReader(path) as reader:
+        read = spline_animation(read_animations(reader)[0])
+    assert read.data == spline.data
+    assert list(read.block_offsets) == spline.block_offsets
@@ -0,0 +1,130 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import json
+
+from io_scene_armaToHKX.core.armaToHKXqueue import ExportQueue, QUEUE_FILE, UNITS, PENDING, DONE, FAILED
+
+SETTINGS = {"bake": True, "reduce_keys": False, "skyrim_version": "SSE"}
+
+
+def _output(tmp_path, name, content=b"hkx"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_units_persist(tmp_path):
+    workdir = str(tmp_path)
+    queue = ExportQueue(workdir, "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    queue.start("walk", "kf")
+    queue.finish("walk", "kf", _output(tmp_path, "walk.kf"))
+    queue.start("walk", "LE hkx")
+    queue.finish("walk", "LE hkx", error="hkxcmd failed")
+
+    #a new queue on the same workdir, like the next run of the batch
+    queue = ExportQueue(workdir, "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    assert queue.is_done("walk", "kf")
+    assert not queue.is_done("walk", "LE hkx")
+    units = queue.batch["clips"]["walk"]["units"]
+    assert set(units) == set(UNITS)
+    assert units["LE hkx"]["state"] == FAILED and units["LE hkx"]["error"] == "hkxcmd failed"
+    assert units["SSE hkx"]["state"] == PENDING
+    with open(str(tmp_path / QUEUE_FILE)) as f:
+        assert json.load(f)["batches"]["out"]["clips"]["walk"]["units"]["kf"]["state"] == DONE
+
+
+def test_unit_without_output(tmp_path):
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    queue.finish("walk", "bake")
+    assert queue.is_done("walk", "bake")
+
+
+def test_changed_fingerprint_starts_clip_over(tmp_path):
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    queue.clip("run", "fingerprint")
+    queue.finish("walk", "kf", _output(tmp_path, "walk.kf"))
+    queue.finish("run", "kf", _output(tmp_path, "run.kf"))
+
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "changed keys")
+    queue.clip("run", "fingerprint")
+    assert not queue.is_done("walk", "kf")
+    assert queue.is_done("run", "kf")
+
+
+def test_changed_settings_start_batch_over(tmp_path):
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    queue.finish("walk", "kf", _output(tmp_path, "walk.kf"))
+    other = ExportQueue(str(tmp_path), "other folder", SETTINGS)
+    other.clip("walk", "fingerprint")
+    other.finish("walk", "kf", _output(tmp_path, "other.kf"))
+
+    queue = ExportQueue(str(tmp_path), "out", dict(SETTINGS, reduce_keys=True))
+    assert queue.batch["clips"] == {}
+    #batches of other output folders are kept
+    other = ExportQueue(str(tmp_path), "other folder", SETTINGS)
+    other.clip("walk", "fingerprint")
+    assert other.is_done("walk", "kf")
+
+
+def test_changed_output_is_not_done(tmp_path):
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    output = _output(tmp_path, "walk.hkx")
+    queue.finish("walk", "SSE hkx", output)
+    assert queue.is_done("walk", "SSE hkx")
+    _output(tmp_path, "walk.hkx", b"overwritten")
+    assert not queue.is_done("walk", "SSE hkx")
+    (tmp_path / "walk.hkx").unlink()
+    assert not queue.is_done("walk", "SSE hkx")
+
+
+def test_reset_and_unreadable_file(tmp_path):
+    queue = ExportQueue(str(tmp_path), "out", SETTINGS)
+    queue.clip("walk", "fingerprint")
+    queue.finish("walk", "bake")
+    queue.reset()
+    assert ExportQueue(str(tmp_path), "out", SETTINGS).batch["clips"] == {}
+
+    (tmp_path / QUEUE_FILE).write_text("{not json")
+    assert ExportQueue(str(tmp_path), "out", SETTINGS).data == {"batches": {"out": {"settings": SETTINGS, "clips": {}}}}
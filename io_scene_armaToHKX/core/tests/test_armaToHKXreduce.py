@@ -0,0 +1,113 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+from io_scene_armaToHKX.core.armaToHKXreduce import KeyReduction, continuous_quaternions
+
+
+def _rotations_about_z(angles):
+    #w x y z
+    return np.stack((np.cos(angles / 2.0), np.zeros_like(angles), np.zeros_like(angles), np.sin(angles / 2.0)), axis=1)
+
+
+def test_linear_keys_reduce_to_the_ends():
+    times = np.arange(20) / 30.0
+    translations = np.outer(times, (1.0, 2.0, -0.5))
+    quaternions = _rotations_about_z(times)
+    keep = KeyReduction().key_mask(times, translations, quaternions, None, np.ones(20))
+    assert keep.tolist() == [True] + [False] * 18 + [True]
+
+
+def test_keys_off_the_line_are_kept():
+    times = np.arange(21) / 30.0
+    translations = np.zeros((21, 3))
+    translations[10, 2] = 1.0
+    keep = KeyReduction().key_mask(times, translations)
+    assert keep.nonzero()[0].tolist() == [0, 9, 10, 11, 20]
+
+
+def test_tolerances():
+    times = np.arange(3, dtype=np.float64)
+    bump = np.array(((0.0, 0.0, 0.0), (0.0, 0.0, 0.05), (0.0, 0.0, 0.0)))
+    assert KeyReduction(translation_tolerance=0.1).key_mask(times, bump).tolist() == [True, False, True]
+    assert KeyReduction(translation_tolerance=0.01).key_mask(times, bump).tolist() == [True, True, True]
+    #0.1 radian off the slerp, against a rotation tolerance below and above it
+    quaternions = _rotations_about_z(np.array((0.0, 0.6, 1.0)))
+    assert KeyReduction(rotation_tolerance=0.05).key_mask(times, quaternions=quaternions)[1]
+    assert not KeyReduction(rotation_tolerance=0.2).key_mask(times, quaternions=quaternions)[1]
+
+
+def test_eulers_and_scales():
+    times = np.arange(5, dtype=np.float64)
+    eulers = np.zeros((5, 3))
+    eulers[2, 0] = 0.01
+    assert KeyReduction().key_mask(times, eulers=eulers)[2]
+    scales = np.array((1.0, 1.0, 1.2, 1.0, 1.0))
+    assert KeyReduction().key_mask(times, scales=scales).nonzero()[0].tolist() == [0, 1, 2, 3, 4]
+    assert KeyReduction(scale_tolerance=0.5).key_mask(times, scales=scales).nonzero()[0].tolist() == [0, 4]
+
+
+def test_continuous_quaternions():
+    quaternions = _rotations_about_z(np.linspace(0.0, 1.0, 4))
+    flipped = quaternions.copy()
+    flipped[1:3] *= -1.0
+    assert np.allclose(continuous_quaternions(flipped), quaternions)
+    #a flipped key is still the same rotation, reduce_arrays keeps only the ends
+    times = np.arange(4, dtype=np.float64)
+    reduced = KeyReduction().reduce_arrays(times, np.zeros((4, 3)), flipped, np.ones(4))
+    assert reduced[0].tolist() == [0.0, 3.0]
+    assert np.allclose(reduced[2], quaternions[[0, 3]])
+
+
+def test_summary_totals():
+    reduction = KeyReduction()
+    times = np.arange(10, dtype=np.float64)
+    reduction.key_mask(times, np.zeros((10, 3)))
+    reduction.key_mask(times[:2], np.zeros((2, 3)))
+    assert (reduction.keys_before, reduction.keys_after) == (12, 4)
+    assert reduction.summary() == "Key reduction: 12 -> 4 bone keys (67% removed)"
+
+
+def test_bone_without_keys():
+    #bones keyed only with euler rotation or scale reach reduce_arrays with empty arrays
+    reduction = KeyReduction()
+    times, translations, quaternions, scales = reduction.reduce_arrays(np.zeros(0), np.zeros((0, 3)), np.zeros((0, 4)), np.zeros(0))
+    assert (times.shape, translations.shape, quaternions.shape, scales.shape) == ((0,), (0, 3), (0, 4), (0,))
+    assert reduction.key_mask(np.zeros(0)).shape == (0,)
+    assert (reduction.keys_before, reduction.keys_after) == (0, 0)
+    assert reduction.summary() == "Key reduction: 0 -> 0 bone keys (0% removed)"
@@ -0,0 +1,146 @@
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2019, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+import pytest
+
+from io_scene_armaToHKX.core.armaToHKXspline import (SplineSettings, SplineAnimation, block_ranges, basis_matrix,
+    encode_threecomp48, decode_threecomp48, encode_spline_animation, decode_spline_animation, compress_tracks,
+    THREECOMP48_FRACTAL)
+
+
+def _unit_quaternions(rng, n):
+    quats = rng.normal(size=(n, 4))
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def _tracks(n_frames=100, n_tracks=4, seed=0):
+    #smooth translations and rotations, w x y z like export_transforms, and uniform scales
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 1.0, n_frames)[:, np.newaxis, np.newaxis]
+    translations = np.sin(t * rng.uniform(1.0, 4.0, size=(1, n_tracks, 3))) * 10.0
+    angles = t[:, :, 0] * rng.uniform(0.5, 3.0, size=(1, n_tracks))
+    axes = _unit_quaternions(rng, n_tracks)[:, 1:]
+    axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+    quaternions = np.concatenate((np.cos(angles / 2.0)[:, :, np.newaxis], np.sin(angles / 2.0)[:, :, np.newaxis] * axes), axis=2)
+    scales = np.ones((n_frames, n_tracks))
+    return translations, quaternions, scales
+
+
+def test_threecomp48_round_trip():
+    quats = _unit_quaternions(np.random.default_rng(0), 1000)
+    #every component dropped once, with both signs
+    quats[:8] = [(1, 0, 0, 0), (0, -1, 0, 0), (0, 0, 1, 0), (0, 0, 0, -1), (0.5, 0.5, 0.5, 0.5), (-0.5, 0.5, -0.5, 0.5), (0, 0.6, 0, -0.8), (0.8, 0, -0.6, 0)]
+    values = encode_threecomp48(quats)
+    assert values.dtype == np.uint16 and values.shape == (1000, 3)
+    decoded = decode_threecomp48(values)
+    #the dropped component is rebuilt with its sign, so the decoded quaternion is the same, not just the same rotation
+    assert np.abs(decoded - quats).max() < 2.0 * THREECOMP48_FRACTAL
+    assert np.allclose(np.linalg.norm(decoded, axis=1), 1.0, atol=1e-4)
+
+
+def test_block_ranges():
+    assert block_ranges(10, 256) == [(0, 9)]
+    #the last frame of a block is the first of the next
+    assert block_ranges(10, 4) == [(0, 3), (3, 6), (6, 9)]
+    assert block_ranges(11, 4) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert block_ranges(1, 4) == [(0, 0)]
+
+
+def test_basis_matrix_partition_of_unity():
+    knots = (0, 0, 0, 0, 3, 6, 6, 6, 6)
+    basis = basis_matrix(knots, 3, np.arange(7))
+    assert basis.shape == (7, 5)
+    assert np.allclose(basis.sum(axis=1), 1.0)
+    #clamped: the ends are the first and last control points
+    assert basis[0, 0] == 1.0 and basis[-1, -1] == 1.0
+
+
+@pytest.mark.parametrize("settings", [
+    SplineSettings(),
+    SplineSettings(max_frames_per_block=32, degree=2),
+    SplineSettings(position_bits=8, scale_bits=8, translation_tolerance=0.1, rotation_quantization="UNCOMPRESSED"),
+])
+def test_encode_decode_within_tolerance(settings):
+    translations, quaternions, scales = _tracks()
+    animation, report = compress_tracks(translations, quaternions, scales, 1.0 / 30.0, settings)
+    assert animation.num_blocks == len(block_ranges(100, settings.max_frames_per_block))
+    assert len(animation.data) == report.size and report.size % 16 == 0
+    assert report.size < report.uncompressed_size
+    assert report.translation_error <= settings.translation_tolerance
+    assert report.rotation_error <= settings.rotation_tolerance
+    assert report.scale_error <= settings.scale_tolerance
+
+    decoded_translations, decoded_quats, decoded_scales = decode_spline_animation(animation)
+    assert decoded_translations.shape == (100, 4, 3) and decoded_quats.shape == (100, 4, 4) and decoded_scales.shape == (100, 4, 3)
+    assert np.abs(decoded_translations - translations).max() <= settings.translation_tolerance * 1.01
+    #decoded quaternions are x y z w
+    dots = np.abs(np.einsum("ftk,ftk->ft", decoded_quats[:, :, [3, 0, 1, 2]], quaternions))
+    assert (2.0 * np.arccos(np.clip(dots, 0.0, 1.0))).max() <= settings.rotation_tolerance * 1.01
+
+
+def test_static_tracks():
+    #constant and identity tracks take only a few bytes and decode exactly
+    translations = np.zeros((50, 2, 3))
+    translations[:, 1] = (1.0, 2.0, 3.0)
+    quaternions = np.tile((1.0, 0.0, 0.0, 0.0), (50, 2, 1))
+    animation = encode_spline_animation(translations, quaternions, np.ones((50, 2)), 1.0 / 30.0)
+    assert len(animation.data) <= 64
+    decoded_translations, decoded_quats, decoded_scales = decode_spline_animation(animation)
+    assert np.allclose(decoded_translations, translations)
+    assert np.allclose(decoded_quats, (0.0, 0.0, 0.0, 1.0))
+    assert np.allclose(decoded_scales, 1.0)
+
+
+def test_hemisphere_flips_do_not_break_the_spline():
+    translations, quaternions, scales = _tracks(n_frames=60, n_tracks=2, seed=3)
+    flipped = quaternions.copy()
+    flipped[::3] *= -1.0
+    settings = SplineSettings()
+    animation, report = compress_tracks(translations, flipped, scales, 1.0 / 30.0, settings)
+    assert report.rotation_error <= settings.rotation_tolerance
+    assert len(animation.data) == len(compress_tracks(translations, quaternions, scales, 1.0 / 30.0, settings)[0].data)
+
+
+def test_spline_animation_members():
+    animation = SplineAnimation(3, 100, 0.5, 32, [0, 64, 128, 192], [40, 40, 40, 40], b"")
+    assert animation.num_blocks == 4
+    assert animation.mask_size == 12
+    assert animation.block_duration == 15.5
+    assert animation.duration == 49.5
+    with pytest.raises(ValueError):
+        SplineSettings(max_frames_per_block=257)